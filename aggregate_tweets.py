@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:05:12 2026
+
+INFO
+####
+
+This script counts collected tweets per spatial cell and time bin, like
+tweets per 1 km grid cell per day or per geohash cell per hour. It reads the
+pickled or feather dataframes of a collection directory one file at a time, so only the
+counts are held in memory, and writes a compact aggregate table with one row
+per cell and time bin.
+
+Tweets are located by their gps coordinates, or the centroid of their place
+if there are no gps coordinates. Cells can be squares or hexagons in any
+coordinate reference system, or geohash cells.
+
+REQUIREMENTS
+############
+
+Files:
+    pickled or feather tweet dataframes from any of the collector scripts
+
+Installed:
+    Python 3.8 or newer
+
+    Python packages:
+        pandas
+        geopandas
+
+USAGE
+#####
+
+Run the script by typing:
+
+    python aggregate_tweets.py -i path/to/results/ -o counts.pkl -g square -cs 1000 -c EPSG:3067 -tb day
+
+Add -u to update an existing aggregate table with files collected or changed
+after the previous run. Aggregated files are listed in a json file next to the
+table, and the counts of each file are kept in a folder next to the table,
+like counts_partials for counts.pkl, so the previous counts of a changed file
+are subtracted before its new counts are added.
+
+NOTE
+####
+
+Time bins are in UTC and weeks start on Monday.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+from util_functions import tweet_files, read_tweets, aggregate_tweets, finish_aggregate, file_key, key_table, key_tables, migrate_key, GRID_TYPES, TIME_BINS, AGGREGATE_KEYS, AGGREGATE_COUNTS
+from pyproj import Transformer
+import pandas as pd
+import argparse
+import json
+import os
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# get input directory
+ap.add_argument("-i", "--input", required=False, default='.',
+                help="Directory of the pickled or feather tweet dataframes. Default: current directory")
+
+# get output file
+ap.add_argument("-o", "--output", required=True,
+                help="Name of the aggregate table file, .pkl or .csv. For example: "
+                " counts.pkl ")
+
+# get grid type
+ap.add_argument("-g", "--grid", required=False, default='square', choices=GRID_TYPES,
+                help="Type of the grid cells. Default: square")
+
+# get cell size
+ap.add_argument("-cs", "--cellsize", required=False, default=0.01, type=float,
+                help="Width of square cells or circumradius of hexagons in units of the "
+                "coordinate reference system, or number of characters of geohash cells. "
+                "Default: 0.01")
+
+# get coordinate reference system of the grid
+ap.add_argument("-c", "--crs", required=False, default='EPSG:4326',
+                help="Coordinate reference system of square and hexagon grids, for "
+                "example: EPSG:3067. Default: EPSG:4326")
+
+# get time bin
+ap.add_argument("-tb", "--timebin", required=False, default='day', choices=TIME_BINS,
+                help="Length of the time bins. Default: day")
+
+# get update mode
+ap.add_argument("-u", "--update", required=False, action='store_true',
+                help="Add files not aggregated yet to an existing aggregate table, "
+                "replacing the counts of changed files, instead of aggregating all files again")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# geohash cells are always in wgs-84 and have whole characters
+if args['grid'] == 'geohash':
+    args['crs'] = 'EPSG:4326'
+    args['cellsize'] = int(args['cellsize'])
+params = {key: args[key] for key in ['grid', 'cellsize', 'crs', 'timebin']}
+
+# get transformer from wgs-84 to the grid crs
+transformer = None
+if args['crs'].upper() not in ('EPSG:4326', '4326'):
+    transformer = Transformer.from_crs('EPSG:4326', args['crs'], always_xy=True)
+
+# read list of already aggregated files, counts of each file are kept in a folder next to the table
+statefile = os.path.splitext(args['output'])[0] + '_files.json'
+outdir = os.path.dirname(os.path.abspath(args['output']))
+partdir = os.path.splitext(os.path.basename(args['output']))[0] + '_partials'
+os.makedirs(os.path.join(outdir, partdir), exist_ok=True)
+partials = []
+done = {}
+update = False
+if args['update'] and os.path.exists(args['output']) and os.path.exists(statefile):
+    with open(statefile, 'r') as f:
+        state = json.load(f)
+
+    # updating with different cells or time bins would mix them up
+    if state['params'] != params:
+        raise SystemExit('[ERROR] - Aggregate table ' + args['output'] + ' was made with ' + str(state['params'])
+                         + ', run without -u to aggregate again')
+    done = state['files']
+    update = True
+
+    # read existing counts
+    if args['output'].endswith('.csv'):
+        partials.append(pd.read_csv(args['output'], sep=';', parse_dates=['time_bin']))
+    else:
+        partials.append(pd.read_pickle(args['output']))
+
+# counts of files of a previous run are replaced when aggregating all files again
+if not update:
+    for partial in key_tables(outdir, partdir):
+        os.remove(partial)
+
+# loop over files not aggregated yet or changed
+print('[INFO] - Aggregating tweets...')
+added = 0
+changed = 0
+counts = {}
+for file in tweet_files(args['input']):
+
+    # skip the aggregate table itself
+    if os.path.abspath(file) == os.path.abspath(args['output']):
+        continue
+
+    # check if file is already aggregated and unchanged, files are listed by path relative to the table
+    name = file_key(file, outdir)
+    migrate_key(done, name, outdir, partdir)
+    stat = os.stat(file)
+    partial = key_table(outdir, partdir, name)
+    if name in done:
+        if done[name] == [stat.st_size, stat.st_mtime_ns]:
+            continue
+        
+        # subtract previous counts of a changed file, tables of older versions have no counts per file
+        if not os.path.exists(partial):
+            print('[WARNING] - ' + name + ' has changed since it was aggregated, run without -u to include the changes')
+            continue
+        old = pd.read_pickle(partial)
+        partials.append(old.assign(**{col: -old[col] for col in AGGREGATE_COUNTS}))
+        changed += 1
+
+    # count tweets of the file
+    data = read_tweets(file, ['id', 'created_at', 'geo.coordinates.x', 'geo.coordinates.y', 'geo.centroid.x', 'geo.centroid.y'])
+    if not isinstance(data, pd.DataFrame) or 'id' not in data.columns:
+        print('[WARNING] - Skipping ' + name + ', it is not a tweet dataframe')
+        continue
+    if len(data) > 0:
+        counts[partial] = aggregate_tweets(data, args['grid'], args['cellsize'], args['timebin'], transformer)
+    else:
+        counts[partial] = pd.DataFrame(columns=AGGREGATE_KEYS + AGGREGATE_COUNTS)
+    partials.append(counts[partial])
+    done[name] = [stat.st_size, stat.st_mtime_ns]
+    added += 1
+    del data
+
+# sum counts of all files
+agg = finish_aggregate(partials, args['grid'], args['cellsize'])
+print('[INFO] - Aggregated ' + str(added - changed) + ' new and ' + str(changed) + ' changed files to ' + str(len(agg)) + ' cells and time bins, '
+      + str(int(agg['tweets'].sum())) + ' tweets in total')
+
+# save aggregate table, then counts per file and list of aggregated files
+print('[INFO] - Saving aggregate table...')
+if args['output'].endswith('.csv'):
+    agg.to_csv(args['output'], sep=';', encoding='utf-8', index=False)
+else:
+    agg.to_pickle(args['output'])
+for partial, table in counts.items():
+    table.to_pickle(partial)
+with open(statefile, 'w') as f:
+    json.dump({'params': params, 'files': done}, f, indent=1)
+
+print('[INFO] - ... done!')
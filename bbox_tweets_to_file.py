@@ -67,6 +67,11 @@ The CRS is basic WGS-84 in decimal degrees.
 
 This script assumes you have created the bounding box with MMQGIS plugin in QGIS.
 
+With a history file (-hs) the tweets per bounding box and time window are
+recorded, and later runs split dense boxes into shorter windows and skip boxes
+which have been empty for a long time, collecting them again every -pe days.
+The output files stay the same.
+
 
 ### SYDNEY SPECIFIC ###
 No geotagged tweets before 01.09.2010
@@ -77,13 +82,36 @@ Collection ends February 1st 2023
 @author: Tuomas Väisänen & Seija Sirkiä
 """
 
-from util_functions import v2parser, daterange
-from searchtweets import ResultStream, gen_request_parameters, load_credentials, read_config
 from datetime import datetime
-import geopandas as gpd
 import time
 import argparse
+import glob
 import gc
+import os
+
+# define function to parse raw tweets and order columns semantically
+def parse_tweets(tweets, results_per_call, fields, study_area=None, mode='keep'):
+    
+    # parse results to dataframe
+    tweetdf = v2parser(tweets, results_per_call, fields)
+    
+    # try to order columns semantically
+    tweetdf = order_columns(tweetdf, BBOX_COLUMNS)
+    
+    # keep or tag tweets within study area
+    if study_area is not None:
+        tweetdf = filter_study_area(tweetdf, study_area, mode)
+    
+    return tweetdf
+
+# define function to count tweets in collected messages
+def count_tweets(tweets):
+    return sum([d['result_count'] for d in tweets if 'result_count' in d.keys()])
+
+# define function to save a dataframe so a crash never leaves half a file
+def save_pickle(tweetdf, path):
+    tweetdf.to_pickle(path + '.tmp', compression=None)
+    os.replace(path + '.tmp', path)
 
 # Set up the argument parser
 ap = argparse.ArgumentParser()
@@ -102,8 +130,8 @@ ap.add_argument("-ed", "--enddate", required=True,
 
 # get wait time
 ap.add_argument("-w", "--wait", required=False, default=15,
-                help="Set wait time between requests to avoid Twitter rate limits. "
-                "Default: 15")
+                help="Set wait time after connection errors. Requests are spaced "
+                "by the rate limiter. Default: 15")
 
 # get interval
 ap.add_argument("-in", "--interval", required=True, default=1,
@@ -120,44 +148,105 @@ ap.add_argument("-o", "--output", required=True,
                 help="Path to output folder. For example: "
                 "~/Data/project/results/")
 
+# get memory budget
+ap.add_argument("-mb", "--membudget", required=False, default=None,
+                help="Memory budget in megabytes for raw tweets held per interval. "
+                "When exceeded, collected tweets are parsed and saved as a numbered "
+                "part of the interval, like _part0_1.pkl. "
+                "Default: no budget, everything is held in memory")
+
+# get study area polygons
+ap.add_argument("-sa", "--studyarea", required=False, default=None,
+                help="Path to a GIS file of study area polygons, for example a city "
+                "boundary. Tweets whose coordinates, or place centroid if there are "
+                "no coordinates, are outside the polygons are dropped before saving. "
+                "Default: no study area")
+
+# get study area mode
+ap.add_argument("-sm", "--studymode", required=False, default='keep',
+                choices=['keep', 'tag'],
+                help="What to do with the study area: keep only tweets within it, or "
+                "tag all tweets with an in_study_area column. Default: keep")
+
+# get cell history file
+ap.add_argument("-hs", "--history", required=False, default=None,
+                help="Path to a file of tweets per bounding box and time window of "
+                "previous runs, updated by this run. With it, dense bounding boxes are "
+                "split into shorter windows, dense and sparse boxes take turns and "
+                "boxes without tweets in their history are skipped. For example: "
+                "~/Data/project/cell_history.pkl. Default: no history")
+
+# get target tweets per window
+ap.add_argument("-tw", "--targettweets", required=False, default=100000, type=int,
+                help="Number of tweets a bounding box is expected to have per time "
+                "window when splitting it by its history. Default: 100000")
+
+# get days of history to skip empty cells
+ap.add_argument("-se", "--skipempty", required=False, default=365, type=float,
+                help="Skip bounding boxes without tweets in at least this many days "
+                "of history, 0 collects all boxes. Default: 365")
+
+# get days between collecting skipped boxes again
+ap.add_argument("-pe", "--probeempty", required=False, default=90, type=float,
+                help="Collect skipped bounding boxes again in one window if they were "
+                "last collected this many days ago, 0 never does. Default: 90")
+
 # Parse arguments
 args = vars(ap.parse_args())
 
+# check arguments before importing heavy libraries, so errors return at once
+if args['enddate'] <= args['startdate']:
+    ap.error('end date has to be after the start date')
+if int(args['interval']) < 1:
+    ap.error('interval has to be at least 1')
+for path in [args['bbox'], args['studyarea']]:
+    if path is not None and not os.path.exists(path):
+        ap.error('file not found: ' + path)
+
 # get waittime and interval
 waittime = int(args['wait'])
 interval = int(args['interval'])
 
+# get memory budget in bytes
+if args['membudget'] is not None:
+    membudget = float(args['membudget']) * 1024 * 1024
+else:
+    membudget = None
+
 # get output path
 outpath = args['output']
 
+# load twitter keys and configuration for search query
+from searchtweets import gen_request_parameters, load_credentials, read_config
+twitter_creds = load_credentials('.twitter_keys.yaml',
+                               yaml_key = 'search_tweets_v2',
+                               env_overwrite = False)
+search_config = read_config('search_config.yaml')
+
+# import heavy libraries after checking arguments and config
+from util_functions import v2parser, field_profile, read_study_area, filter_study_area, deep_sizeof, order_columns, BBOX_COLUMNS, make_pooled_session, stream_tweets, session_stats, RateLimiter, cell_key, read_cell_history, update_cell_history, cell_stats, plan_cells
+import geopandas as gpd
+
 # load bounding box
 bbox_df = gpd.read_file(args['bbox'], driver='GPKG')
 
+# load study area polygons
+study_area = read_study_area(args['studyarea']) if args['studyarea'] is not None else None
+
 # get bbox order
 bbox_df = bbox_df.assign(row_number=range(len(bbox_df)))
 
-# load twitter keys
-twitter_creds = load_credentials('.twitter_keys.yaml',
-                               yaml_key = 'search_tweets_v2',
-                               env_overwrite = False)
+# get keys of the bounding boxes in the cell history and the history of previous runs
+cell_keys = [cell_key(b['left'], b['bottom'], b['right'], b['top']) for _, b in bbox_df.iterrows()]
+history = read_cell_history(args['history'])
+run_time = datetime.utcnow()
 
-# load configuration for search query
-search_config = read_config('search_config.yaml')
+# open one pooled session and rate limiter for the whole run
+session = make_pooled_session(twitter_creds['bearer_token'])
+limiter = RateLimiter()
 
-# fields for v2 api
-tweetfields = ",".join(["attachments", "author_id", "conversation_id", "created_at",
-                        "entities", "geo", "id", "in_reply_to_user_id", "lang",
-                        "public_metrics", "possibly_sensitive", "referenced_tweets",
-                        "reply_settings", "text", "withheld",])
-userfields = ",".join(["created_at", "description", "entities", "location",
-                       "name", "profile_image_url", "protected", "public_metrics",
-                       "url", "username", "verified", "withheld"])
-mediafields= ",".join(["media_key", "type", "url"])
-placefields = ",".join(["contained_within", "country", "country_code", "full_name",
-                        "geo", "id", "name",  "place_type"])
-expansions = ",".join(["attachments.media_keys", "author_id", "entities.mentions.username",
-                       "geo.place_id", "in_reply_to_user_id", "referenced_tweets.id",
-                       "referenced_tweets.id.author_id"])
+# get request fields and expansions of the field profile
+fields = field_profile(search_config)
 
 # get date interval
 start_date = args['startdate'].date()
@@ -181,11 +270,38 @@ for intv in range(interval):
     # print message about which interval is collected
     print('[INFO] - Starting tweet collection between ' + str(intstart) + ' - ' + str(intend))
     
-    # empty tweet list for current interval
+    # set up file prefix from config
+    file_prefix_w_date = search_config['filename_prefix'] + '_' + str(intstart) + '---' + str(intend)
+    outpickle = file_prefix_w_date + '_part' + str(intv) + '.pkl'
+    
+    # empty tweet list for current interval and its estimated size in bytes
     tweets_interval = []
+    interval_size = 0
+    
+    # list of numbered part files of the current interval
+    part_files = []
     
-    # loop over bounding boxes
-    for i, bbox in bbox_df.iterrows():
+    # plan bounding boxes and time windows, without history in row order over the whole interval
+    window_start = datetime.combine(intstart, datetime.min.time())
+    window_end = datetime.combine(intend, datetime.min.time())
+    if args['history'] is not None:
+        tasks = plan_cells(cell_keys, cell_stats(history), window_start, window_end,
+                           args['targettweets'], args['skipempty'], args['probeempty'], run_time)
+        print('[INFO] - Collecting ' + str(len(set(task[0] for task in tasks))) + ' bounding boxes in '
+              + str(len(tasks)) + ' windows, skipping ' + str(len(bbox_df) - len(set(task[0] for task in tasks)))
+              + ' empty bounding boxes')
+    else:
+        tasks = [(pos, window_start, window_end) for pos in range(len(bbox_df))]
+    
+    # list of collected windows for the cell history
+    history_rows = []
+    
+    # loop over bounding boxes and their time windows
+    for pos, wstart, wend in tasks:
+        
+        # get bounding box
+        i = bbox_df.index[pos]
+        bbox = bbox_df.iloc[pos]
         
         # extract southwest corner coordinate points
         west = bbox['left']
@@ -201,22 +317,11 @@ for intv in range(interval):
         # generate payload rules for v2 api
         rule = gen_request_parameters(query = search_q,
                                       results_per_call = search_config['results_per_call'],
-                                      start_time = intstart.isoformat(),
-                                      end_time = intend.isoformat(),
-                                      tweet_fields = tweetfields,
-                                      user_fields = userfields,
-                                      media_fields = mediafields,
-                                      place_fields = placefields,
-                                      expansions = expansions,
+                                      start_time = wstart.strftime('%Y-%m-%d %H:%M'),
+                                      end_time = wend.strftime('%Y-%m-%d %H:%M'),
+                                      **fields,
                                       stringify = False)
         
-        # initiate result stream from twitter v2 api
-        rs = ResultStream(request_parameters = rule,
-                          max_results=100000,
-                          max_pages=1,
-                          max_tweets = search_config['max_tweets'],
-                          **twitter_creds)
-    
         # number of reconnection tries
         tries = 10
         
@@ -227,25 +332,14 @@ for intv in range(interval):
             # attempt retrieving tweets
             try:
                 # indicate which day is getting retrieved
-                print('[INFO] - Searching for tweets between ' + str(intstart) + ' and ' + str(intend) + ' from bounding box ' + str(i))
+                print('[INFO] - Searching for tweets between ' + str(wstart) + ' and ' + str(wend) + ' from bounding box ' + str(i))
             
                 # get json response to list
-                tweets = list(rs.stream())
+                tweets = list(stream_tweets(session, twitter_creds['endpoint'], rule, search_config['max_tweets'], limiter))
                 
-                # print response
-                print('[INFO] - Got {} tweets from bounding box {}'.format(str(len(tweets)), str(i)))
+                # print response, the rate limiter spaces the requests
+                print('[INFO] - Got {} tweets from bounding box {}'.format(str(count_tweets(tweets)), str(i)))
                 
-                # check if size warrants shorter or longer wait time
-                if len(tweets) < 500:
-                    
-                    # wait 8 seconds to avoid request bombing in case of zero or a few tweets
-                    time.sleep(18)
-                    
-                else:
-                    
-                    # wait a bit longer
-                    time.sleep(waittime)
-                    
                 # break free from while loop
                 break
             
@@ -257,52 +351,85 @@ for intv in range(interval):
                     print('[INFO] - Got connection error, waiting ' + str(waittime) + ' seconds and trying again. ' + str(tries) + ' tries left.')
                     time.sleep(waittime)
         
+        # record tweets of the window and whether it hit max_tweets
+        count = count_tweets(tweets)
+        truncated = search_config.get('max_tweets') is not None and count >= int(search_config['max_tweets'])
+        history_rows.append((cell_keys[pos], wstart, wend, count, truncated, run_time))
+        if truncated and args['history'] is not None:
+            print('[INFO] - Bounding box ' + str(i) + ' hit max_tweets, it is split into shorter windows on the next run')
+        
         # extend current interval tweet list with tweets from current bounding box
         tweets_interval.extend(tweets)
         
+        # check if memory budget is exceeded
+        if membudget is not None and count != 0:
+            
+            # update estimated size of held tweets
+            interval_size += deep_sizeof(tweets)
+            
+            if interval_size > membudget:
+                
+                # parse tweets held so far
+                print('[INFO] - Memory budget exceeded, saving ' + str(count_tweets(tweets_interval)) + ' tweets as a part of the interval')
+                tweetdf = parse_tweets(tweets_interval, search_config['results_per_call'], fields,
+                                       study_area, args['studymode'])
+                
+                # save numbered part
+                partpickle = outpath + file_prefix_w_date + '_part' + str(intv) + '_' + str(len(part_files)) + '.pkl'
+                save_pickle(tweetdf, partpickle)
+                part_files.append(partpickle)
+                
+                # empty the held tweets
+                del tweetdf
+                tweets_interval = []
+                interval_size = 0
+        
+        # delete reference to current bounding box tweets
+        del tweets
+        
         # run garbage collector to free some memory
         gc.collect()
     
     # collect loose garbage
     gc.collect()
     
+    # save remaining tweets as the last numbered part if earlier parts exist
+    if len(part_files) != 0 and count_tweets(tweets_interval) != 0:
+        
+        # parse remaining tweets
+        print('[INFO] - Saving remaining ' + str(count_tweets(tweets_interval)) + ' tweets as the last part of the interval')
+        tweetdf = parse_tweets(tweets_interval, search_config['results_per_call'], fields,
+                               study_area, args['studymode'])
+        
+        # save last numbered part
+        partpickle = outpath + file_prefix_w_date + '_part' + str(intv) + '_' + str(len(part_files)) + '.pkl'
+        save_pickle(tweetdf, partpickle)
+        part_files.append(partpickle)
+        
+        # empty the held tweets
+        del tweetdf
+        tweets_interval = []
+        gc.collect()
+    
+    # check if results were saved in parts
+    if len(part_files) != 0:
+        print('[INFO] - Saved ' + str(len(part_files)) + ' parts from ' + str(intstart) + ' to ' + str(intend))
+    
     # check if there are results
-    if len(tweets_interval) != 0:
+    elif count_tweets(tweets_interval) != 0:
     
         # parse results to dataframe
         print('[INFO] - Parsing collected tweets from ' + str(intstart) + ' to ' + str(intend))
-        tweetdf = v2parser(tweets_interval, search_config['results_per_call'])
-    
-        # try to order columns semantically
-        try:
-            tweetdf = tweetdf[['id', 'author_id', 'created_at', 'conversation_id',
-                               'in_reply_to_user_id', 'text', 'lang',
-                               'public_metrics.retweet_count',
-                               'public_metrics.reply_count', 'public_metrics.like_count',
-                               'public_metrics.quote_count', 'user.location',
-                               'user.created_at', 'user.username',
-                               'user.public_metrics.followers_count',
-                               'user.public_metrics.following_count',
-                               'user.public_metrics.tweet_count',
-                               'geo.place_id', 'geo.coordinates.type',
-                               'geo.coordinates.coordinates',
-                               'geo.coordinates.x', 'geo.coordinates.y', 'geo.full_name',
-                               'geo.name', 'geo.place_type', 'geo.country',
-                               'geo.country_code', 'geo.type', 'geo.bbox',
-                               'geo.centroid', 'geo.centroid.x', 'geo.centroid.y']]
-        except:
-            
-            pass
-        
-        # set up file prefix from config
-        file_prefix_w_date = search_config['filename_prefix'] + '_' + str(intstart) + '---' + str(intend)
-        outpickle = file_prefix_w_date + '_part' + str(intv) + '.pkl'
+        tweetdf = parse_tweets(tweets_interval, search_config['results_per_call'], fields,
+                               study_area, args['studymode'])
         
         # save to pickle
-        tweetdf.to_pickle(outpath + outpickle)
+        save_pickle(tweetdf, outpath + outpickle)
+        part_files.append(outpath + outpickle)
         print('[INFO] - Dataframe saved.')
         
         # collect loose garbage to free memory
+        del tweetdf
         gc.collect()
         
     else:
@@ -310,5 +437,21 @@ for intv in range(interval):
         print('[INFO] - No geotagged tweets in bounding boxes between {} and {}. Moving on...'.format(str(start_date), str(end_date)))
         gc.collect()
         pass
+    
+    # remove output of the interval from earlier runs which this run did not write, like
+    # extra parts or spill files of a crashed run, so the interval is not counted twice
+    if len(part_files) != 0:
+        for old in glob.glob(glob.escape(outpath + file_prefix_w_date) + '_part' + str(intv) + '[._]*'):
+            if old not in part_files:
+                os.remove(old)
+    
+    # add the windows of the saved interval to the cell history
+    if args['history'] is not None:
+        history = update_cell_history(args['history'], history, history_rows)
+
+# report connection reuse and close session
+n_requests, n_connections = session_stats(session)
+print('[INFO] - Sent ' + str(n_requests) + ' requests over ' + str(n_connections) + ' connections.')
+session.close()
 
 print('[INFO] - ... done!')
\ No newline at end of file
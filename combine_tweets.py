@@ -6,10 +6,10 @@ Created on Mon Apr 19 11:29:53 2021
 @author: Tuomas Väisänen (waeiski)
 """
 # import glob
-import pandas as pd
-import geopandas as gpd
-import glob
 import argparse
+import json
+import time
+import os
 
 # Set up the argument parser
 ap = argparse.ArgumentParser()
@@ -21,72 +21,246 @@ ap.add_argument("-o", "--output", required=True,
 
 # Get output file type
 ap.add_argument("-f", "--filetype", required=True, default='gpkg',
-                help="Output filetype. Supported options: 'gpkg', 'pkl' and 'csv'")
+                help="Output filetype. Supported options: 'gpkg', 'pkl', 'feather', 'csv' and "
+                "'jsonl', csv and jsonl optionally compressed as 'csv.gz', 'csv.zst', "
+                "'jsonl.gz' or 'jsonl.zst'")
+
+# get geopackage layer
+ap.add_argument("-l", "--layer", required=False, default=None,
+                help="Name of the geopackage layer. Default: name of the output file")
+
+# get geopackage append mode
+ap.add_argument("-a", "--append", required=False, action='store_true',
+                help="Append tweets to the layer if the geopackage and layer already exist. "
+                "Without this an existing layer is overwritten, other layers are kept")
+
+# get geopackage batch size
+ap.add_argument("-bs", "--batchsize", required=False, default=100000, type=int,
+                help="Number of tweets written to the geopackage in one batch. "
+                "Default: 100000")
+
+# get study area polygons
+ap.add_argument("-sa", "--studyarea", required=False, default=None,
+                help="Path to a GIS file of study area polygons. Tweets whose "
+                "coordinates, or place centroid if there are no coordinates, are "
+                "outside the polygons are dropped. Default: no study area")
+
+# get study area mode
+ap.add_argument("-sm", "--studymode", required=False, default='keep',
+                choices=['keep', 'tag'],
+                help="What to do with the study area: keep only tweets within it, or "
+                "tag all tweets with an in_study_area column. Default: keep")
 
+# get boundary layers for area join
+ap.add_argument("-ar", "--areas", required=False, default=None, nargs='+',
+                help="Paths to GIS files of boundary polygons, like municipalities or "
+                "postal code areas, to attach area ids to tweets. Give the id column "
+                "after a colon, for example: municipalities.gpkg:kunta. Default: no areas")
+
+# get area cache file
+ap.add_argument("-ac", "--areacache", required=False, default=None,
+                help="Path to a pickle file caching area ids per place and per rounded "
+                "gps coordinate between runs. Default: no cache file")
+
+# get coordinate rounding of the area cache
+ap.add_argument("-ad", "--areadecimals", required=False, default=6, type=int,
+                choices=range(0, 7),
+                help="Number of decimals gps coordinates are rounded to for the area "
+                "join. Default: 6, about 10 cm")
+
+# get entity table output
+ap.add_argument("-et", "--entities", required=False, action='store_true',
+                help="Also save hashtags, cashtags, mentions, urls and annotations of "
+                "the combined tweets as long format tables named after the output "
+                "file, one row per entity. Saved in the output filetype, or as pkl if "
+                "filetype is gpkg")
+
+# get update mode
+ap.add_argument("-u", "--update", required=False, action='store_true',
+                help="Read only files which are new or have changed since the previous "
+                "run with -u and add them to the output, replacing previous rows of changed "
+                "files. Combined files are listed in a manifest json file next to the output")
 
 # Parse arguments
 args = vars(ap.parse_args())
 
+# output filetypes, the text formats are TEXT_FORMATS of util_functions.py
+FILETYPES = ['gpkg', 'pkl', 'feather', 'csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'jsonl.zst']
+
+# check arguments before importing heavy libraries, so errors return at once
+if args['filetype'] not in FILETYPES:
+    ap.error('invalid filetype, valid options are ' + ', '.join(FILETYPES))
+for path in [args['studyarea']] + [spec if os.path.exists(spec) else spec.rsplit(':', 1)[0] for spec in args['areas'] or []]:
+    if path is not None and not os.path.exists(path):
+        ap.error('file not found: ' + path)
+
+# import heavy libraries after checking arguments
+import pandas as pd
+import numpy as np
+from util_functions import order_columns, tweet_files, read_tweets, read_table, concat_tables, constant_column, table_to_frame, save_feather, TEXT_FORMATS, save_text, read_text, text_chunks, utc_columns, entity_tables, save_entities, gpkg_layers, write_points_gpkg, delete_gpkg_rows, tweet_coordinates, read_study_area, filter_study_area, read_areas, area_signature, join_areas, read_area_cache
+
+# get output name without the filetype extension, like my_tweets of my_tweets.jsonl.gz
+prefix = args['output'][:-len(args['filetype']) - 1] if args['output'].endswith('.' + args['filetype']) \
+    else os.path.splitext(args['output'])[0]
+
+# get layer name and manifest of files already in the output
+layer = args['layer'] or os.path.splitext(os.path.basename(args['output']))[0]
+if args['filetype'] == 'gpkg':
+    manifest_file = prefix + '_' + layer + '_manifest.json'
+    exists = layer in gpkg_layers(args['output'])
+else:
+    manifest_file = prefix + '_' + args['filetype'] + '_manifest.json'
+    exists = os.path.exists(args['output'])
+
+# update only outputs made with a manifest listing their files, otherwise combine everything again
+manifest = {'files': {}, 'rows': 0}
+update = args['update'] and exists and os.path.exists(manifest_file)
+if update:
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    
+    # outputs of runs without update have no file list and no source_file column
+    if not manifest.get('files'):
+        print('[INFO] - ' + args['output'] + ' was not combined with -u, combining all files again')
+        manifest = {'files': {}, 'rows': 0}
+        update = False
+
 # create empty list for file paths
 filelist = []
 
-# loop over pickled dataframes
-for pickle in glob.glob('*.pkl'):
+# loop over pickled, feather and json lines files, entity tables are skipped
+for pickle in tweet_files('.'):
+    pickle = os.path.relpath(pickle)
+    
+    # skip the area cache and the output itself
+    if os.path.abspath(pickle) in [os.path.abspath(path) for path in (args['areacache'], args['output']) if path]:
+        continue
     
-    # populate file list with paths to pickled dataframes
+    # populate file list with paths to dataframes
     filelist.append(pickle)
 
 # create empty list for dataframes
 dflist = []
 
+# create empty list for memory-mapped arrow tables of feather files
+tables = []
+
+# create empty list of files replacing their previous rows
+replaced = []
+
 # loop over filepaths
-print('[INFO] - Reading pickled dataframes...')
+print('[INFO] - Reading dataframes...')
 for file in filelist:
     
-    # read pickle in as a pandas dataframe
-    data = pd.read_pickle(file)
+    # skip files already in the output
+    stat = os.stat(file)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    if manifest['files'].get(file) == signature:
+        continue
+    if file in manifest['files']:
+        replaced.append(file)
+    
+    # map feather files to arrow tables, they are read when converted to pandas
+    if file.endswith('.feather'):
+        table = read_table(file)
+        if args['update']:
+            table = constant_column(table, 'source_file', file)
+        tables.append(table)
+        manifest['files'][file] = signature
+        continue
+    
+    # read pickle or json lines in as a pandas dataframe, older files have timestamps as strings
+    data = utc_columns(read_tweets(file))
+    
+    # record source file of the rows to replace them if the file changes
+    if args['update']:
+        data['source_file'] = file
     
     # populate list with dataframes
     dflist.append(data)
+    manifest['files'][file] = signature
 
-# concatenate dataframes into one dataframe
-data = pd.concat(dflist, ignore_index=True)
+# stop if there is nothing to add
+if len(dflist) + len(tables) == 0:
+    print('[INFO] - No new or changed files, ' + args['output'] + ' is up to date')
+    raise SystemExit
+print('[INFO] - ' + str(len(dflist) + len(tables) - len(replaced)) + ' new and ' + str(len(replaced)) + ' changed files')
 
-# loop over data
+# concatenate feather files by reference and convert them to pandas once
+if tables:
+    dflist.append(table_to_frame(concat_tables(tables)))
+    del tables
+
+# concatenate dataframes into one dataframe, a single dataframe is not copied
+data = pd.concat(dflist, ignore_index=True) if len(dflist) > 1 else dflist[0]
+del dflist
+
+# parse coordinate information, gps coordinates are preferred over bounding box centroids
 print('[INFO] - Parsing coordinate information...')
-for i, row in data.iterrows():
-    
-    # parse gps coordinates if present
-    if row['geo.coordinates.x'] != None:
-        
-        # signify coordinate type
-        data.at[i, 'locinfo_type'] = 'gps'
-        
-        # get x and y coordinates
-        data.at[i, 'x_coord'] = row['geo.coordinates.x']
-        data.at[i, 'y_coord'] = row['geo.coordinates.y']
-        
-    # parse bounding box coordinates if no gps coordinates
-    elif row['geo.coordinates.x'] == None:
-        
-        # signify coordinate type
-        data.at[i, 'locinfo_type'] = 'bbox'
-        
-        # get x and y coordinates
-        data.at[i, 'x_coord'] = row['geo.centroid.x']
-        data.at[i, 'y_coord'] = row['geo.centroid.y']
+x, y, gps = tweet_coordinates(data)
+data['locinfo_type'] = np.where(gps, 'gps', 'bbox')
+data['x_coord'] = x
+data['y_coord'] = y
+
+# keep or tag tweets within study area
+if args['studyarea'] is not None:
+    print('[INFO] - Filtering tweets with study area...')
+    data = filter_study_area(data, read_study_area(args['studyarea']), args['studymode'])
+
+# attach area ids from boundary layers
+areacols = []
+if args['areas'] is not None:
+    print('[INFO] - Joining areas...')
+    cache = read_area_cache(args['areacache'])
+    for spec in args['areas']:
+        polygons, ids, name = read_areas(spec)
+        signature = area_signature(spec, args['areadecimals'])
+        data, cache[signature] = join_areas(data, polygons, ids, name, cache.get(signature),
+                                            args['areadecimals'])
+        areacols.append(name)
+    if args['areacache'] is not None:
+        pd.to_pickle(cache, args['areacache'])
 
 # convert NaN to None
 data = data.where(pd.notnull(data), None)
 
+# remove previous rows of changed files from the output
+replaced_ids = []
+old = None
+if update and args['filetype'] in ('pkl', 'feather'):
+    old = utc_columns(read_tweets(args['output']))
+if update and replaced:
+    print('[INFO] - Removing previous rows of changed files...')
+    if args['filetype'] == 'gpkg':
+        replaced_ids = delete_gpkg_rows(args['output'], layer, 'source_file', replaced)
+        manifest['rows'] -= len(replaced_ids)
+    else:
+        if old is None:
+            old = read_text(args['output'])
+        keep = ~old['source_file'].isin(replaced)
+        replaced_ids = old.loc[~keep, 'id'].tolist()
+        old = old[keep].reset_index(drop=True)
+        manifest['rows'] = len(old)
+        
+        # rewrite csv or json lines without the previous rows, new rows are appended below
+        if args['filetype'] in TEXT_FORMATS:
+            save_text(old, args['output'])
+
+# save long format entity tables before entity columns are dropped
+if args['entities']:
+    print('[INFO] - Saving entity tables...')
+    save_entities(entity_tables(data), prefix,
+                  'pkl' if args['filetype'] == 'gpkg' else args['filetype'],
+                  replaced_ids if update else None)
+
 # check if output filetype is geopackage
 if args['filetype'] == 'gpkg':
     
     # drop rows without any coordinates
     data = data.dropna(subset=['x_coord', 'y_coord']).reset_index()
         
-    # retain columns compatible with geopackage
-    data = data[['id', 'author_id', 'created_at', 'reply_settings', 'conversation_id',
+    # retain columns compatible with geopackage, skipping ones not in the field profile
+    data = order_columns(data, ['id', 'author_id', 'created_at', 'reply_settings', 'conversation_id',
            'source', 'in_reply_to_user_id', 'text', 'possibly_sensitive', 'lang',
            'referenced_tweets.id', 'referenced_tweets.author_id', 'referenced_tweets.type',
            'public_metrics.retweet_count', 'public_metrics.reply_count',
@@ -100,27 +274,72 @@ if args['filetype'] == 'gpkg':
            'geo.place_id', 'geo.coordinates.type', 'geo.coordinates.x',
            'geo.coordinates.y', 'geo.full_name', 'geo.name',
            'geo.place_type', 'geo.country', 'geo.country_code', 'geo.type',
-           'locinfo_type', 'x_coord', 'y_coord']]
-    
-    # generate geometry
-    print('[INFO] - Generating geometry information from coordinates...')
-    gdf = gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(data.x_coord, data.y_coord))
+           'locinfo_type', 'x_coord', 'y_coord', 'in_study_area'] + areacols + ['source_file'], keep_rest=False)
     
-    # set crs to WGS-84
-    gdf = gdf.set_crs("EPSG:4326")
+    # check whether to append to an existing layer
+    append = (args['append'] and exists) or update
     
     # save to geopackage
-    print('[INFO] - Saving to geopackage...')
-    gdf.to_file(args['output'], driver='GPKG')
+    print('[INFO] - Saving to geopackage layer ' + layer + '...')
+    start = time.time()
+    
+    # write in transactions with gdal and create the spatial index once
+    written = write_points_gpkg(args['output'], layer, data, 'x_coord', 'y_coord',
+                                batch_size=args['batchsize'], append=append)
+    
+    # report write throughput
+    elapsed = time.time() - start
+    print('[INFO] - Wrote ' + str(written) + ' tweets in ' + str(round(elapsed, 1)) + ' s, '
+          + str(int(written / max(elapsed, 1e-9))) + ' tweets/s')
+    manifest['rows'] += written
 
 # check if output filetype is pickle
 elif args['filetype'] == 'pkl':
     print('[INFO] - Saving to pickle...')
+    if old is not None:
+        data = pd.concat([old, data], ignore_index=True)
     data.to_pickle(args['output'])
+    manifest['rows'] = len(data)
+
+# check if output filetype is feather
+elif args['filetype'] == 'feather':
+    print('[INFO] - Saving to feather...')
+    if old is not None:
+        data = pd.concat([old, data], ignore_index=True)
+    save_feather(data, args['output'])
+    manifest['rows'] = len(data)
+
+# check if output filetype is csv or json lines
+elif args['filetype'] in TEXT_FORMATS:
+    print('[INFO] - Saving to ' + args['filetype'] + '...')
+    if update:
+        data.index = pd.RangeIndex(manifest['rows'], manifest['rows'] + len(data))
+        
+        # append rows continuing the index, to a csv in the column order of the existing file
+        if args['filetype'].startswith('csv'):
+            columns = read_text(args['output'], nrows=0).columns
+            added = [col for col in data.columns if col not in columns]
+            
+            # new columns need a new header, rewrite the old rows chunk by chunk with them
+            if added:
+                print('[INFO] - Adding columns ' + ', '.join(added) + ' to ' + args['output'])
+                columns = list(columns) + added
+                partfile = prefix + '_rewrite.' + args['filetype']
+                save_text(data.iloc[:0].reindex(columns=columns), partfile)
+                for chunk in text_chunks(args['output'], as_text=True):
+                    save_text(chunk.reindex(columns=columns), partfile, append=True)
+                os.replace(partfile, args['output'])
+            data = data.reindex(columns=columns)
+        save_text(data, args['output'], append=True)
+    else:
+        save_text(data, args['output'])
+    manifest['rows'] += len(data)
 
-# check if output filetype is csv
-elif args['filetype'] == 'csv':
-    print('[INFO] - Saving to csv...')
-    data.to_csv(args['output'], sep=';', encoding='utf-8')
+# write manifest of combined files after the output, it also marks the output as combined so
+# tweet_files skips it. Outputs without -u have no source files, so -u combines them again
+if not args['update']:
+    manifest['files'] = {}
+with open(manifest_file, 'w') as f:
+    json.dump(manifest, f, indent=1)
 
 print('[INFO] - ... done!')
\ No newline at end of file
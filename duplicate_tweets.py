@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:03:21 2026
+
+INFO
+####
+
+This script finds near-duplicate tweets, like automated posts made from the
+same template by weather stations, job ad services and check-in apps, and
+the authors posting mostly such tweets. Texts are compared by MinHash
+signatures of their word pairs with locality-sensitive hashing, so the time
+grows linearly with the number of tweets instead of comparing every pair.
+Links, mentions and numbers are replaced by placeholders before comparing.
+
+Clusters are kept in the duplicate directory and updated with files which
+are new or have changed since the previous run, so new days can be added
+without clustering the whole collection again. Authors with at least -mt
+tweets of which at least the share -sh are in clusters of at least -ms
+tweets are saved as template_authors.pkl in the duplicate directory.
+
+REQUIREMENTS
+############
+
+Files:
+    pickled or feather tweet dataframes from any of the collector scripts
+
+Installed:
+    Python 3.8 or newer
+
+    Python packages:
+        pandas
+
+USAGE
+#####
+
+Run the script by typing:
+
+    python duplicate_tweets.py -i path/to/results/ -d path/to/duplicates/
+
+Get the cluster of each tweet and whether it is a template tweet or from a
+template author with the read_duplicates function of util_functions.py.
+
+NOTE
+####
+
+Keep the duplicate directory outside the results directory.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+from util_functions import tweet_files, update_duplicates, read_duplicates
+import argparse
+import os
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# get input directory
+ap.add_argument("-i", "--input", required=False, default='.',
+                help="Directory of the pickled or feather tweet dataframes. Default: current directory")
+
+# get duplicate directory
+ap.add_argument("-d", "--duplicates", required=True,
+                help="Directory of the near-duplicate clusters. For example: duplicates/")
+
+# get minimum template size
+ap.add_argument("-ms", "--minsize", required=False, default=10, type=int,
+                help="Smallest number of near-duplicate tweets counted as a template. Default: 10")
+
+# get minimum tweets of template authors
+ap.add_argument("-mt", "--mintweets", required=False, default=20, type=int,
+                help="Smallest number of tweets of a template author. Default: 20")
+
+# get minimum share of template tweets of template authors
+ap.add_argument("-sh", "--share", required=False, default=0.5, type=float,
+                help="Smallest share of template tweets of a template author. Default: 0.5")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# cluster new and changed files
+print('[INFO] - Clustering near-duplicate tweets...')
+updated = update_duplicates(args['duplicates'], tweet_files(args['input']))
+print('[INFO] - Clustered ' + str(len(updated)) + ' new or changed files')
+
+# summarize templates and template authors
+tweets = read_duplicates(args['duplicates'], args['minsize'], args['mintweets'], args['share'])
+authors = tweets[tweets['template_author']].groupby('author_id').agg(tweets=('id', 'size'),
+                                                                     template_tweets=('template', 'sum'))
+authors = authors.sort_values('tweets', ascending=False).reset_index()
+authors.to_pickle(os.path.join(args['duplicates'], 'template_authors.pkl'))
+print('[INFO] - ' + str(int(tweets['template'].sum())) + ' of ' + str(len(tweets)) + ' tweets are in '
+      + str(tweets.loc[tweets['template'], 'cluster'].nunique()) + ' templates, '
+      + str(len(authors)) + ' template authors')
+
+print('[INFO] - ... done!')
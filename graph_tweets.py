@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:12:48 2026
+
+INFO
+####
+
+This script builds the reply, quote and retweet graph of collected tweets and
+the interaction graph of their users, and saves them as integer arrays in
+compressed sparse row form. Tweets point to the tweets they reply to, quote
+or retweet, and users point to the users they reply to, quote, retweet or
+mention, weighted by the number of tweets.
+
+The graphs are saved in the graph directory as .npy files, tweet_ids.npy and
+user_ids.npy holding the ids of the tweets and users in the order of their
+node numbers. Read them with the TweetGraph class of util_functions.py to
+get threads, references, neighbours and degrees without merging dataframes.
+
+REQUIREMENTS
+############
+
+Files:
+    pickled or feather tweet dataframes from any of the collector scripts
+
+Installed:
+    Python 3.8 or newer
+
+    Python packages:
+        pandas
+
+USAGE
+#####
+
+Run the script by typing:
+
+    python graph_tweets.py -i path/to/results/ -g path/to/graph/
+
+NOTE
+####
+
+Tweets and users are only in the graphs if they were collected or referred
+to by collected tweets. Collect with the referenced_tweets, in_reply_to_user_id
+and entities fields to get all edges.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+from util_functions import tweet_files, build_graph
+import argparse
+import time
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# get input directory
+ap.add_argument("-i", "--input", required=False, default='.',
+                help="Directory of the pickled or feather tweet dataframes. Default: current directory")
+
+# get graph directory
+ap.add_argument("-g", "--graph", required=True,
+                help="Directory of the graph arrays. For example: graph/")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# build graphs of all files
+print('[INFO] - Building tweet graphs...')
+start = time.time()
+sizes = build_graph(tweet_files(args['input']), args['graph'])
+print('[INFO] - Saved ' + str(sizes['tweets']) + ' tweets with ' + str(sizes['references']) + ' references and '
+      + str(sizes['users']) + ' users with ' + str(sizes['interactions']) + ' interacting user pairs in '
+      + str(round(time.time() - start, 1)) + ' s')
+
+print('[INFO] - ... done!')
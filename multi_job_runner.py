@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:37 2026
+
+INFO
+####
+
+This script runs several collection jobs in one process so that they share the
+rate limit and monthly tweet cap of one bearer token. Jobs can be search
+queries (like v2_tweets_to_file.py), bounding box grids (like
+bbox_tweets_to_file.py) and user lists (like timeline_tweets_to_file.py).
+
+Requests of the jobs are interleaved page by page. Every job gets turns in
+proportion to its priority, so a large bounding box grid does not block a
+small daily query. All requests go through one rate limiter, which pauses
+every job when the rate limit is hit instead of each job sleeping on its own
+schedule. The monthly tweet cap is tracked in a json file and the runner stops
+when the cap is reached, saving the tweets of units it was collecting.
+
+REQUIREMENTS
+############
+
+Files:
+    .twitter_keys.yaml in the script directory
+    a jobs yaml file, see below
+    search config yaml file(s) referred to in the jobs file
+
+Installed:
+    Python 3.8 or newer
+
+    Python packages:
+        searchtweetsv2
+        pandas
+        geopandas
+
+USAGE
+#####
+
+Run the script by typing:
+
+    python multi_job_runner.py -j jobs.yaml
+
+The jobs file has a budget section and a list of jobs, for example:
+
+    budget:
+        requests_per_window: 300
+        window_seconds: 900
+        min_interval: 1
+        monthly_cap: 10000000
+        usage_file: monthly_usage.json
+
+    jobs:
+        - name: weather
+          type: query
+          config: search_config.yaml
+          startdate: 2020-04-28
+          enddate: 2020-05-29
+          output: pkl
+          outpath: results/weather/
+          priority: 2
+        - name: helsinki
+          type: bbox
+          config: search_config.yaml
+          bbox: /path/to/bbox.gpkg
+          startdate: 2015-01-01
+          enddate: 2016-01-01
+          interval: 12
+          outpath: results/helsinki/
+        - name: panel
+          type: timeline
+          config: search_config.yaml
+          userlist: /path/to/list.csv
+          startdate: 2015-01-01
+          enddate: 2016-01-01
+          chunksize: 20
+          output: pkl
+          outpath: results/panel/
+
+Priority is a relative weight greater than 0, a job with priority 2 gets twice
+the requests of a job with priority 1 while both have work left. Default
+priority is 1.
+
+NOTE
+####
+
+Like in the single job scripts, collection starts from 00:00 hours on the
+starting day and ends on 23:59:59 on the day before the end date.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+from util_functions import v2parser, field_profile, TEXT_FORMATS, save_text, save_feather, daterange, order_columns, BBOX_COLUMNS, RateLimiter, get_page, page_messages, make_pooled_session, session_stats
+from searchtweets import gen_request_parameters, load_credentials, read_config
+from datetime import datetime, timedelta
+import pandas as pd
+import geopandas as gpd
+import argparse
+import json
+import time
+import yaml
+import os
+import gc
+
+# define function to generate request parameters of a job
+def make_rule(query, config, start, end):
+    return gen_request_parameters(query = query,
+                                  results_per_call = config['results_per_call'],
+                                  start_time = start.isoformat(),
+                                  end_time = end.isoformat(),
+                                  **field_profile(config),
+                                  stringify = False)
+
+# define function to count tweets in collected messages
+def count_tweets(tweets):
+    return sum([d['result_count'] for d in tweets if 'result_count' in d.keys()])
+
+# define function to save parsed tweets
+def save_tweets(tweetdf, spec, filename):
+
+    # get output path and format
+    outpath = spec.get('outpath', '')
+    output = spec.get('output', 'pkl')
+
+    # save to file
+    if output == 'pkl':
+        tweetdf.to_pickle(outpath + filename + '.pkl')
+    elif output == 'feather':
+        save_feather(tweetdf, outpath + filename + '.feather')
+    elif output in TEXT_FORMATS:
+        save_text(tweetdf, outpath + filename + '.' + output)
+
+# define job generator for search queries, one unit per day
+def query_job(spec):
+
+    # load configuration for search query
+    config = read_config(spec['config'])
+
+    # get dates
+    start_date = datetime.strptime(str(spec['startdate']), '%Y-%m-%d').date()
+    end_date = datetime.strptime(str(spec['enddate']), '%Y-%m-%d').date()
+
+    # loop through dates, a day handed back when the runner stops is saved like a full one
+    for single_date in daterange(start_date, end_date):
+
+        # hand request parameters to the runner and get collected tweets back
+        tweets = yield make_rule(config['query'], config, single_date, single_date + timedelta(days=1))
+
+        # parse and save if there are results
+        if count_tweets(tweets) != 0:
+            print('[INFO] - ' + spec['name'] + ': Parsing tweets from ' + str(single_date))
+            tweetdf = order_columns(v2parser(tweets, config['results_per_call'], field_profile(config)))
+            save_tweets(tweetdf, spec, config['filename_prefix'] + single_date.isoformat())
+            del tweetdf
+        else:
+            print('[INFO] - ' + spec['name'] + ': No tweets from ' + str(single_date))
+
+        # free memory
+        del tweets
+        gc.collect()
+
+# define job generator for bounding box grids, one unit per bounding box and interval
+def bbox_job(spec):
+
+    # load configuration for search query
+    config = read_config(spec['config'])
+
+    # load bounding boxes
+    bbox_df = gpd.read_file(spec['bbox'])
+
+    # get dates and interval length
+    start_date = datetime.strptime(str(spec['startdate']), '%Y-%m-%d').date()
+    end_date = datetime.strptime(str(spec['enddate']), '%Y-%m-%d').date()
+    interval = int(spec.get('interval', 1))
+    diff = (end_date - start_date) / interval
+
+    # define function to parse and save tweets of an interval
+    def save_interval(tweets_interval, intv, intstart, intend):
+        if count_tweets(tweets_interval) != 0:
+            print('[INFO] - ' + spec['name'] + ': Parsing collected tweets from ' + str(intstart) + ' to ' + str(intend))
+            tweetdf = order_columns(v2parser(tweets_interval, config['results_per_call'], field_profile(config)), BBOX_COLUMNS)
+            file_prefix_w_date = config['filename_prefix'] + '_' + str(intstart) + '---' + str(intend)
+            save_tweets(tweetdf, spec, file_prefix_w_date + '_part' + str(intv))
+            del tweetdf
+        else:
+            print('[INFO] - ' + spec['name'] + ': No geotagged tweets in bounding boxes between ' + str(intstart) + ' and ' + str(intend))
+
+    # loop over date intervals
+    for intv in range(interval):
+
+        # get interval start and end dates
+        intstart = start_date + diff * intv
+        intend = start_date + diff * (intv + 1)
+
+        # empty tweet list for current interval
+        tweets_interval = []
+
+        # loop over bounding boxes
+        for i, bbox in bbox_df.iterrows():
+
+            # form the search query based on bounding box southwest and northeast corner coordinates
+            search_q = f'bounding_box:[{bbox["left"]:.5f} {bbox["bottom"]:.5f} {bbox["right"]:.5f} {bbox["top"]:.5f}] -is:retweet -is:quote -is:reply'
+
+            # hand request parameters to the runner and get collected tweets back
+            try:
+                tweets = yield make_rule(search_q, config, intstart, intend)
+            except GeneratorExit:
+                # save the boxes collected so far when the runner stops
+                print('[INFO] - ' + spec['name'] + ': Saving the bounding boxes collected so far')
+                save_interval(tweets_interval, intv, intstart, intend)
+                raise
+            tweets_interval.extend(tweets)
+            del tweets
+
+        # parse and save if there are results
+        save_interval(tweets_interval, intv, intstart, intend)
+
+        # free memory
+        del tweets_interval
+        gc.collect()
+
+# define job generator for user lists, one unit per user
+def timeline_job(spec):
+
+    # load configuration for search query
+    config = read_config(spec['config'])
+
+    # read user list
+    users = pd.read_csv(spec['userlist'])['usr_id'].values.tolist()
+
+    # get dates and chunk size
+    start_date = datetime.strptime(str(spec['startdate']), '%Y-%m-%d').date()
+    end_date = datetime.strptime(str(spec['enddate']), '%Y-%m-%d').date()
+    chunksize = int(spec.get('chunksize', 20))
+
+    # define function to concatenate and save a chunk
+    def save_chunk(dflist, first, last):
+        if len(dflist) > 0:
+            results = pd.concat(dflist, ignore_index=True)
+            userstring = '_from_' + str(first) + '_to_' + str(last)
+            save_tweets(results, spec, config['filename_prefix'] + start_date.isoformat() + userstring)
+            del results
+
+    # loop over chunks of users
+    for pos in range(0, len(users), chunksize):
+        userchunk = users[pos:pos + chunksize]
+
+        # list for user dataframes
+        dflist = []
+
+        # loop over users in chunk
+        for n, user in enumerate(userchunk):
+
+            # hand request parameters to the runner and get collected tweets back
+            search_q = 'from:{} -is:retweet has:geo'.format(user)
+            try:
+                tweets = yield make_rule(search_q, config, start_date, end_date)
+            except GeneratorExit:
+                # save the users collected so far when the runner stops, named after them
+                if n > 0:
+                    save_chunk(dflist, userchunk[0], userchunk[n - 1])
+                raise
+
+            # parse if there are results
+            if count_tweets(tweets) != 0:
+                dflist.append(order_columns(v2parser(tweets, config['results_per_call'], field_profile(config))))
+            else:
+                print('[INFO] - ' + spec['name'] + ': User id ' + str(user) + ' is missing or has no tweets. Moving on...')
+            del tweets
+
+        # concatenate and save chunk
+        save_chunk(dflist, userchunk[0], userchunk[-1])
+
+        # free memory
+        del dflist
+        gc.collect()
+
+# define function to read tweets used during the current month
+def read_usage(usagefile, month):
+    if os.path.exists(usagefile):
+        with open(usagefile, 'r', encoding='utf-8') as f:
+            return json.load(f).get(month, 0)
+    return 0
+
+# define function to store tweets used during the current month
+def write_usage(usagefile, month, used):
+    usage = {}
+    if os.path.exists(usagefile):
+        with open(usagefile, 'r', encoding='utf-8') as f:
+            usage = json.load(f)
+    usage[month] = used
+    tmpfile = usagefile + '.tmp'
+    with open(tmpfile, 'w', encoding='utf-8') as f:
+        json.dump(usage, f, indent=4)
+    os.replace(tmpfile, usagefile)
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# get jobs file
+ap.add_argument("-j", "--jobs", required=True,
+                help="Path to the jobs yaml file. For example: jobs.yaml")
+
+# get wait time
+ap.add_argument("-w", "--wait", required=False, default=15,
+                help="Set wait time after connection and server errors. "
+                "Default: 15")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# get waittime
+waittime = int(args['wait'])
+
+# read jobs file
+with open(args['jobs'], 'r', encoding='utf-8') as f:
+    jobsfile = yaml.safe_load(f)
+
+# get shared budget
+budget = jobsfile.get('budget', {})
+limiter = RateLimiter(max_requests=int(budget.get('requests_per_window', 300)),
+                      window=float(budget.get('window_seconds', 900)),
+                      min_interval=float(budget.get('min_interval', 1)))
+monthly_cap = budget.get('monthly_cap')
+usagefile = budget.get('usage_file', 'monthly_usage.json')
+
+# load twitter keys and open one session for all jobs
+search_creds = load_credentials('.twitter_keys.yaml',
+                                yaml_key = 'search_tweets_v2',
+                                env_overwrite = False)
+session = make_pooled_session(search_creds['bearer_token'], extra_headers_dict=search_creds.get('extra_headers_dict'))
+endpoint = search_creds['endpoint']
+
+# job generators per type
+job_types = {'query': query_job, 'bbox': bbox_job, 'timeline': timeline_job}
+
+# set up jobs with their scheduling state
+jobs = []
+for spec in jobsfile['jobs']:
+    if not float(spec.get('priority', 1)) > 0:
+        ap.error('priority of job ' + spec['name'] + ' has to be greater than 0')
+    jobs.append({'name': spec['name'],
+                 'gen': job_types[spec['type']](spec),
+                 'priority': float(spec.get('priority', 1)),
+                 'max_tweets': read_config(spec['config']).get('max_tweets'),
+                 'pass': 0.0,
+                 'rule': None,
+                 'tweets': None,
+                 'next_token': None,
+                 'collected': 0})
+    print('[INFO] - Added ' + spec['type'] + ' job ' + spec['name'] + ' with priority ' + str(spec.get('priority', 1)))
+
+# get tweets used this month
+month = datetime.utcnow().strftime('%Y-%m')
+used = read_usage(usagefile, month)
+
+# loop until all jobs are done
+while len(jobs) > 0:
+
+    # pick the job with least requests weighted by priority, ties go to higher priority
+    job = min(jobs, key=lambda j: (j['pass'], -j['priority']))
+
+    # get next unit from the job, handing back tweets of the finished unit
+    if job['rule'] is None:
+        try:
+            if job['tweets'] is None:
+                job['rule'] = next(job['gen'])
+            else:
+                job['rule'] = job['gen'].send(job['tweets'])
+        except StopIteration:
+            print('[INFO] - Job ' + job['name'] + ' is done.')
+            jobs.remove(job)
+            continue
+
+        # reset unit state
+        job['tweets'] = []
+        job['next_token'] = None
+        job['collected'] = 0
+
+    # check monthly cap
+    if monthly_cap is not None and used >= int(monthly_cap):
+        print('[INFO] - Monthly cap of ' + str(monthly_cap) + ' tweets reached. Stopping all jobs...')
+
+        # hand back tweets of unfinished units and let the jobs save what they have
+        for job in jobs:
+            if job['tweets']:
+                try:
+                    job['gen'].send(job['tweets'])
+                except StopIteration:
+                    continue
+            job['gen'].close()
+        break
+
+    # wait for the shared rate limit budget
+    limiter.wait()
+
+    # number of reconnection tries
+    tries = 10
+
+    # while loop to protect against 104 error
+    while True:
+        tries -= 1
+        try:
+            resp = get_page(session, endpoint, job['rule'], job['next_token'])
+            break
+        except Exception as err:
+            if tries == 0:
+                raise err
+            else:
+                print('[INFO] - Got connection error, waiting ' + str(waittime) + ' seconds and trying again. ' + str(tries) + ' tries left.')
+                time.sleep(waittime)
+
+    # account the request to the job
+    job['pass'] += 1 / job['priority']
+    limiter.update(resp.status_code, resp.headers)
+
+    # retry the same page later if rate limit was hit
+    if resp.status_code == 429:
+        print('[INFO] - Rate limit hit, pausing all jobs until the window resets.')
+        continue
+
+    # retry the same page after a wait on server errors
+    elif resp.status_code >= 500:
+        print('[INFO] - Server error ' + str(resp.status_code) + ', waiting ' + str(waittime) + ' seconds and trying again.')
+        time.sleep(waittime)
+        continue
+
+    # give up the unit on other errors
+    elif resp.status_code != 200:
+        print('[INFO] - Job ' + job['name'] + ' got error ' + str(resp.status_code) + ': ' + resp.text + '. Skipping unit...')
+        job['rule'] = None
+        continue
+
+    # add page to collected tweets of the unit
+    page = resp.json()
+    job['tweets'].extend(page_messages(page))
+    count = page.get('meta', {}).get('result_count', 0)
+    job['collected'] += count
+
+    # update monthly usage
+    used += count
+    write_usage(usagefile, month, used)
+
+    # get next page or finish the unit
+    job['next_token'] = page.get('meta', {}).get('next_token')
+    if job['next_token'] is None or (job['max_tweets'] is not None and job['collected'] >= int(job['max_tweets'])):
+        print('[INFO] - Job ' + job['name'] + ' got ' + str(job['collected']) + ' tweets from unit.')
+        job['rule'] = None
+
+# report connection reuse and close shared session
+n_requests, n_connections = session_stats(session)
+print('[INFO] - Sent ' + str(n_requests) + ' requests over ' + str(n_connections) + ' connections.')
+session.close()
+
+print('[INFO] - ... done!')
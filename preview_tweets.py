@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:41:05 2026
+
+INFO
+####
+
+This script previews the query of search_config.yaml over a long time span
+with a small number of requests, to check the query rules and field choices
+before collecting everything. The span is split into equal parts and one
+short window at a random place in each part is searched, so the windows
+cover the whole span. The request budget is shared between the windows, and
+windows with more results than their share are read newest first until the
+share runs out.
+
+The tweets received are kept in a reservoir sample of fixed size, weighted so
+that windows left partly unread count by their estimated tweets instead of
+the pages read. The sample is saved to a file, and the number of tweets over
+the whole span is extrapolated from the tweets per minute of the windows.
+
+REQUIREMENTS
+############
+
+Files:
+    .twitter_keys.yaml in the script directory
+    search_config.yaml in the script directory
+
+Installed:
+    Python 3.8 or newer
+
+    Python packages:
+        searchtweetsv2
+        pandas
+
+USAGE
+#####
+
+Run the script by typing:
+
+    python preview_tweets.py -sd YEAR-MO-DA -ed YEAR-MO-DA -rb 100 -n 1000
+
+The sample is saved as the filename prefix of the config followed by
+_preview and the dates, like my_weather_search_preview_2015-01-01---2020-01-01.pkl
+
+NOTE
+####
+
+The extrapolation assumes tweets in the windows are typical of their part of
+the span. Use more windows (-nw) for bursty queries, like ones about events,
+and check the 95 % interval printed with the estimate.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+from datetime import datetime
+import argparse
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# Get starting date
+ap.add_argument("-sd", "--startdate", required=True,
+                type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
+                help="Start date of the preview in the following form: "
+                " YEAR-MO-DA for example 2015-01-01")
+
+# Get end date
+ap.add_argument("-ed", "--enddate", required=True,
+                type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
+                help="End date of the preview in the following form: "
+                " YEAR-MO-DA for example 2020-01-01")
+
+# get request budget
+ap.add_argument("-rb", "--requests", required=False, default=100, type=int,
+                help="Largest number of requests to spend on the preview. Default: 100")
+
+# get sample size
+ap.add_argument("-n", "--samplesize", required=False, default=1000, type=int,
+                help="Number of tweets in the sample. Default: 1000")
+
+# get number of windows
+ap.add_argument("-nw", "--windows", required=False, default=20, type=int,
+                help="Number of windows searched over the span. Default: 20")
+
+# get window length
+ap.add_argument("-wm", "--minutes", required=False, default=60, type=int,
+                help="Length of the windows in minutes. Default: 60")
+
+# get random seed
+ap.add_argument("-rs", "--seed", required=False, default=None, type=int,
+                help="Random seed of the windows and the sample, to repeat a preview. "
+                "Default: a new one every run")
+
+# get save format
+ap.add_argument("-o", "--output", required=False, default='pkl',
+                help="Output file format, valid options are pkl, feather, csv or jsonl, "
+                "csv and jsonl optionally compressed as csv.gz, csv.zst, jsonl.gz or "
+                "jsonl.zst. Default: pkl")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# output formats, the text formats are TEXT_FORMATS of util_functions.py
+OUTPUTS = ['pkl', 'feather', 'csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'jsonl.zst']
+
+# check output format and budget before importing heavy libraries, so errors return at once
+if args['output'] not in OUTPUTS:
+    ap.error('invalid output file, valid options are ' + ', '.join(OUTPUTS))
+if args['enddate'] <= args['startdate']:
+    ap.error('end date has to be after the start date')
+if args['requests'] < 1 or args['windows'] < 1 or args['samplesize'] < 1 or args['minutes'] < 1:
+    ap.error('requests, sample size, windows and minutes have to be at least 1')
+
+# every window needs at least one request
+windows = min(args['windows'], args['requests'])
+if windows < args['windows']:
+    print('[INFO] - Request budget allows only ' + str(windows) + ' windows')
+
+# load twitter keys and configuration for search query
+from searchtweets import gen_request_parameters, load_credentials, read_config
+search_creds = load_credentials('.twitter_keys.yaml',
+                               yaml_key = 'search_tweets_v2',
+                               env_overwrite = False)
+config = read_config('search_config.yaml')
+
+# import heavy libraries after checking arguments and config
+from util_functions import v2parser, field_profile, save_text, save_feather, order_columns, make_pooled_session, stream_tweets, session_stats, RateLimiter, preview_windows, window_volume, reservoir_sample, extrapolate_volume
+import numpy as np
+
+# open one pooled session and rate limiter for the whole run
+session = make_pooled_session(search_creds['bearer_token'])
+limiter = RateLimiter()
+
+# get request fields and expansions of the field profile
+fields = field_profile(config)
+
+# pick windows over the span
+rng = np.random.default_rng(args['seed'])
+windows = preview_windows(args['startdate'], args['enddate'], windows, args['minutes'], rng)
+window_minutes = (windows[0][1] - windows[0][0]).total_seconds() / 60
+span_minutes = (args['enddate'] - args['startdate']).total_seconds() / 60
+print('[INFO] - Previewing ' + str(len(windows)) + ' windows of ' + str(int(window_minutes)) + ' minutes between '
+      + str(args['startdate'].date()) + ' and ' + str(args['enddate'].date()))
+
+# search windows, sharing the requests left between the windows left
+budget = args['requests']
+estimates = []
+sample = None
+for pos, (wstart, wend) in enumerate(windows):
+    pages = budget // (len(windows) - pos)
+
+    # payload rules for v2 api
+    rule = gen_request_parameters(query = config['query'],
+                                  results_per_call = config['results_per_call'],
+                                  start_time = wstart.strftime('%Y-%m-%d %H:%M'),
+                                  end_time = wend.strftime('%Y-%m-%d %H:%M'),
+                                  **fields,
+                                  stringify = False)
+
+    # get pages of the window newest first
+    tweets = list(stream_tweets(session, search_creds['endpoint'], rule, limiter=limiter, max_pages=pages))
+    used = len([d for d in tweets if 'result_count' in d.keys()])
+    budget -= used
+
+    # estimate tweets of the window
+    received, estimate, truncated = window_volume(tweets, wstart, wend)
+    estimates.append(estimate)
+    print('[INFO] - Got ' + str(received) + ' tweets from ' + wstart.strftime('%Y-%m-%d %H:%M') + ' with '
+          + str(used) + ' requests' + (', estimated ' + str(int(round(estimate))) + ' in the window' if truncated else ''))
+
+    # add tweets to the sample, weighted by the share of the window read
+    if received != 0:
+        tweetdf = v2parser(tweets, config['results_per_call'], fields)
+        sample = reservoir_sample(sample, tweetdf, estimate / received, args['samplesize'], rng)
+        del tweetdf
+    del tweets
+
+# extrapolate tweets of the whole span
+total, low, high = extrapolate_volume(estimates, window_minutes, span_minutes)
+print('[INFO] - Estimated ' + str(int(round(total))) + ' tweets between ' + str(args['startdate'].date()) + ' and '
+      + str(args['enddate'].date()) + (', 95 % interval ' + str(int(round(low))) + ' - ' + str(int(round(high)))
+      if not np.isnan(low) else ''))
+
+# save the sample in order of time
+if sample is not None:
+    sample = order_columns(sample.drop(columns='sample_key').sort_values('id', key=lambda ids: ids.astype('int64')))
+    outfile = config['filename_prefix'] + '_preview_' + str(args['startdate'].date()) + '---' \
+        + str(args['enddate'].date()) + '.' + args['output']
+    if args['output'] == 'pkl':
+        sample.to_pickle(outfile)
+    elif args['output'] == 'feather':
+        save_feather(sample, outfile)
+    else:
+        save_text(sample, outfile)
+    print('[INFO] - Saved a sample of ' + str(len(sample)) + ' tweets to ' + outfile)
+else:
+    print('[INFO] - No tweets found in the windows')
+
+# report connection reuse and close session
+n_requests, n_connections = session_stats(session)
+print('[INFO] - Sent ' + str(n_requests) + ' requests over ' + str(n_connections) + ' connections.')
+session.close()
+
+print('[INFO] - ... done!')
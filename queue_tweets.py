@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 17:26:14 2026
+
+INFO
+####
+
+This script spreads collection jobs over several machines through a shared
+work queue. The jobs of a jobs file (see multi_job_runner.py) are split into
+units, one per day of a search query, one per bounding box and interval of a
+bounding box grid and one per chunk of users of a user list, and published
+to a queue file on a shared drive. Workers started on any number of machines
+lease units from the queue, collect and save them, and mark them done.
+
+A worker renews the lease of its unit while collecting. If a worker dies or
+loses its connection, its lease runs out and the unit is leased again to
+another worker, so no unit is lost and each is saved by one worker. Units
+which fail three times are marked failed and can be put back with the retry
+mode.
+
+REQUIREMENTS
+############
+
+Files:
+    .twitter_keys.yaml in the script directory of every worker
+    a jobs yaml file and the files it refers to when publishing
+
+Installed:
+    Python 3.8 or newer
+
+    Python packages:
+        searchtweetsv2
+        pandas
+        geopandas
+
+USAGE
+#####
+
+Publish the units of the jobs to a queue by typing:
+
+    python queue_tweets.py -m publish -q /shared/queue.sqlite -j jobs.yaml
+
+Then start workers, as many as you like on each machine:
+
+    python queue_tweets.py -m work -q /shared/queue.sqlite
+
+See how far the collection is with:
+
+    python queue_tweets.py -m status -q /shared/queue.sqlite
+
+Publishing the same jobs again only adds units not in the queue yet, so a
+jobs file can be extended with new dates and published again.
+
+NOTE
+####
+
+Units keep the search config of the job, output format and output path, so
+the output path should be on the shared drive too, or the same on every
+machine. Workers on one bearer token share its rate limit, give each worker
+its share of requests per window with -rw.
+
+The queue file has to be on a file system with working file locks.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+from util_functions import v2parser, field_profile, TEXT_FORMATS, save_text, save_feather, daterange, order_columns, TWEET_COLUMNS, BBOX_COLUMNS, RateLimiter, make_pooled_session, stream_tweets, session_stats, WorkQueue
+from searchtweets import gen_request_parameters, load_credentials, read_config
+from datetime import datetime, timedelta
+import pandas as pd
+import geopandas as gpd
+import argparse
+import socket
+import time
+import yaml
+import os
+import gc
+
+# define function to generate request parameters of a unit
+def make_rule(query, config, start, end):
+    return gen_request_parameters(query = query,
+                                  results_per_call = config['results_per_call'],
+                                  start_time = start,
+                                  end_time = end,
+                                  **field_profile(config),
+                                  stringify = False)
+
+# define function to count tweets in collected messages
+def count_tweets(tweets):
+    return sum([d['result_count'] for d in tweets if 'result_count' in d.keys()])
+
+# define function to save parsed tweets
+def save_tweets(tweetdf, payload):
+
+    # get output path and format
+    path = payload['outpath'] + payload['file'] + '.' + payload['output']
+
+    # save to file
+    if payload['output'] == 'pkl':
+        tweetdf.to_pickle(path)
+    elif payload['output'] == 'feather':
+        save_feather(tweetdf, path)
+    elif payload['output'] in TEXT_FORMATS:
+        save_text(tweetdf, path)
+
+# define function to split a job into units of (key, job, payload)
+def job_units(spec):
+
+    # load configuration for search query, units carry it to the workers
+    config = read_config(spec['config'])
+    base = {'config': config, 'output': spec.get('output', 'pkl'), 'outpath': spec.get('outpath', '')}
+
+    # get dates
+    start_date = datetime.strptime(str(spec['startdate']), '%Y-%m-%d').date()
+    end_date = datetime.strptime(str(spec['enddate']), '%Y-%m-%d').date()
+
+    # one unit per day of a search query
+    if spec['type'] == 'query':
+        for single_date in daterange(start_date, end_date):
+            yield (spec['name'] + '/' + single_date.isoformat(), spec['name'],
+                   dict(base, queries=[config['query']], start=single_date.isoformat(),
+                        end=(single_date + timedelta(days=1)).isoformat(),
+                        file=config['filename_prefix'] + single_date.isoformat(), columns='tweet'))
+
+    # one unit per bounding box and interval of a grid
+    elif spec['type'] == 'bbox':
+        bbox_df = gpd.read_file(spec['bbox'])
+        interval = int(spec.get('interval', 1))
+        diff = (end_date - start_date) / interval
+        for intv in range(interval):
+            intstart = start_date + diff * intv
+            intend = start_date + diff * (intv + 1)
+            for i, bbox in bbox_df.iterrows():
+                search_q = f'bounding_box:[{bbox["left"]:.5f} {bbox["bottom"]:.5f} {bbox["right"]:.5f} {bbox["top"]:.5f}] -is:retweet -is:quote -is:reply'
+                yield (spec['name'] + '/' + str(intv) + '/' + str(i), spec['name'],
+                       dict(base, queries=[search_q], start=intstart.isoformat(), end=intend.isoformat(),
+                            file=config['filename_prefix'] + '_' + str(intstart) + '---' + str(intend)
+                            + '_part' + str(intv) + '_bbox' + str(i), columns='bbox'))
+
+    # one unit per chunk of users of a user list
+    elif spec['type'] == 'timeline':
+        users = pd.read_csv(spec['userlist'])['usr_id'].values.tolist()
+        chunksize = int(spec.get('chunksize', 20))
+        for pos in range(0, len(users), chunksize):
+            userchunk = users[pos:pos + chunksize]
+            yield (spec['name'] + '/' + str(userchunk[0]) + '-' + str(userchunk[-1]), spec['name'],
+                   dict(base, queries=['from:{} -is:retweet has:geo'.format(user) for user in userchunk],
+                        start=start_date.isoformat(), end=end_date.isoformat(),
+                        file=config['filename_prefix'] + start_date.isoformat() + '_from_' + str(userchunk[0])
+                        + '_to_' + str(userchunk[-1]), columns='tweet'))
+
+# define function to collect and save a unit, returns None if the lease was lost
+def run_unit(unit, lost):
+    payload = unit['payload']
+    config = payload['config']
+
+    # collect tweets of every query of the unit
+    tweets = []
+    for query in payload['queries']:
+        rule = make_rule(query, config, payload['start'], payload['end'])
+        tweets.extend(stream_tweets(session, endpoint, rule, config.get('max_tweets'), limiter))
+        if lost.is_set():
+            return None
+
+    # parse and save if there are results
+    count = count_tweets(tweets)
+    if count != 0:
+        tweetdf = v2parser(tweets, config['results_per_call'], field_profile(config))
+        tweetdf = order_columns(tweetdf, BBOX_COLUMNS if payload['columns'] == 'bbox' else TWEET_COLUMNS)
+        if lost.is_set():
+            return None
+        save_tweets(tweetdf, payload)
+        del tweetdf
+
+    # free memory
+    del tweets
+    gc.collect()
+
+    return count
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# get mode
+ap.add_argument("-m", "--mode", required=True, choices=['publish', 'work', 'status', 'retry'],
+                help="Publish units of a jobs file, work on units, show the state of "
+                "the queue or put failed units back in the queue")
+
+# get queue file
+ap.add_argument("-q", "--queue", required=True,
+                help="Path to the queue file on a shared drive. For example: /shared/queue.sqlite")
+
+# get jobs file
+ap.add_argument("-j", "--jobs", required=False, default=None,
+                help="Path to the jobs yaml file, needed for publishing. For example: jobs.yaml")
+
+# get lease time
+ap.add_argument("-l", "--lease", required=False, default=600, type=float,
+                help="Seconds a unit stays leased to a worker without it renewing the lease. "
+                "Default: 600")
+
+# get worker name
+ap.add_argument("-wk", "--worker", required=False, default=None,
+                help="Name of the worker in the queue. Default: host name and process id")
+
+# get requests per window of the worker
+ap.add_argument("-rw", "--requests", required=False, default=300, type=int,
+                help="Requests per 15 minute window of this worker. Default: 300")
+
+# get poll time
+ap.add_argument("-p", "--poll", required=False, default=30, type=float,
+                help="Seconds to wait before checking again when other workers hold the "
+                "remaining units. Default: 30")
+
+# get wait time
+ap.add_argument("-w", "--wait", required=False, default=15, type=float,
+                help="Seconds to wait after a failed unit. Default: 15")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# open queue
+queue = WorkQueue(args['queue'], lease=args['lease'])
+
+# publish units of every job
+if args['mode'] == 'publish':
+    if args['jobs'] is None:
+        ap.error('the following arguments are required for publish mode: -j/--jobs')
+    with open(args['jobs'], 'r', encoding='utf-8') as f:
+        jobsfile = yaml.safe_load(f)
+    for spec in jobsfile['jobs']:
+        units = list(job_units(spec))
+        added = queue.publish(units)
+        print('[INFO] - Published ' + str(added) + ' new of ' + str(len(units)) + ' units of ' + spec['type']
+              + ' job ' + spec['name'])
+
+# put failed units back
+elif args['mode'] == 'retry':
+    print('[INFO] - Put ' + str(queue.retry()) + ' failed units back in the queue')
+
+# work on units until none are left
+elif args['mode'] == 'work':
+    worker = args['worker'] or socket.gethostname() + ':' + str(os.getpid())
+
+    # load twitter keys and open one session and rate limiter for the worker
+    search_creds = load_credentials('.twitter_keys.yaml',
+                                    yaml_key = 'search_tweets_v2',
+                                    env_overwrite = False)
+    session = make_pooled_session(search_creds['bearer_token'], extra_headers_dict=search_creds.get('extra_headers_dict'))
+    endpoint = search_creds['endpoint']
+    limiter = RateLimiter(max_requests=args['requests'])
+
+    done = 0
+    while True:
+        unit = queue.lease(worker)
+
+        # wait for leases of other workers to finish or run out
+        if unit is None:
+            counts = queue.status().sum()
+            if counts['todo'] + counts['leased'] + counts['expired'] == 0:
+                break
+            time.sleep(args['poll'])
+            continue
+
+        # collect unit while renewing its lease
+        print('[INFO] - ' + worker + ': Collecting unit ' + unit['key'])
+        try:
+            with queue.keep_alive(unit) as lost:
+                count = run_unit(unit, lost)
+        except Exception as err:
+            print('[INFO] - ' + worker + ': Unit ' + unit['key'] + ' failed: ' + str(err))
+            queue.release(unit, err)
+            time.sleep(args['wait'])
+            continue
+
+        # mark unit done unless another worker took it over
+        if count is not None and queue.complete(unit, count):
+            print('[INFO] - ' + worker + ': Got ' + str(count) + ' tweets from unit ' + unit['key'])
+            done += 1
+        else:
+            print('[INFO] - ' + worker + ': Lost lease of unit ' + unit['key'] + ', leaving it to another worker')
+
+    # report connection reuse and close session
+    n_requests, n_connections = session_stats(session)
+    print('[INFO] - ' + worker + ': Finished ' + str(done) + ' units with ' + str(n_requests) + ' requests over '
+          + str(n_connections) + ' connections.')
+    session.close()
+
+# show units per job and state
+print('[INFO] - Units per job and state:')
+print(queue.status().to_string())
+
+print('[INFO] - ... done!')
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:41:27 2026
+
+INFO
+####
+
+This script keeps daily summary tables of collected tweets up to date: tweets
+per day, and per day and language, country code, place type and user. Only
+files which are new or have changed since the previous run are read, and the
+counts of a changed file replace its previous counts, so a rerun of a day or
+a late-arriving day updates only the days in that file.
+
+The tables are saved in the rollup directory as day.pkl, lang.pkl,
+country_code.pkl, place_type.pkl and user.pkl, with the counted columns and a
+tweets column. The directory also holds the counts of each rolled up file in
+the partials folder and a list of rolled up files in rollup_files.json. Files
+are listed by their path relative to the rollup directory, so files of the same
+name in different folders are counted separately.
+
+REQUIREMENTS
+############
+
+Files:
+    pickled or feather tweet dataframes from any of the collector scripts
+
+Installed:
+    Python 3.8 or newer
+
+    Python packages:
+        pandas
+
+USAGE
+#####
+
+Run the script by typing:
+
+    python rollup_tweets.py -i path/to/results/ -r path/to/rollups/
+
+The rollups can also be updated after each saved file while collecting with
+the -ru flag of v2_tweets_to_file.py.
+
+NOTE
+####
+
+Days are in UTC.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+from util_functions import tweet_files, update_rollups, rebuild_rollups
+import argparse
+import os
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# get input directory
+ap.add_argument("-i", "--input", required=False, default='.',
+                help="Directory of the pickled or feather tweet dataframes. Default: current directory")
+
+# get rollup directory
+ap.add_argument("-r", "--rollups", required=True,
+                help="Directory of the rollup tables. For example: rollups/")
+
+# get rebuild mode
+ap.add_argument("-rb", "--rebuild", required=False, action='store_true',
+                help="Sum the rollup tables again from the counts of all rolled up "
+                "files, for example if a previous run was interrupted")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# rebuild tables from partial counts
+if args['rebuild'] and os.path.isdir(os.path.join(args['rollups'], 'partials')):
+    print('[INFO] - Rebuilding rollups...')
+    rebuild_rollups(args['rollups'])
+
+# roll up new and changed files
+print('[INFO] - Updating rollups...')
+updated = update_rollups(args['rollups'], tweet_files(args['input']))
+print('[INFO] - Rolled up ' + str(len(updated)) + ' new or changed files')
+
+print('[INFO] - ... done!')
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers of the tests: the repository root on the import path,
+synthetic pages of the Twitter API v2 full-archive search response and a
+local server answering search requests with them.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+# repository root with the scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# start of twitter snowflake ids in milliseconds
+TWITTER_EPOCH = 1288834974657
+
+# function to make a snowflake id of a time
+def snowflake(dt, seq=0):
+    return str(((int(dt.timestamp() * 1000) - TWITTER_EPOCH) << 22) | seq)
+
+# function to make synthetic tweets spread over a day
+def make_tweets(n, day='2020-01-01', seed=0, users=5):
+    '''
+    Returns n tweets as the api gives them out, every third with point
+    coordinates, every fourth a reply and every fifth with a photo.
+    '''
+    start = datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+    tweets = []
+    for k in range(n):
+        dt = start + timedelta(seconds=(k * 86399 // max(n, 1)))
+        tid = snowflake(dt, seed * 1000 + k)
+        tweet = {'id': tid, 'author_id': str(k % users + 1), 'conversation_id': tid,
+                 'created_at': dt.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                 'text': 'hello #tag%d @user%d weather %d' % (k % 3, k % 4, seed),
+                 'lang': ['fi', 'en', 'sv'][k % 3], 'reply_settings': 'everyone',
+                 'possibly_sensitive': False,
+                 'public_metrics': {'retweet_count': k % 4, 'reply_count': 0, 'like_count': k % 7, 'quote_count': 0},
+                 'entities': {'hashtags': [{'start': 6, 'end': 11, 'tag': 'tag%d' % (k % 3)}],
+                              'mentions': [{'start': 12, 'end': 18, 'username': 'user%d' % (k % 4), 'id': str(k % 4 + 1)}]},
+                 'geo': {'place_id': 'pl%d' % (k % 2)}}
+        if k % 3 == 0:
+            tweet['geo']['coordinates'] = {'type': 'Point', 'coordinates': [24.9 + k / 1000, 60.1 + k / 1000]}
+        if k % 4 == 1:
+            tweet['referenced_tweets'] = [{'type': 'replied_to', 'id': snowflake(dt - timedelta(hours=1), k)}]
+            tweet['in_reply_to_user_id'] = str((k + 1) % users + 1)
+        if k % 5 == 0:
+            tweet['attachments'] = {'media_keys': ['3_%d' % k]}
+        tweets.append(tweet)
+    tweets.sort(key=lambda t: -int(t['id']))
+    return tweets
+
+# function to make the includes object of a page of tweets
+def make_includes(tweets):
+    users = sorted({t['author_id'] for t in tweets})
+    includes = {'users': [{'id': u, 'username': 'user' + u, 'name': 'User ' + u,
+                           'created_at': '2012-01-01T00:00:00.000Z', 'location': 'Helsinki',
+                           'protected': False, 'verified': False, 'description': 'd',
+                           'public_metrics': {'followers_count': 1, 'following_count': 2,
+                                              'tweet_count': 3, 'listed_count': 0}} for u in users],
+                'places': [{'id': 'pl%d' % i, 'full_name': 'Place %d' % i, 'name': 'P%d' % i,
+                            'country': 'Finland', 'country_code': 'FI', 'place_type': 'city',
+                            'geo': {'type': 'Feature', 'bbox': [24.0 + i, 60.0, 25.0 + i, 60.5],
+                                    'properties': {}}} for i in range(2)]}
+    media = [{'media_key': key, 'type': 'photo'} for t in tweets for key in t.get('attachments', {}).get('media_keys', [])]
+    if media:
+        includes['media'] = media
+    refs = [ref for t in tweets for ref in t.get('referenced_tweets', [])]
+    if refs:
+        includes['tweets'] = [{'id': ref['id'], 'author_id': '9', 'text': 'ref'} for ref in refs]
+    return includes
+
+# function to make response pages of tweets
+def make_pages(tweets, per_page=10, includes=True):
+    pages = []
+    for i in range(0, max(len(tweets), 1), per_page):
+        data = tweets[i:i + per_page]
+        meta = {'result_count': len(data)}
+        page = {'meta': meta}
+        if data:
+            meta['newest_id'] = data[0]['id']
+            meta['oldest_id'] = data[-1]['id']
+            page['data'] = data
+            if includes:
+                page['includes'] = make_includes(data)
+        if i + per_page < len(tweets):
+            meta['next_token'] = str(i + per_page)
+        pages.append(page)
+    return pages
+
+# function to turn pages to the message list v2parser expects
+def make_messages(pages):
+    from util_functions import page_messages
+    return [message for page in pages for message in page_messages(page)]
+
+# function to parse synthetic tweets to a dataframe as the collectors save them
+def make_frame(n, day='2020-01-01', seed=0, per_page=10):
+    from util_functions import v2parser
+    return v2parser(make_messages(make_pages(make_tweets(n, day, seed), per_page)), 1)
+
+# function to run a script of the repository in a folder
+def run_script(script, args, cwd):
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, script)] + [str(arg) for arg in args],
+                          cwd=cwd, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    return proc
+
+# function to parse a request time of the api
+def api_time(value):
+    return datetime.fromisoformat(value.replace('Z', '').replace(' ', 'T')).replace(tzinfo=timezone.utc)
+
+# class to answer full-archive search requests with synthetic tweets
+class SearchHandler(BaseHTTPRequestHandler):
+    '''
+    Answers searches with make_tweets(per_day) for every day of the request,
+    paged by max_results and next_token and cut by since_id. Queries with
+    "nothing" have no tweets and tweets of from:<user id> queries are by the
+    user. Requests are recorded in server.requests.
+    '''
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_GET(self):
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+        
+        # tweets of the days of the request
+        end = api_time(params['end_time']) if 'end_time' in params else datetime(2020, 1, 2, tzinfo=timezone.utc)
+        start = api_time(params['start_time']) if 'start_time' in params else end - timedelta(days=1)
+        if 'since_id' in params and 'start_time' not in params:
+            start = datetime.fromtimestamp(((int(params['since_id']) >> 22) + TWITTER_EPOCH) // 1000, timezone.utc)
+        seed = zlib.crc32(params['query'].encode()) % 100
+        tweets = []
+        if 'nothing' not in params['query']:
+            day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+            while day < end:
+                tweets += make_tweets(self.server.per_day, day.date().isoformat(), seed)
+                day += timedelta(days=1)
+        tweets = [t for t in tweets if start <= api_time(t['created_at']) < end]
+        if params['query'].startswith('from:'):
+            for tweet in tweets:
+                tweet['author_id'] = params['query'].split()[0][5:]
+        if 'since_id' in params:
+            tweets = [t for t in tweets if int(t['id']) > int(params['since_id'])]
+        tweets.sort(key=lambda t: -int(t['id']))
+        
+        # page of the request with requested fields and expansions
+        per_page = int(params.get('max_results', 10))
+        offset = int(params.get('next_token', 0))
+        fields = set(params.get('tweet.fields', '').split(',')) | {'id', 'text'}
+        page = [{k: v for k, v in t.items() if k in fields} for t in tweets[offset:offset + per_page]]
+        body = {'meta': {'result_count': len(page)}}
+        if page:
+            body['data'] = page
+            body['meta']['newest_id'] = page[0]['id']
+            body['meta']['oldest_id'] = page[-1]['id']
+            if params.get('expansions'):
+                body['includes'] = make_includes(tweets[offset:offset + per_page])
+        if offset + per_page < len(tweets):
+            body['meta']['next_token'] = str(offset + per_page)
+        
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+# fixture of a local search api, with twitter keys pointing to it written by write_keys
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SearchHandler)
+    server.requests = []
+    server.per_day = 12
+    server.endpoint = 'http://127.0.0.1:' + str(server.server_address[1]) + '/2/tweets/search/all'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+# function to write a search config
+def write_config(path, query='weather has:geo', prefix='tweets', results_per_call=10, profile=None, name='search_config.yaml'):
+    with open(os.path.join(str(path), name), 'w') as f:
+        f.write('search_rules:\n    query: ' + query + '\n    tag: test\n'
+                + ('    field_profile: ' + profile + '\n' if profile else '')
+                + 'search_params:\n    results_per_call: ' + str(results_per_call) + '\n    max_tweets: 100000\n'
+                'output_params:\n    filename_prefix: ' + prefix + '\n    results_per_file: 1000000\n')
+
+# function to write twitter keys and a search config for the local api
+def write_keys(path, api, **config):
+    with open(os.path.join(str(path), '.twitter_keys.yaml'), 'w') as f:
+        f.write('search_tweets_v2:\n  endpoint: ' + api.endpoint + '\n  consumer_key: x\n'
+                '  consumer_secret: y\n  bearer_token: z\n')
+    write_config(path, **config)
+
+# function to write a bounding box grid like the ones made with mmqgis
+def write_bbox(path, n=3, size=0.5):
+    import geopandas as gpd
+    from shapely.geometry import box
+    cells = [(24.0 + i * size, 60.0, 24.0 + (i + 1) * size, 60.0 + size) for i in range(n)]
+    gpd.GeoDataFrame({'left': [c[0] for c in cells], 'bottom': [c[1] for c in cells],
+                      'right': [c[2] for c in cells], 'top': [c[3] for c in cells]},
+                     geometry=[box(*c) for c in cells], crs='EPSG:4326').to_file(str(path), driver='GPKG')
+    return str(path)
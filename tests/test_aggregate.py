@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that grid cells of coordinates are the nearest cells of each grid
+type, that aggregates count tweets like a groupby of the binned tweets, and
+that aggregate_tweets.py -u gives the same table as aggregating all files.
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+from conftest import ROOT, make_frame, run_script
+from util_functions import cell_index, cell_centers, cell_ids, aggregate_tweets, finish_aggregate, tweet_coordinates
+
+# function to encode a geohash bit by bit
+def geohash(x, y, precision):
+    lon, lat = [-180.0, 180.0], [-90.0, 90.0]
+    bits = ''
+    while len(bits) < 5 * precision:
+        box, value = (lon, x) if len(bits) % 2 == 0 else (lat, y)
+        mid = (box[0] + box[1]) / 2
+        bits += '1' if value >= mid else '0'
+        box[int(value < mid)] = mid
+    return ''.join('0123456789bcdefghjkmnpqrstuvwxyz'[int(bits[k:k + 5], 2)] for k in range(0, len(bits), 5))
+
+def test_geohash_cells():
+    i, j = cell_index([10.40744], [57.64911], 'geohash', 11)
+    assert cell_ids(i, j, 'geohash', 11).tolist() == ['u4pruydqqvj']
+
+    rng = np.random.default_rng(5)
+    x, y = rng.uniform(-180, 180, 200), rng.uniform(-90, 90, 200)
+    for precision in [1, 4, 7]:
+        i, j = cell_index(x, y, 'geohash', precision)
+        assert cell_ids(i, j, 'geohash', precision).tolist() == [geohash(a, b, precision) for a, b in zip(x, y)]
+
+def test_hexagons_are_nearest():
+    rng = np.random.default_rng(6)
+    x, y = rng.uniform(-5000, 5000, 2000), rng.uniform(-5000, 5000, 2000)
+    i, j = cell_index(x, y, 'hex', 250)
+    cx, cy = cell_centers(i, j, 'hex', 250)
+    assert (np.hypot(x - cx, y - cy) <= 250 + 1e-9).all()
+
+    # no neighbouring hexagon has a center closer to the point
+    for di, dj in [(1, 0), (-1, 0), (0, 1), (0, -1), (1, -1), (-1, 1)]:
+        nx, ny = cell_centers(i + di, j + dj, 'hex', 250)
+        assert (np.hypot(x - cx, y - cy) <= np.hypot(x - nx, y - ny) + 1e-9).all()
+
+def test_square_cells():
+    i, j = cell_index([0.5, -0.5, 2.0], [1.99, -1.01, 0.0], 'square', 1)
+    assert i.tolist() == [0, -1, 2] and j.tolist() == [1, -2, 0]
+    assert cell_ids(i, j, 'square', 1).tolist() == ['0_1', '-1_-2', '2_0']
+
+def test_aggregate_matches_groupby():
+    tweets = pd.concat([make_frame(30, '2020-01-01'), make_frame(30, '2020-01-02', seed=1)], ignore_index=True)
+    x, y, gps = tweet_coordinates(tweets)
+    located = ~np.isnan(x)
+    expected = pd.DataFrame({'i': np.floor(x[located] / 0.01).astype(int), 'j': np.floor(y[located] / 0.01).astype(int),
+                             'time_bin': tweets['created_at'].dt.floor('D').dt.tz_localize(None)[located].to_numpy(),
+                             'tweets': 1, 'gps': gps[located].astype(int)})
+    expected = expected.groupby(['i', 'j', 'time_bin'], as_index=False)[['tweets', 'gps']].sum()
+
+    agg = finish_aggregate([aggregate_tweets(tweets.iloc[:25], 'square', 0.01, 'day'),
+                            aggregate_tweets(tweets.iloc[25:], 'square', 0.01, 'day')], 'square', 0.01)
+    pd.testing.assert_frame_equal(agg[['i', 'j', 'time_bin', 'tweets', 'gps']], expected, check_dtype=False)
+    assert np.allclose(agg['x'], (agg['i'] + 0.5) * 0.01)
+
+    # subtracting counts drops cells left without tweets
+    first = aggregate_tweets(tweets.iloc[:25], 'square', 0.01, 'day')
+    left = finish_aggregate([first, first.assign(tweets=-first['tweets'], gps=-first['gps'])], 'square', 0.01)
+    assert len(left) == 0 and 'cell' in left.columns
+
+# function to aggregate the tweet files of a folder
+def aggregate(path, *extra):
+    return run_script('aggregate_tweets.py', ['-i', 'tweets', '-o', 'counts.pkl', '-g', 'square', '-cs', '1000',
+                                              '-c', 'EPSG:3067'] + list(extra), path)
+
+def test_update_matches_full_run(tmp_path):
+    os.mkdir(tmp_path / 'tweets')
+    for day in range(3):
+        make_frame(20, '2020-01-0' + str(day + 1), seed=day).to_pickle(tmp_path / 'tweets' / ('t' + str(day) + '.pkl'))
+    aggregate(tmp_path)
+
+    # a new day and a changed day
+    make_frame(20, '2020-01-04', seed=3).to_pickle(tmp_path / 'tweets' / 't3.pkl')
+    make_frame(7, '2020-01-01', seed=9).to_pickle(tmp_path / 'tweets' / 't0.pkl')
+    proc = aggregate(tmp_path, '-u')
+    assert 'Aggregated 1 new and 1 changed files' in proc.stdout
+    updated = pd.read_pickle(tmp_path / 'counts.pkl')
+    aggregate(tmp_path)
+    full = pd.read_pickle(tmp_path / 'counts.pkl')
+    pd.testing.assert_frame_equal(updated.sort_values(['cell', 'time_bin']).reset_index(drop=True),
+                                  full.sort_values(['cell', 'time_bin']).reset_index(drop=True), check_dtype=False)
+    files = [pd.read_pickle(tmp_path / 'tweets' / ('t' + str(day) + '.pkl')) for day in range(4)]
+    assert full['tweets'].sum() == sum((~np.isnan(tweet_coordinates(data)[0])).sum() for data in files)
+
+    # a different grid cannot update the table
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, 'aggregate_tweets.py'), '-i', 'tweets', '-o', 'counts.pkl',
+                           '-g', 'hex', '-u'], cwd=tmp_path, capture_output=True, text=True)
+    assert proc.returncode != 0 and 'run without -u' in proc.stderr
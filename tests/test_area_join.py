@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that join_areas gives tweets the ids of the areas a spatial join of
+their coordinates gives, and that cached keys are reused between calls and
+runs of combine_tweets.py.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import make_frame, run_script
+from util_functions import join_areas, area_keys, tweet_coordinates, read_tweets, read_area_cache
+
+gpd = pytest.importorskip('geopandas')
+from shapely.geometry import box
+
+# function to make a grid of areas with ids and an overlapping area at the end
+def make_areas():
+    cells = [box(24.8 + i * 0.05, 60.0 + j * 0.05, 24.85 + i * 0.05, 60.05 + j * 0.05) for i in range(6) for j in range(6)]
+    return gpd.GeoDataFrame({'code': ['a' + str(k) for k in range(len(cells))] + ['overlap']},
+                            geometry=cells + [box(24.8, 60.0, 25.1, 60.3)], crs='EPSG:4326')
+
+# function to join areas with geopandas, first area of overlapping ones
+def sjoin_ids(tweets, areas):
+    x, y, gps = tweet_coordinates(tweets)
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(x, y), crs='EPSG:4326')
+    joined = gpd.sjoin(points, areas.reset_index(), how='left', predicate='intersects')
+    joined = joined.sort_values('index').groupby(level=0).first()
+    return [None if pd.isna(v) else v for v in joined['code'].reindex(points.index)]
+
+# function to get tweets with repeated coordinates and places
+def located_tweets(n=120):
+    tweets = pd.concat([make_frame(n // 2, seed=1), make_frame(n // 2, seed=1)], ignore_index=True)
+    tweets['id'] = [str(i) for i in range(len(tweets))]
+    return tweets
+
+def test_join_matches_sjoin():
+    tweets = located_tweets()
+    areas = make_areas()
+    joined, cache = join_areas(tweets, areas.geometry, areas['code'].to_numpy(), 'areas.code')
+    assert joined['areas.code'].tolist() == sjoin_ids(tweets, areas)
+    assert joined['areas.code'].notna().any() and joined['areas.code'].isna().any()
+
+    # each rounded coordinate and place is tested once
+    x, y, coord, place = area_keys(tweets)
+    assert len(cache['coord']) == len(set(coord[coord >= 0]))
+    assert len(cache['place']) == len(set(place[pd.notna(place)]))
+
+def test_cache_is_reused(capsys):
+    tweets = located_tweets()
+    areas = make_areas()
+    ids = areas['code'].to_numpy()
+    first, cache = join_areas(tweets, areas.geometry, ids, 'areas.code')
+    capsys.readouterr()
+
+    # a second batch is joined from the cache without testing the polygons
+    second, again = join_areas(tweets.iloc[::-1], gpd.GeoSeries([box(0, 0, 1, 1)] * len(ids)), ids, 'areas.code', cache)
+    assert ' 0 locations tested' in capsys.readouterr().out
+    assert second['areas.code'].tolist() == first['areas.code'].tolist()[::-1]
+    assert all(again[kind].equals(cache[kind]) for kind in cache)
+
+    # coarser rounding merges nearby coordinates to one key
+    coarse, coarse_cache = join_areas(tweets, areas.geometry, ids, 'areas.code', decimals=1)
+    assert len(coarse_cache['coord']) < len(cache['coord'])
+
+def test_combine_caches_areas(tmp_path):
+    located_tweets().to_pickle(tmp_path / 'tweets2020-01-01.pkl')
+    areas = make_areas()
+    areas.to_file(tmp_path / 'areas.gpkg')
+    args = ['-f', 'pkl', '-o', 'combined.pkl', '-ar', 'areas.gpkg:code', '-ac', 'areas_cache.pkl']
+    first = run_script('combine_tweets.py', args, tmp_path)
+    assert ' 0 from cache' in first.stdout
+    combined = read_tweets(str(tmp_path / 'combined.pkl'))
+    assert combined['areas.code'].tolist() == sjoin_ids(combined, areas)
+
+    second = run_script('combine_tweets.py', args, tmp_path)
+    assert ' 0 locations tested' in second.stdout
+    assert read_tweets(str(tmp_path / 'combined.pkl'))['areas.code'].tolist() == combined['areas.code'].tolist()
+
+    # an edited boundary file is not joined from the old cache
+    areas.iloc[:1].to_file(tmp_path / 'areas.gpkg')
+    os.utime(tmp_path / 'areas.gpkg', ns=(0, 0))
+    run_script('combine_tweets.py', args, tmp_path)
+    assert len(read_area_cache(str(tmp_path / 'areas_cache.pkl'))) == 2
+    assert set(read_tweets(str(tmp_path / 'combined.pkl'))['areas.code'].dropna()) <= {'a0'}
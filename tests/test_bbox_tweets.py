@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that bbox_tweets_to_file.py saves the tweets of an interval in
+numbered parts when they exceed the memory budget, with the same tweets as
+without a budget, and removes parts of earlier runs.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+from conftest import make_tweets, write_keys, write_bbox, run_script
+from util_functions import deep_sizeof
+
+pytest.importorskip('geopandas')
+
+# function to run the bbox collector against the local api
+def collect(path, api, *extra):
+    os.makedirs(path / 'out', exist_ok=True)
+    write_keys(path, api, results_per_call=100)
+    return run_script('bbox_tweets_to_file.py', ['-sd', '2020-01-01', '-ed', '2020-01-02', '-in', '1',
+                                                 '-b', write_bbox(path / 'bbox.gpkg'), '-o', 'out/'] + list(extra), path)
+
+# function to read the saved tweets of a folder
+def saved(path):
+    files = sorted(os.listdir(path))
+    return files, pd.concat([pd.read_pickle(os.path.join(path, file)) for file in files], ignore_index=True)
+
+def test_memory_budget_saves_parts(tmp_path, api):
+    collect(tmp_path / 'whole', api)
+    files, whole = saved(tmp_path / 'whole' / 'out')
+    assert files == ['tweets_2020-01-01---2020-01-02_part0.pkl']
+    assert len(whole) == 36
+
+    # a budget of one kilobyte saves every bounding box as a part of its own
+    proc = collect(tmp_path / 'parts', api, '-mb', '0.001')
+    assert proc.stdout.count('Memory budget exceeded') == 3
+    files, parts = saved(tmp_path / 'parts' / 'out')
+    assert files == ['tweets_2020-01-01---2020-01-02_part0_' + str(i) + '.pkl' for i in range(3)]
+    assert sorted(parts['id']) == sorted(whole['id'])
+    assert parts.columns.tolist() == whole.columns.tolist()
+
+    # a later run without the budget replaces the parts
+    collect(tmp_path / 'parts', api)
+    files, again = saved(tmp_path / 'parts' / 'out')
+    assert files == ['tweets_2020-01-01---2020-01-02_part0.pkl']
+    assert sorted(again['id']) == sorted(whole['id'])
+
+def test_deep_sizeof_counts_nested_objects_once():
+    tweets = make_tweets(10)
+    size = deep_sizeof(tweets)
+    assert size > sum(sys.getsizeof(t) for t in tweets)
+    assert deep_sizeof(tweets + tweets) == size + sys.getsizeof(tweets + tweets) - sys.getsizeof(tweets)
+    assert deep_sizeof(make_tweets(20)) > size
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that the collection history of bounding box cells plans dense cells
+in windows of the target size, skips empty cells and probes them again, and
+that bbox_tweets_to_file.py -hs collects the same tweets in split windows.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from conftest import write_keys, write_bbox, run_script
+from util_functions import read_cell_history, update_cell_history, cell_stats, plan_cells
+
+# start and end of the planned interval
+START, END = datetime(2020, 1, 1), datetime(2020, 1, 3)
+
+# function to make a history of cells with their tweets per day
+def make_history(path, rates, days=10, run=datetime(2019, 12, 31)):
+    rows = [(cell, START - timedelta(days=days), START, rate * days, False, run) for cell, rate in rates.items()]
+    return update_cell_history(str(path), read_cell_history(str(path)), rows)
+
+def test_stats_and_updates(tmp_path):
+    path = tmp_path / 'history.pkl'
+    history = make_history(path, {'a': 10, 'b': 0})
+    history = update_cell_history(str(path), history, [('a', START, START + timedelta(days=1), 50, True, START),
+                                                       ('b', START - timedelta(days=10), START, 3, False, START)])
+    assert len(read_cell_history(str(path))) == 3
+    stats = cell_stats(history)
+    assert stats.loc['a', 'days'] == 11 and stats.loc['a', 'tweets'] == 150
+    assert stats.loc['a', 'rate'] == pytest.approx((100 + 2 * 50) / 11)
+    assert stats.loc['b', 'tweets'] == 3 and stats.loc['b', 'truncated'] == 0
+
+def test_plan_splits_dense_cells(tmp_path):
+    history = make_history(tmp_path / 'history.pkl', {'dense': 1000, 'mid': 300, 'sparse': 10, 'empty': 0}, days=400)
+    keys = ['sparse', 'new', 'dense', 'empty', 'mid']
+    tasks = plan_cells(keys, cell_stats(history), START, END, target=500, now=START)
+
+    # dense cells take turns with sparse ones, new cells come last
+    assert [pos for pos, _, _ in tasks] == [2, 0, 4, 2, 4, 2, 2, 1]
+    windows = {pos: [(s, e) for p, s, e in tasks if p == pos] for pos in set(p for p, _, _ in tasks)}
+    assert len(windows[2]) == 4 and len(windows[4]) == 2 and windows[0] == [(START, END)]
+    for spans in windows.values():
+        assert spans[0][0] == START and spans[-1][1] == END
+        assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+
+    # empty cells are probed again when their last run is old, or collected with skip_days 0
+    assert 3 in [pos for pos, _, _ in plan_cells(keys, cell_stats(history), START, END, 500, now=START + timedelta(days=100))]
+    assert 3 in [pos for pos, _, _ in plan_cells(keys, cell_stats(history), START, END, 500, skip_days=0)]
+
+# function to run the bbox collector with a cell history against the local api
+def collect(path, api, *extra):
+    os.makedirs(path / 'out', exist_ok=True)
+    write_keys(path, api, results_per_call=100)
+    return run_script('bbox_tweets_to_file.py', ['-sd', '2020-01-01', '-ed', '2020-01-02', '-in', '1',
+                                                 '-b', write_bbox(path / 'bbox.gpkg', n=2), '-o', 'out/',
+                                                 '-hs', 'history.pkl'] + list(extra), path)
+
+def test_bbox_history_splits_windows(tmp_path, api):
+    pytest.importorskip('geopandas')
+    collect(tmp_path, api)
+    first = pd.read_pickle(tmp_path / 'out' / 'tweets_2020-01-01---2020-01-02_part0.pkl')
+    assert read_cell_history(str(tmp_path / 'history.pkl'))['tweets'].tolist() == [12, 12]
+
+    # twelve tweets a day in windows of five tweets
+    api.requests.clear()
+    proc = collect(tmp_path, api, '-tw', '5')
+    assert 'Collecting 2 bounding boxes in 6 windows' in proc.stdout
+    assert len(api.requests) == 6
+    again = pd.read_pickle(tmp_path / 'out' / 'tweets_2020-01-01---2020-01-02_part0.pkl')
+    assert sorted(again['id']) == sorted(first['id'])
+    assert len(read_cell_history(str(tmp_path / 'history.pkl'))) == 2 + 6
+
+def test_bbox_history_skips_empty_cells(tmp_path, api):
+    pytest.importorskip('geopandas')
+    api.per_day = 0
+    collect(tmp_path, api, '-se', '1')
+    api.per_day = 12
+    api.requests.clear()
+    proc = collect(tmp_path, api, '-se', '1')
+    assert 'skipping 2 empty bounding boxes' in proc.stdout
+    assert api.requests == []
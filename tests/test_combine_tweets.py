@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that combine_tweets.py with -u adds only new and changed files, also
+to an output combined earlier without -u.
+"""
+
+import json
+
+import pytest
+
+from conftest import make_frame, run_script
+from util_functions import read_tweets
+
+# function to read a combined output
+def read_output(path):
+    if path.endswith('.gpkg'):
+        geopandas = pytest.importorskip('geopandas')
+        return geopandas.read_file(path)
+    return read_tweets(path)
+
+# function to save a few days of tweets as the collectors do
+def collect_days(path, days=2, n=5):
+    for day in range(days):
+        make_frame(n, '2020-01-0' + str(day + 1), seed=day).to_pickle(path / ('tweets2020-01-0' + str(day + 1) + '.pkl'))
+
+@pytest.mark.parametrize('filetype', ['pkl', 'csv', 'gpkg'])
+def test_update_after_plain_combine(filetype, tmp_path):
+    collect_days(tmp_path)
+    output = 'combined.' + filetype
+    run_script('combine_tweets.py', ['-f', filetype, '-o', output], tmp_path)
+    run_script('combine_tweets.py', ['-f', filetype, '-o', output, '-u'], tmp_path)
+
+    data = read_output(str(tmp_path / output))
+    assert len(data) == 10
+    assert not data['id'].duplicated().any()
+
+    # the rebuilt output lists its files, so the next update adds only the new day
+    manifest = 'combined_combined_manifest.json' if filetype == 'gpkg' else 'combined_' + filetype + '_manifest.json'
+    with open(tmp_path / manifest) as f:
+        assert len(json.load(f)['files']) == 2
+    make_frame(5, '2020-01-03', seed=2).to_pickle(tmp_path / 'tweets2020-01-03.pkl')
+    proc = run_script('combine_tweets.py', ['-f', filetype, '-o', output, '-u'], tmp_path)
+    assert 'combining all files again' not in proc.stdout
+    data = read_output(str(tmp_path / output))
+    assert len(data) == 15
+    assert not data['id'].duplicated().any()
+
+def test_update_replaces_changed_file(tmp_path):
+    collect_days(tmp_path)
+    run_script('combine_tweets.py', ['-f', 'pkl', '-o', 'combined.pkl', '-u'], tmp_path)
+    make_frame(3, '2020-01-02', seed=5).to_pickle(tmp_path / 'tweets2020-01-02.pkl')
+    run_script('combine_tweets.py', ['-f', 'pkl', '-o', 'combined.pkl', '-u'], tmp_path)
+
+    data = read_tweets(str(tmp_path / 'combined.pkl'))
+    assert len(data) == 8
+    assert data['source_file'].value_counts().to_dict() == {'tweets2020-01-01.pkl': 5, 'tweets2020-01-02.pkl': 3}
+
+# function to combine all files of a folder again in another output to compare updates to
+def combine_again(path, filetype, output):
+    run_script('combine_tweets.py', ['-f', filetype, '-o', 'again_' + output, '-u'], path)
+    return read_tweets(str(path / output)), read_tweets(str(path / ('again_' + output)))
+
+@pytest.mark.parametrize('filetype', ['csv', 'jsonl.gz'])
+def test_text_update_matches_combining_again(filetype, tmp_path):
+    collect_days(tmp_path)
+    output = 'combined.' + filetype
+    run_script('combine_tweets.py', ['-f', filetype, '-o', output, '-u'], tmp_path)
+
+    # a changed day and a new day with a column the output does not have yet
+    make_frame(3, '2020-01-02', seed=5).to_pickle(tmp_path / 'tweets2020-01-02.pkl')
+    make_frame(4, '2020-01-03', seed=2).assign(extra='x').to_pickle(tmp_path / 'tweets2020-01-03.pkl')
+    proc = run_script('combine_tweets.py', ['-f', filetype, '-o', output, '-u'], tmp_path)
+    assert '1 new and 1 changed files' in proc.stdout
+    if filetype == 'csv':
+        assert 'Adding columns extra' in proc.stdout
+    proc = run_script('combine_tweets.py', ['-f', filetype, '-o', output, '-u'], tmp_path)
+    assert 'is up to date' in proc.stdout
+
+    updated, again = combine_again(tmp_path, filetype, output)
+    assert len(updated) == 12
+    assert updated.index.tolist() == list(range(12))
+    updated = updated.set_index('id').sort_index()
+    again = again.set_index('id').sort_index()
+    assert updated['source_file'].equals(again['source_file'])
+    assert updated['extra'].fillna('').tolist() == again['extra'].fillna('').tolist()
+    assert (updated['extra'] == 'x').sum() == 4
+    assert updated['created_at'].equals(again['created_at'])
+
+def test_update_replaces_entity_rows(tmp_path):
+    collect_days(tmp_path)
+    run_script('combine_tweets.py', ['-f', 'pkl', '-o', 'combined.pkl', '-u', '-et'], tmp_path)
+    make_frame(3, '2020-01-02', seed=5).to_pickle(tmp_path / 'tweets2020-01-02.pkl')
+    run_script('combine_tweets.py', ['-f', 'pkl', '-o', 'combined.pkl', '-u', '-et'], tmp_path)
+    hashtags = read_tweets(str(tmp_path / 'combined_hashtags.pkl'))
+    assert sorted(hashtags['tweet_id']) == sorted(read_tweets(str(tmp_path / 'combined.pkl'))['id'])
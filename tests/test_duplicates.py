@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that tweets from the same template get the same word pairs and
+cluster together, that MinHash signatures estimate the share of common word
+pairs, and that clusters updated file by file are the clusters of all files
+at once.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import run_script
+from util_functions import text_shingles, minhash_signatures, update_duplicates, read_duplicates, MINHASH_BANDS, MINHASH_ROWS
+
+# words of random texts
+WORDS = ['sun', 'rain', 'helsinki', 'coffee', 'bus', 'park', 'sea', 'snow', 'dog', 'run', 'book', 'night', 'city', 'tram']
+
+# function to make tweets of templates with numbers and of random words
+def make_texts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    texts = []
+    for k in range(n):
+        if k % 3 == 0:
+            texts.append('Temperature %d.%d C, wind %d m/s, humidity %d%% #weather https://t.co/%d'
+                         % (rng.integers(-20, 30), k % 10, rng.integers(0, 20), rng.integers(20, 100), k))
+        elif k % 3 == 1:
+            texts.append('@user%d I just checked in at Cafe %d in Helsinki' % (k, rng.integers(1, 9)))
+        else:
+            texts.append(' '.join(rng.choice(WORDS, 12)))
+    return texts
+
+def test_templates_get_same_shingles():
+    shingles, counts = text_shingles(['Wind 5 m/s @a https://t.co/x', 'WIND 12 m/s @b http://t.co/y', 'wind five m/s', 'one', '', None])
+    assert counts.tolist() == [5, 5, 3, 1, 0, 0]
+    assert shingles[:5].tolist() == shingles[5:10].tolist()
+    assert shingles[10:13].tolist() != shingles[:3].tolist()
+    assert len(shingles) == 14
+
+def test_signatures_estimate_jaccard():
+    rng = np.random.default_rng(2)
+    texts = [' '.join(rng.choice(WORDS, 30)) for _ in range(40)]
+    shingles, counts = text_shingles(texts)
+    signatures = minhash_signatures(shingles, counts)
+    assert signatures.shape == (40, MINHASH_BANDS * MINHASH_ROWS)
+    assert (minhash_signatures(shingles, counts, chunk=7) == signatures).all()
+
+    sets = np.split(shingles, np.cumsum(counts)[:-1])
+    errors = []
+    for i in range(0, 40, 2):
+        a, b = set(sets[i].tolist()), set(sets[i + 1].tolist())
+        errors.append(abs(len(a & b) / len(a | b) - (signatures[i] == signatures[i + 1]).mean()))
+    assert np.mean(errors) < 0.1
+
+# function to get clusters of tweets as sets of ids
+def partition(tweets):
+    clustered = tweets[tweets['cluster'] >= 0]
+    return sorted(sorted(group) for group in clustered.groupby('cluster')['id'].apply(list))
+
+# function to save tweets of texts in files of a folder
+def save_files(path, texts, sizes):
+    os.makedirs(path, exist_ok=True)
+    tweets = pd.DataFrame({'id': [str(1000 + k) for k in range(len(texts))], 'author_id': [str(k % 4) for k in range(len(texts))],
+                           'text': texts})
+    files = []
+    for i, (start, stop) in enumerate(zip(np.r_[0, np.cumsum(sizes)[:-1]], np.cumsum(sizes))):
+        files.append(str(path / ('t' + str(i) + '.pkl')))
+        tweets.iloc[start:stop].to_pickle(files[-1])
+    return files
+
+def test_update_matches_clustering_all(tmp_path):
+    texts = make_texts(150)
+    texts[-1] = None
+    files = save_files(tmp_path / 'tweets', texts, [60, 40, 50])
+    for i in range(len(files)):
+        update_duplicates(str(tmp_path / 'each'), files[i:i + 1])
+    update_duplicates(str(tmp_path / 'all'), files)
+    each = read_duplicates(str(tmp_path / 'each'))
+    full = read_duplicates(str(tmp_path / 'all'))
+    assert partition(each) == partition(full)
+    assert each.loc[each['id'] == '1149', 'cluster'].tolist() == [-1]
+
+    # the two templates are the largest clusters
+    sizes = full.loc[full['cluster'] >= 0].groupby('cluster')['id'].size().sort_values()
+    templates = [set(full.loc[full['cluster'] == cluster, 'id']) for cluster in sizes.index[-2:]]
+    assert sorted(len(t) for t in templates) == [50, 50]
+    assert all(len({int(i) % 3 for i in t}) == 1 for t in templates)
+    assert update_duplicates(str(tmp_path / 'each'), files) == []
+
+def test_duplicate_script(tmp_path):
+    save_files(tmp_path / 'tweets', make_texts(90), [45, 45])
+    proc = run_script('duplicate_tweets.py', ['-i', 'tweets', '-d', 'dups', '-ms', '10', '-mt', '10', '-sh', '0.5'], tmp_path)
+    assert 'Clustered 2 new or changed files' in proc.stdout
+    assert '60 of 90 tweets are in 2 templates' in proc.stdout
+    authors = pd.read_pickle(tmp_path / 'dups' / 'template_authors.pkl')
+    assert len(authors) == 4
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that entity_tables gives the same rows as exploding the entity lists
+of each tweet one by one, and that v2_tweets_to_file.py saves the tables
+next to the tweets.
+"""
+
+import numpy as np
+import pandas as pd
+
+from conftest import make_frame, write_keys, run_script
+from util_functions import entity_tables, save_entities, read_tweets, ENTITY_TABLES
+
+# function to explode the entities of tweets with a loop
+def explode(tweetdf, col, keys):
+    rows = []
+    for tid, created, cell in zip(tweetdf['id'], tweetdf['created_at'], tweetdf[col]):
+        if isinstance(cell, list):
+            for position, entity in enumerate(cell):
+                row = {'tweet_id': tid, 'created_at': created, 'position': position,
+                       'start': entity.get('start'), 'end': entity.get('end')}
+                row.update({column: entity.get(key) for key, column in keys.items()})
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+def test_tables_match_explode():
+    tweets = make_frame(40)
+    tweets.at[3, 'entities.hashtags'] = [{'start': 0, 'end': 4, 'tag': 'a'}, {'start': 5, 'end': 9, 'tag': 'b'}]
+    tweets.at[4, 'entities.hashtags'] = []
+    tweets.at[5, 'entities.mentions'] = None
+    tables = entity_tables(tweets)
+    assert sorted(tables) == ['hashtags', 'mentions']
+    for name in tables:
+        col, keys = ENTITY_TABLES[name]
+        expected = explode(tweets, col, keys)
+        assert tables[name].columns.tolist() == expected.columns.tolist()
+        pd.testing.assert_frame_equal(tables[name], expected, check_dtype=False)
+    assert len(tables['hashtags']) == 40 and len(tables['mentions']) == 39
+    assert tables['hashtags']['start'].dtype == np.int64
+
+def test_missing_offsets_and_values():
+    tweets = pd.DataFrame({'id': ['1', '2'],
+                           'entities.urls': [[{'url': 'u', 'start': 1}], [{'expanded_url': 'e'}]]})
+    urls = entity_tables(tweets)['urls']
+    assert 'created_at' not in urls.columns
+    assert urls['start'].isna().tolist() == [False, True]
+    assert urls['url'].tolist() == ['u', None]
+    assert urls['expanded_url'].tolist() == [None, 'e']
+
+def test_save_entities_replaces_updated_tweets(tmp_path):
+    tweets = make_frame(10)
+    prefix = str(tmp_path / 'tweets')
+    save_entities(entity_tables(tweets), prefix, 'pkl')
+    changed = tweets.iloc[:2].copy()
+    changed['entities.hashtags'] = [[{'start': 0, 'end': 1, 'tag': 'new'}]] * 2
+    save_entities(entity_tables(changed), prefix, 'pkl', update_ids=changed['id'].tolist())
+    hashtags = read_tweets(prefix + '_hashtags.pkl')
+    assert len(hashtags) == 10
+    assert hashtags.loc[hashtags['tweet_id'].isin(changed['id']), 'tag'].tolist() == ['new', 'new']
+
+def test_collector_saves_entity_tables(tmp_path, api):
+    write_keys(tmp_path, api, results_per_call=100)
+    run_script('v2_tweets_to_file.py', ['-s', 'iterative', '-o', 'csv', '-sd', '2020-01-01', '-ed', '2020-01-02', '-et'], tmp_path)
+    tweets = read_tweets(str(tmp_path / 'tweets2020-01-01.csv'))
+    hashtags = read_tweets(str(tmp_path / 'tweets2020-01-01_hashtags.csv'))
+    assert sorted(hashtags['tweet_id'].astype(str)) == sorted(tweets['id'].astype(str))
+    assert set(hashtags['tag']) == {'tag0', 'tag1', 'tag2'}
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that tweets saved as feather files read back as the dataframes the
+collectors make, and that feather files of different schemas concatenate
+like pd.concat of the dataframes.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_frame, run_script
+from util_functions import save_feather, read_table, concat_tables, table_to_frame, constant_column, read_tweets
+
+pa = pytest.importorskip('pyarrow')
+
+# function to compare values of two dataframes with missing values as None
+def assert_same_values(left, right):
+    assert left.columns.tolist() == right.columns.tolist()
+    for col in left.columns:
+        values = [[None if not isinstance(v, (list, dict)) and pd.isna(v) else v for v in frame[col]] for frame in (left, right)]
+        assert values[0] == values[1], col
+
+def test_roundtrip_matches_dataframe(tmp_path):
+    tweets = make_frame(30)
+    save_feather(tweets, str(tmp_path / 't.feather'))
+    back = read_tweets(str(tmp_path / 't.feather'))
+    scalar = [col for col in tweets.columns if not any(isinstance(v, dict) for v in tweets[col])]
+    assert_same_values(back[scalar], tweets[scalar])
+    assert back['created_at'].dtype == tweets['created_at'].dtype
+    assert all(isinstance(v, list) for v in back['entities.hashtags'])
+
+    # only requested columns are read
+    assert read_table(str(tmp_path / 't.feather'), ['id', 'lang', 'missing']).column_names == ['id', 'lang']
+
+def test_untyped_columns_are_saved_as_strings(tmp_path, capsys):
+    tweets = make_frame(4).assign(mixed=[1, 'a', None, 2.5])
+    save_feather(tweets, str(tmp_path / 't.feather'))
+    assert 'Saving column mixed as strings' in capsys.readouterr().out
+    assert_same_values(read_tweets(str(tmp_path / 't.feather'))[['mixed']], pd.DataFrame({'mixed': ['1', 'a', None, '2.5']}))
+
+def test_concat_matches_pandas(tmp_path):
+    first = make_frame(10, '2020-01-01')
+    second = make_frame(6, '2020-01-02', seed=1).drop(columns=['lang']).assign(extra=np.arange(6))
+    old = make_frame(5, '2020-01-03', seed=2)
+    old['created_at'] = old['created_at'].dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    old['public_metrics.like_count'] = old['public_metrics.like_count'].astype(str)
+    for i, frame in enumerate([first, second, old]):
+        save_feather(frame, str(tmp_path / (str(i) + '.feather')))
+
+    tables = [constant_column(read_table(str(tmp_path / (str(i) + '.feather'))), 'source_file', str(i)) for i in range(3)]
+    data = table_to_frame(concat_tables(tables))
+    assert len(data) == 21
+    assert data['source_file'].tolist() == ['0'] * 10 + ['1'] * 6 + ['2'] * 5
+    assert data['lang'].isna().tolist() == [False] * 10 + [True] * 6 + [False] * 5
+    assert data['extra'].notna().sum() == 6
+    assert data['created_at'].tolist() == pd.concat([first, second, make_frame(5, '2020-01-03', seed=2)])['created_at'].dt.floor('s').tolist()
+    assert data['public_metrics.like_count'].tolist() == [str(v) for v in pd.concat([first, second, old])['public_metrics.like_count']]
+
+def test_combine_feather_matches_pickles(tmp_path):
+    for day in range(3):
+        frame = make_frame(8, '2020-01-0' + str(day + 1), seed=day)
+        save_feather(frame, str(tmp_path / ('tweets' + str(day) + '.feather')))
+    run_script('combine_tweets.py', ['-f', 'feather', '-o', 'combined.feather'], tmp_path)
+    run_script('combine_tweets.py', ['-f', 'pkl', '-o', 'combined.pkl'], tmp_path)
+    feather = read_tweets(str(tmp_path / 'combined.feather'))
+    pickled = read_tweets(str(tmp_path / 'combined.pkl'))
+    assert feather['id'].tolist() == pickled['id'].tolist()
+    assert feather['x_coord'].equals(pickled['x_coord'])
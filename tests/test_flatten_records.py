@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that flatten_records builds the same columns and values as
+pd.json_normalize from tweet and expansion pages, apart from the documented
+differences: missing values are None instead of NaN and explicit nulls of
+declared nested objects get no column.
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_tweets, make_includes
+from util_functions import flatten_records, TWEET_FIELDS, USER_FIELDS, PLACE_FIELDS, MEDIA_FIELDS
+
+# function to compare flatten_records to json_normalize
+def assert_normalized(records, fields, generic=True):
+    expected = pd.json_normalize(copy.deepcopy(records))
+    flat = flatten_records(records, fields, generic)
+    assert set(flat.columns) == set(expected.columns)
+    for col in expected.columns:
+        left = [None if not isinstance(v, (list, dict)) and pd.isna(v) else v for v in expected[col].tolist()]
+        right = [None if not isinstance(v, (list, dict)) and pd.isna(v) else v for v in flat[col].tolist()]
+        assert left == right, col
+
+def test_tweets_match_json_normalize():
+    assert_normalized(make_tweets(50), TWEET_FIELDS)
+
+@pytest.mark.parametrize('name, fields', [('users', USER_FIELDS), ('places', PLACE_FIELDS), ('media', MEDIA_FIELDS)])
+def test_includes_match_json_normalize(name, fields):
+    assert_normalized(make_includes(make_tweets(30))[name], fields)
+
+def test_undeclared_and_irregular_fields():
+    tweets = make_tweets(20)
+    tweets[3]['withheld'] = {'copyright': True, 'country_codes': ['DE']}
+    tweets[4]['possibly_sensitive'] = None
+    tweets[6]['public_metrics']['impression_count'] = 5
+    tweets[7]['public_metrics']['other'] = {'x': 1}
+    tweets[8]['public_metrics']['other'] = 3
+    assert_normalized(tweets, TWEET_FIELDS)
+
+    # a declared level that is not a dict falls back to generic flattening
+    tweets[5]['geo'] = ['bad']
+    assert_normalized(tweets, TWEET_FIELDS)
+
+def test_numeric_and_boolean_buffers():
+    flat = flatten_records(make_tweets(10), TWEET_FIELDS)
+    assert flat['public_metrics.like_count'].dtype == np.int64
+    assert flat['possibly_sensitive'].dtype == bool
+
+    # missing numbers give floats and missing booleans objects
+    tweets = make_tweets(10)
+    del tweets[2]['public_metrics']['like_count']
+    tweets[3]['possibly_sensitive'] = None
+    flat = flatten_records(tweets, TWEET_FIELDS)
+    assert flat['public_metrics.like_count'].dtype == np.float64
+    assert flat['public_metrics.like_count'].isna().sum() == 1
+    assert flat['possibly_sensitive'].dtype == object
+
+def test_documented_differences():
+    tweets = make_tweets(4)
+    tweets[1]['geo'] = None
+    flat = flatten_records(tweets, TWEET_FIELDS)
+    assert 'geo' in pd.json_normalize(copy.deepcopy(tweets)).columns
+    assert 'geo' not in flat.columns
+    assert flat['geo.place_id'].tolist()[1] is None
+
+def test_skip_undeclared_fields():
+    tweets = make_tweets(5)
+    tweets[0]['withheld'] = {'copyright': True}
+    flat = flatten_records(tweets, {'id': 'str', 'author_id': 'str'}, generic=False)
+    assert flat.columns.tolist() == ['id', 'author_id']
+    assert flatten_records([], TWEET_FIELDS).shape == (0, 0)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that write_points_gpkg writes, replaces and appends point layers with
+a spatial index, with the GDAL python bindings and with geopandas when they
+are missing, and that delete_gpkg_rows removes rows by a column.
+"""
+
+import sqlite3
+import sys
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from util_functions import write_points_gpkg, delete_gpkg_rows, gpkg_layers, gpkg_fields
+
+gpd = pytest.importorskip('geopandas')
+
+# fixture to write with gdal, skipped without the bindings, or with geopandas
+@pytest.fixture(params=['gdal', 'geopandas'])
+def writer(request, monkeypatch):
+    if request.param == 'gdal':
+        pytest.importorskip('osgeo.ogr')
+    else:
+        monkeypatch.setitem(sys.modules, 'osgeo', None)
+    return request.param
+
+# function to make points with the column types of combined tweets
+def make_points(n, start=0):
+    ids = np.arange(start, start + n)
+    return pd.DataFrame({'id': [str(1212000000000000000 + i) for i in ids],
+                         'created_at': pd.Series(pd.date_range('2020-01-01', periods=n, freq='h', tz='UTC')),
+                         'text': ['tweet ' + str(i) for i in ids],
+                         'possibly_sensitive': ids % 2 == 0,
+                         'public_metrics.like_count': ids % 7,
+                         'user.location': [None if i % 3 == 0 else 'Helsinki' for i in ids],
+                         'x_coord': 24.9 + ids / 1000, 'y_coord': 60.1 + ids / 1000,
+                         'source_file': ['day' + str(i % 2) + '.pkl' for i in ids]})
+
+# function to check the spatial index of a layer matches its rows
+def index_rows(path, layer):
+    geom, _ = gpkg_fields(path, layer)
+    with closing(sqlite3.connect(path)) as con:
+        return con.execute('SELECT COUNT(*) FROM "rtree_' + layer + '_' + geom + '"').fetchone()[0]
+
+def test_write_append_and_delete(writer, tmp_path):
+    path = str(tmp_path / 'tweets.gpkg')
+    data = make_points(25)
+    assert write_points_gpkg(path, 'tweets', data, 'x_coord', 'y_coord', batch_size=10) == 25
+    assert gpkg_layers(path) == ['tweets']
+    assert index_rows(path, 'tweets') == 25
+
+    layer = gpd.read_file(path, layer='tweets')
+    assert layer['id'].tolist() == data['id'].tolist()
+    assert layer['user.location'].isna().sum() == 9
+    assert pd.to_datetime(layer['created_at'], utc=True).tolist() == data['created_at'].tolist()
+    assert np.allclose(layer.geometry.x, data['x_coord'])
+
+    # appending skips columns not in the layer and keeps the index up to date
+    more = make_points(7, start=25).assign(extra=1)
+    assert write_points_gpkg(path, 'tweets', more, 'x_coord', 'y_coord', batch_size=3, append=True) == 7
+    assert len(gpd.read_file(path, layer='tweets')) == 32
+    assert 'extra' not in gpkg_fields(path, 'tweets')[1]
+    assert index_rows(path, 'tweets') == 32
+
+    # deleting rows of a source file returns their ids
+    deleted = delete_gpkg_rows(path, 'tweets', 'source_file', ['day1.pkl'])
+    assert len(deleted) == 16
+    assert len(gpd.read_file(path, layer='tweets')) == 16
+    assert index_rows(path, 'tweets') == 16
+
+def test_replace_layer_and_add_another(writer, tmp_path):
+    path = str(tmp_path / 'tweets.gpkg')
+    write_points_gpkg(path, 'tweets', make_points(12), 'x_coord', 'y_coord')
+    write_points_gpkg(path, 'tweets', make_points(5), 'x_coord', 'y_coord')
+    write_points_gpkg(path, 'other', make_points(3), 'x_coord', 'y_coord', append=True)
+    assert sorted(gpkg_layers(path)) == ['other', 'tweets']
+    assert len(gpd.read_file(path, layer='tweets')) == 5
+    assert len(gpd.read_file(path, layer='other')) == 3
+    assert gpd.read_file(path, layer='tweets').crs.to_epsg() == 4326
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that help and argument errors of the tweetsearcher modes return without
+importing the heavy libraries, and that importing util_functions.py does not
+load the optional ones.
+
+Run with:
+
+    python -m pytest tests
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+# repository root with the scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# wall time budget in seconds of a help or argument error, pandas alone takes longer to import
+BUDGET = 1.0
+
+# modes of tweetsearcher.py
+MODES = ['query', 'bbox', 'timeline', 'preview', 'combine']
+
+# libraries the modes import only after checking their arguments
+HEAVY = ['pandas', 'numpy', 'geopandas', 'shapely', 'pyarrow', 'searchtweets', 'requests']
+
+# libraries util_functions.py imports only in the functions using them
+OPTIONAL = ['geopandas', 'shapely', 'pyarrow', 'zstandard', 'requests']
+
+# function to run a script and time it, best of three runs
+def timed_run(args, cwd):
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable] + args, cwd=cwd, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return proc, best
+
+# function to list modules imported by a script
+def imported_modules(args, cwd):
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=cwd, capture_output=True, text=True)
+    return proc, {line.split('|')[-1].strip() for line in proc.stderr.splitlines() if line.startswith('import time:')}
+
+@pytest.mark.parametrize('mode', MODES)
+def test_help_is_fast(mode, tmp_path):
+    proc, elapsed = timed_run([os.path.join(ROOT, 'tweetsearcher.py'), mode, '--help'], tmp_path)
+    assert proc.returncode == 0
+    assert 'usage:' in proc.stdout
+    assert elapsed < BUDGET, mode + ' --help took ' + str(round(elapsed, 3)) + ' s'
+
+@pytest.mark.parametrize('mode', MODES)
+def test_help_skips_heavy_imports(mode, tmp_path):
+    proc, modules = imported_modules([os.path.join(ROOT, 'tweetsearcher.py'), mode, '--help'], tmp_path)
+    assert proc.returncode == 0
+    assert modules.isdisjoint(HEAVY), sorted(modules.intersection(HEAVY))
+
+@pytest.mark.parametrize('args', [['query', '-s', 'bulk', '-o', 'pkl'],
+                                  ['query', '-s', 'bulk', '-o', 'xls', '-sd', '2020-01-01', '-ed', '2020-01-02'],
+                                  ['query', '-s', 'daily', '-o', 'pkl'],
+                                  ['bbox', '-sd', '2020-01-02', '-ed', '2020-01-01', '-in', '1', '-b', 'bbox.gpkg', '-o', '.'],
+                                  ['bbox', '-sd', '2020-01-01', '-ed', '2020-01-02', '-in', '1', '-b', 'missing.gpkg', '-o', '.'],
+                                  ['timeline', '-ul', 'users.csv', '-sd', '2020-01-01', '-ed', '2020-01-02', '-o', 'feather'],
+                                  ['preview', '-sd', '2020-01-01', '-ed', '2020-01-02', '-o', 'xls'],
+                                  ['combine', '-f', 'xls', '-o', 'tweets.xls']])
+def test_argument_errors_skip_heavy_imports(args, tmp_path):
+    proc, modules = imported_modules([os.path.join(ROOT, 'tweetsearcher.py')] + args, tmp_path)
+    assert proc.returncode == 2
+    assert 'error:' in proc.stderr
+    assert modules.isdisjoint(HEAVY), sorted(modules.intersection(HEAVY))
+
+def test_util_functions_defers_optional_imports(tmp_path):
+    proc, modules = imported_modules(['-c', 'import sys; sys.path.insert(0, sys.argv[1]); import util_functions', ROOT], tmp_path)
+    assert proc.returncode == 0, proc.stderr
+    
+    # newer pandas versions import pyarrow themselves
+    _, pandas_modules = imported_modules(['-c', 'import pandas, numpy'], tmp_path)
+    extra = modules - pandas_modules
+    assert extra.isdisjoint(OPTIONAL), sorted(extra.intersection(OPTIONAL))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that the incremental style of v2_tweets_to_file.py collects only
+tweets newer than the previous run, and stores the newest id per query tag.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+from conftest import write_keys, run_script
+from util_functions import read_since_id, write_since_id
+
+# function to run an incremental collection up to the end date
+def collect(path, end, *extra):
+    return run_script('v2_tweets_to_file.py', ['-s', 'incremental', '-o', 'pkl', '-ed', end] + list(extra), path)
+
+def test_incremental_runs(tmp_path, api):
+    write_keys(tmp_path, api, results_per_call=100)
+    collect(tmp_path, '2020-01-03', '-sd', '2020-01-01')
+    first = pd.read_pickle(tmp_path / 'tweets2020-01-03_since_0.pkl')
+    assert len(first) == 24
+    newest = read_since_id(str(tmp_path / 'since_ids.json'), 'test')
+    assert newest == max(first['id'], key=int)
+
+    # the next run starts after the newest id and writes a new file
+    collect(tmp_path, '2020-01-05')
+    assert api.requests[-1]['since_id'] == newest
+    second = pd.read_pickle(tmp_path / ('tweets2020-01-05_since_' + newest + '.pkl'))
+    assert len(second) == 24
+    assert set(first['id']).isdisjoint(second['id'])
+    assert second['created_at'].min() >= pd.Timestamp('2020-01-03', tz='UTC')
+
+    # a rerun finds nothing new and leaves the state as it is
+    state = read_since_id(str(tmp_path / 'since_ids.json'), 'test')
+    proc = collect(tmp_path, '2020-01-05')
+    assert 'No new tweets for tag test' in proc.stdout
+    assert read_since_id(str(tmp_path / 'since_ids.json'), 'test') == state
+    assert len([f for f in os.listdir(tmp_path) if f.endswith('.pkl')]) == 2
+
+def test_since_id_state_per_tag(tmp_path):
+    statefile = str(tmp_path / 'since_ids.json')
+    assert read_since_id(statefile, 'a') is None
+    write_since_id(statefile, 'a', 123)
+    write_since_id(statefile, 'b', 456)
+    write_since_id(statefile, 'a', 789)
+    with open(statefile) as f:
+        assert json.load(f) == {'a': '789', 'b': '456'}
+    assert not os.path.exists(statefile + '.tmp')
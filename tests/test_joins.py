@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that index_join gives the same rows as a left pd.merge, and that
+ref_join and media_parse look up every reference and media key of tweets.
+"""
+
+import numpy as np
+import pandas as pd
+
+from conftest import make_frame
+from util_functions import index_join, ref_join, media_parse
+
+# function to compare a left join to pd.merge with NaN normalised to None
+def assert_merged(left, right, left_on, right_on):
+    joined = index_join(left, right, left_on, right_on)
+    expected = left.merge(right.drop_duplicates(subset=[right_on]), how='left', left_on=left_on, right_on=right_on)
+    assert joined.index.tolist() == left.index.tolist()
+    assert joined.columns.tolist() == expected.columns.tolist()
+    for col in expected.columns:
+        assert [None if pd.isna(v) else v for v in joined[col]] == [None if pd.isna(v) else v for v in expected[col]], col
+
+def test_numeric_ids_match_merge():
+    rng = np.random.default_rng(1)
+    left = pd.DataFrame({'author_id': [str(i) for i in rng.integers(0, 40, 200)], 'n': np.arange(200)},
+                        index=np.arange(200) * 3)
+    right = pd.DataFrame({'user.id': [str(i) for i in range(0, 30)], 'user.name': ['u' + str(i) for i in range(30)],
+                          'user.followers': np.arange(30)})
+    assert_merged(left, right, 'author_id', 'user.id')
+
+    # every row matching keeps the integer column
+    joined = index_join(left[left['author_id'].astype(int) < 30], right, 'author_id', 'user.id')
+    assert joined['user.followers'].dtype == np.int64
+
+def test_string_and_duplicate_keys_match_merge():
+    left = pd.DataFrame({'place': ['pl0', 'pl1', 'x', None, 'pl0']})
+    right = pd.DataFrame({'id': ['pl1', 'pl0', 'pl1'], 'name': ['first', 'zero', 'second']})
+    assert_merged(left, right, 'place', 'id')
+    assert index_join(left, right, 'place', 'id')['name'].tolist() == ['zero', 'first', None, None, 'zero']
+
+def test_ref_join_keeps_reference_order():
+    tweets = pd.DataFrame({'referenced_tweets.id': ['1;2', '3', None, '4;1']})
+    refs = pd.DataFrame({'referenced_tweets.tweet_id': ['1', '2', '3'], 'referenced_tweets.author_id': ['a', 'b', None]})
+    assert ref_join(tweets, refs)['referenced_tweets.author_id'].tolist() == ['a;b', None, None, ';a']
+
+def test_parsed_tweets_get_references_and_media():
+    tweets = make_frame(30)
+    replies = tweets['referenced_tweets.id'].notna()
+    assert replies.sum() == 8
+    assert set(tweets.loc[replies, 'referenced_tweets.author_id']) == {'9'}
+
+    media = pd.DataFrame({'media_key': ['3_0', '3_5', '3_0'], 'type': ['photo', 'video', 'gif']})
+    types = media_parse(tweets, media)['attachments.media_types']
+    keys = tweets['attachments.media_keys']
+    for key, found in zip(keys, types):
+        if isinstance(key, list):
+            assert found == [{'3_0': 'photo', '3_5': 'video'}.get(k) for k in key]
+        else:
+            assert found is None
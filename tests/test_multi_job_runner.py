@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that multi_job_runner.py interleaves the requests of its jobs by
+priority over one rate limiter, saves every unit and stops at the monthly
+tweet cap.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+from conftest import write_keys, write_config, run_script
+
+# jobs file of two query jobs and a timeline job
+JOBS = """budget:
+    requests_per_window: 100
+    window_seconds: 60
+    min_interval: 0.01
+{cap}    usage_file: usage.json
+jobs:
+    - name: rain
+      type: query
+      config: rain.yaml
+      startdate: 2020-01-01
+      enddate: 2020-01-04
+      outpath: out/
+      priority: 2
+    - name: snow
+      type: query
+      config: snow.yaml
+      startdate: 2020-01-01
+      enddate: 2020-01-04
+      outpath: out/
+    - name: panel
+      type: timeline
+      config: snow.yaml
+      userlist: users.csv
+      startdate: 2020-01-01
+      enddate: 2020-01-02
+      chunksize: 2
+      outpath: out/
+"""
+
+# function to run the jobs against the local api
+def run_jobs(path, api, cap=None):
+    write_keys(path, api)
+    write_config(path, query='rain', prefix='rain', name='rain.yaml')
+    write_config(path, query='snow', prefix='snow', name='snow.yaml')
+    pd.DataFrame({'usr_id': [7, 8, 9]}).to_csv(path / 'users.csv', index=False)
+    with open(path / 'jobs.yaml', 'w') as f:
+        f.write(JOBS.format(cap='' if cap is None else '    monthly_cap: ' + str(cap) + '\n'))
+    os.makedirs(path / 'out', exist_ok=True)
+    return run_script('multi_job_runner.py', ['-j', 'jobs.yaml'], path)
+
+def test_jobs_share_requests_by_priority(tmp_path, api):
+    run_jobs(tmp_path, api)
+    assert sorted(os.listdir(tmp_path / 'out')) == sorted(
+        ['rain2020-01-0' + str(i) + '.pkl' for i in range(1, 4)] +
+        ['snow2020-01-0' + str(i) + '.pkl' for i in range(1, 4)] +
+        ['snow2020-01-01_from_7_to_8.pkl', 'snow2020-01-01_from_9_to_9.pkl'])
+    assert len(pd.read_pickle(tmp_path / 'out' / 'rain2020-01-02.pkl')) == 12
+    assert set(pd.read_pickle(tmp_path / 'out' / 'snow2020-01-01_from_7_to_8.pkl')['author_id']) == {'7', '8'}
+
+    # the rain job of priority 2 gets two requests for each request of the other jobs
+    first = [request['query'].split()[0] for request in api.requests[:9]]
+    first = ['panel' if query.startswith('from:') else query for query in first]
+    assert first == ['rain', 'snow', 'panel', 'rain', 'rain', 'snow', 'panel', 'rain', 'rain']
+
+    # every page was requested once
+    pages = [(r['query'], r.get('start_time'), r.get('next_token')) for r in api.requests]
+    assert len(pages) == len(set(pages)) == 6 + 6 + 6
+    with open(tmp_path / 'usage.json') as f:
+        assert list(json.load(f).values()) == [3 * 12 + 3 * 12 + 3 * 12]
+
+def test_monthly_cap_stops_jobs(tmp_path, api):
+    proc = run_jobs(tmp_path, api, cap=40)
+    assert 'Monthly cap of 40 tweets reached' in proc.stdout
+    with open(tmp_path / 'usage.json') as f:
+        used = list(json.load(f).values())[0]
+    assert 40 <= used < 60
+    assert len(api.requests) < 15
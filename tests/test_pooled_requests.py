@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that stream_tweets pages through searches over one kept-alive
+connection, that RateLimiter spaces and pauses requests, and that the
+collectors count tweets and not messages of the responses.
+"""
+
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from conftest import write_keys, write_bbox, run_script
+from util_functions import make_pooled_session, stream_tweets, session_stats, RateLimiter
+
+# request parameters of a day of tweets
+RULE = {'query': 'weather', 'start_time': '2020-01-01T00:00:00Z', 'end_time': '2020-01-02T00:00:00Z',
+        'max_results': 5, 'tweet.fields': 'id,text,author_id,created_at'}
+
+def test_stream_reuses_one_connection(api):
+    session = make_pooled_session('z')
+    messages = list(stream_tweets(session, api.endpoint, RULE))
+    more = list(stream_tweets(session, api.endpoint, dict(RULE, max_results=12)))
+    assert session_stats(session) == (3 + 1, 1)
+    session.close()
+
+    # messages are the tweets of each page followed by its meta
+    assert [m['id'] for m in messages if 'id' in m] == [m['id'] for m in more if 'id' in m]
+    assert [m.get('result_count') for m in messages if 'result_count' in m] == [5, 5, 2]
+    assert [m['next_token'] for m in messages if 'next_token' in m] == ['5', '10']
+    assert len(messages) == 12 + 3
+
+def test_stream_stops_at_max_tweets_and_pages(api):
+    session = make_pooled_session('z')
+    assert len([m for m in stream_tweets(session, api.endpoint, RULE, max_tweets=6) if 'id' in m]) == 10
+    assert len([m for m in stream_tweets(session, api.endpoint, RULE, max_pages=1) if 'id' in m]) == 5
+    assert len(api.requests) == 3
+    session.close()
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(max_requests=3, window=0.5, min_interval=0.1)
+    start = time.time()
+    for i in range(3):
+        limiter.wait()
+    assert 0.2 <= time.time() - start < 0.4
+
+    # the fourth request waits until the first one leaves the window
+    limiter.wait()
+    assert time.time() - start >= 0.5
+
+def test_rate_limiter_pauses_at_limit():
+    limiter = RateLimiter(min_interval=0)
+    limiter.update(200, {'x-rate-limit-remaining': '5', 'x-rate-limit-reset': str(int(time.time()) + 100)})
+    assert limiter.paused_until == 0
+
+    # the reset time of the headers pauses requests
+    reset = int(time.time())
+    limiter.update(200, {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(reset)})
+    assert limiter.paused_until == reset + 1
+
+    # without headers a rate limit error pauses for the window
+    limiter = RateLimiter(window=0.3, min_interval=0)
+    limiter.update(429, {})
+    start = time.time()
+    limiter.wait()
+    assert time.time() - start >= 0.2
+
+# function to run the bbox collector with two pages per bounding box
+def collect_bbox(path, api):
+    os.makedirs(path / 'out', exist_ok=True)
+    write_keys(path, api)
+    return run_script('bbox_tweets_to_file.py', ['-sd', '2020-01-01', '-ed', '2020-01-02', '-in', '1',
+                                                 '-b', write_bbox(path / 'bbox.gpkg', n=2), '-o', 'out/'], path)
+
+def test_bbox_counts_tweets_over_one_connection(tmp_path, api):
+    pytest.importorskip('geopandas')
+    proc = collect_bbox(tmp_path, api)
+    assert proc.stdout.count('Got 12 tweets from bounding box') == 2
+    assert 'Sent 4 requests over 1 connections.' in proc.stdout
+    assert len(pd.read_pickle(tmp_path / 'out' / 'tweets_2020-01-01---2020-01-02_part0.pkl')) == 24
+
+def test_bbox_saves_nothing_without_tweets(tmp_path, api):
+    pytest.importorskip('geopandas')
+    api.per_day = 0
+    proc = collect_bbox(tmp_path, api)
+    assert proc.stdout.count('Got 0 tweets from bounding box') == 2
+    assert os.listdir(tmp_path / 'out') == []
+
+def test_timeline_counts_tweets(tmp_path, api):
+    write_keys(tmp_path, api)
+    pd.DataFrame({'usr_id': ['1', '2']}).to_csv(tmp_path / 'users.csv', index=False)
+    proc = run_script('timeline_tweets_to_file.py', ['-ul', 'users.csv', '-sd', '2020-01-01', '-ed', '2020-01-02',
+                                                     '-o', 'pkl'], tmp_path)
+    assert proc.stdout.count('Collected 12 tweets from user') == 2
+    assert 'Sent 4 requests over 1 connections.' in proc.stdout
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that preview windows cover the span, that window volumes and the
+extrapolated volume estimate the tweets of truncated windows, that the
+reservoir sample keeps tweets by their weight, and that preview_tweets.py
+estimates the tweets of a query within its request budget.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_tweets, make_pages, make_messages, write_keys, run_script
+from util_functions import preview_windows, window_volume, reservoir_sample, extrapolate_volume, read_tweets
+
+def test_windows_cover_span():
+    start, end = datetime(2020, 1, 1), datetime(2020, 1, 11)
+    windows = preview_windows(start, end, 20, 60, seed=4)
+    assert windows == preview_windows(start, end, 20, 60, seed=4)
+    assert len(windows) == 20
+    for k, (wstart, wend) in enumerate(windows):
+        assert wend - wstart == timedelta(hours=1)
+        assert start + k * (end - start) / 20 <= wstart and wend <= start + (k + 1) * (end - start) / 20
+
+    # windows are shortened to fit their strata
+    short = preview_windows(start, start + timedelta(minutes=90), 3, 60, seed=1)
+    assert [w[1] - w[0] for w in short] == [timedelta(minutes=30)] * 3
+
+def test_window_volume_of_truncated_window():
+    start, end = datetime(2020, 1, 1), datetime(2020, 1, 2)
+    pages = make_pages(make_tweets(2000), per_page=100, includes=False)
+    assert window_volume(make_messages(pages), start, end) == (2000, 2000.0, False)
+
+    # two pages of the newest tweets cover a tenth of the day
+    received, estimate, truncated = window_volume(make_messages(pages[:2]), start, end)
+    assert received == 200 and truncated
+    assert estimate == pytest.approx(2000, rel=0.01)
+    assert window_volume(make_messages(make_pages([])), start, end) == (0, 0.0, False)
+
+def test_reservoir_keeps_tweets_by_weight():
+    # tweets of three times the weight are about three times as likely to be kept
+    rng = np.random.default_rng(0)
+    light = pd.DataFrame({'id': ['light'] * 1000})
+    heavy = pd.DataFrame({'id': ['heavy'] * 1000})
+    shares = [(reservoir_sample(reservoir_sample(None, light, 1, 50, rng), heavy, 3, 50, rng)['id'] == 'heavy').mean()
+              for _ in range(40)]
+    assert np.mean(shares) == pytest.approx(0.75, abs=0.03)
+
+    # adding tweets in batches gives the sample of adding them at once
+    tweets = pd.DataFrame({'id': [str(i) for i in range(100)]})
+    whole = reservoir_sample(None, tweets, 1, 10, np.random.default_rng(5))
+    rng = np.random.default_rng(5)
+    batches = reservoir_sample(reservoir_sample(None, tweets.iloc[:60], 1, 10, rng), tweets.iloc[60:], 1, 10, rng)
+    assert sorted(batches['id']) == sorted(whole['id'])
+    assert len(whole) == 10
+
+def test_extrapolate_volume():
+    assert extrapolate_volume([60, 60, 60], 60, 6000) == (6000, 6000, 6000)
+    total, low, high = extrapolate_volume([30, 90, 60, 60], 60, 6000)
+    assert total == 6000 and low < 6000 < high
+
+    # windows covering the whole span leave no error, one window gives no interval
+    assert extrapolate_volume([30, 90], 60, 120) == (120, 120, 120)
+    assert np.isnan(extrapolate_volume([60], 60, 6000)[1])
+
+def test_preview_script(tmp_path, api):
+    api.per_day = 2880
+    write_keys(tmp_path, api, results_per_call=100)
+    proc = run_script('preview_tweets.py', ['-sd', '2020-01-01', '-ed', '2020-01-03', '-rb', '4', '-nw', '4',
+                                            '-n', '50', '-rs', '1'], tmp_path)
+    assert len(api.requests) == 4
+    estimate = int(proc.stdout.split('Estimated ')[1].split(' ')[0])
+    assert estimate == pytest.approx(2 * 2880, rel=0.05)
+    sample = read_tweets(str(tmp_path / 'tweets_preview_2020-01-01---2020-01-03.pkl'))
+    assert len(sample) == 50 and not sample['id'].duplicated().any()
+    assert sample['id'].astype('int64').is_monotonic_increasing
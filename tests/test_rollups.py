@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that rollups updated file by file count the same tweets as counting
+all files at once, also after files change, and that rollup_tweets.py and
+v2_tweets_to_file.py -ru keep them up to date.
+"""
+
+import os
+
+import pandas as pd
+
+from conftest import make_frame, write_keys, run_script
+from util_functions import update_rollups, rebuild_rollups, read_rollup, ROLLUPS
+
+# function to count tweets of files per day and rollup columns with a groupby
+def count_all(files, name):
+    data = pd.concat([pd.read_pickle(file) for file in files], ignore_index=True)
+    counts = pd.DataFrame({'day': data['created_at'].dt.floor('D').dt.tz_localize(None)})
+    for col in ROLLUPS[name]:
+        counts[col] = data[col].fillna('').astype(str) if col in data.columns else ''
+    return counts.groupby(['day'] + ROLLUPS[name]).size().rename('tweets').reset_index()
+
+# function to compare the rollups of a directory to counts of the files
+def assert_rollups(path, files):
+    for name in ROLLUPS:
+        table = read_rollup(str(path), name).sort_values(['day'] + ROLLUPS[name]).reset_index(drop=True)
+        pd.testing.assert_frame_equal(table, count_all(files, name), check_dtype=False)
+
+# function to save a frame of tweets
+def save(path, n, day, seed):
+    make_frame(n, day, seed).to_pickle(path)
+    return str(path)
+
+def test_updates_match_counting_all(tmp_path):
+    os.makedirs(tmp_path / 'a')
+    os.makedirs(tmp_path / 'b')
+    rollups = str(tmp_path / 'rollups')
+    files = [save(tmp_path / 'a' / 'day.pkl', 20, '2020-01-01', 0), save(tmp_path / 'b' / 'day.pkl', 15, '2020-01-01', 1)]
+    assert sorted(update_rollups(rollups, files)) == ['../a/day.pkl', '../b/day.pkl']
+    assert_rollups(rollups, files)
+    assert update_rollups(rollups, files) == []
+
+    # a changed file replaces its counts and a new day is added
+    files[0] = save(tmp_path / 'a' / 'day.pkl', 8, '2020-01-01', 2)
+    files.append(save(tmp_path / 'a' / 'next.pkl', 10, '2020-01-02', 3))
+    assert sorted(update_rollups(rollups, files)) == ['../a/day.pkl', '../a/next.pkl']
+    assert_rollups(rollups, files)
+    assert read_rollup(rollups, 'day')['tweets'].tolist() == [23, 10]
+
+    # rebuilding from the counts of each file gives the same tables
+    pd.DataFrame(columns=['day', 'tweets']).to_pickle(os.path.join(rollups, 'day.pkl'))
+    rebuild_rollups(rollups)
+    assert_rollups(rollups, files)
+
+def test_rollup_script(tmp_path):
+    os.makedirs(tmp_path / 'tweets')
+    files = [save(tmp_path / 'tweets' / ('t' + str(i) + '.pkl'), 10 + i, '2020-01-0' + str(i + 1), i) for i in range(3)]
+    proc = run_script('rollup_tweets.py', ['-i', 'tweets', '-r', 'rollups'], tmp_path)
+    assert 'Rolled up 3 new or changed files' in proc.stdout
+    files[1] = save(tmp_path / 'tweets' / 't1.pkl', 4, '2020-01-02', 7)
+    proc = run_script('rollup_tweets.py', ['-i', 'tweets', '-r', 'rollups', '-rb'], tmp_path)
+    assert 'Rolled up 1 new or changed files' in proc.stdout
+    assert_rollups(tmp_path / 'rollups', files)
+
+def test_collector_updates_rollups(tmp_path, api):
+    write_keys(tmp_path, api, results_per_call=100)
+    run_script('v2_tweets_to_file.py', ['-s', 'iterative', '-o', 'pkl', '-sd', '2020-01-01', '-ed', '2020-01-03',
+                                        '-ru', 'rollups'], tmp_path)
+    files = [str(tmp_path / ('tweets2020-01-0' + str(i) + '.pkl')) for i in (1, 2)]
+    assert_rollups(tmp_path / 'rollups', files)
+    assert read_rollup(str(tmp_path / 'rollups'), 'day')['tweets'].tolist() == [12, 12]
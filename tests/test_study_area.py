@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that points_in_polygons over subdivided polygons finds the same
+points as testing each point against each polygon with shapely, and that
+the study area keeps or tags tweets by their coordinates.
+"""
+
+import numpy as np
+import pytest
+
+from conftest import make_frame, run_script
+from util_functions import subdivide_polygon, count_vertices, points_in_polygons, filter_study_area, tweet_coordinates, read_tweets
+
+gpd = pytest.importorskip('geopandas')
+from shapely.geometry import Point, Polygon, MultiPolygon, box
+
+# function to make a star with many vertices and a hole
+def star(cx, cy, r, n=400):
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    radius = np.where(np.arange(n) % 2 == 0, r, r / 2)
+    hole = [(cx + r / 8 * np.cos(a), cy + r / 8 * np.sin(a)) for a in angles[::20]]
+    return Polygon(np.column_stack([cx + radius * np.cos(angles), cy + radius * np.sin(angles)]), [hole])
+
+# study area polygons of the tests, overlapping and one with two parts
+POLYGONS = [star(25.0, 60.2, 0.2), box(24.9, 60.1, 25.1, 60.3),
+            MultiPolygon([box(24.0, 60.0, 24.2, 60.1), star(24.5, 60.5, 0.1, 100)])]
+
+def test_subdivided_pieces_cover_polygon():
+    pieces = subdivide_polygon(POLYGONS[0], max_vertices=64)
+    assert len(pieces) > 1
+    assert all(count_vertices(piece) <= 64 for piece in pieces)
+    assert abs(sum(piece.area for piece in pieces) - POLYGONS[0].area) < 1e-9
+    assert subdivide_polygon(POLYGONS[1]) == [POLYGONS[1]]
+
+def test_points_match_shapely():
+    rng = np.random.default_rng(3)
+    x = rng.uniform(23.9, 25.3, 3000)
+    y = rng.uniform(59.9, 60.7, 3000)
+    x[:3] = [np.nan, 25.0, 24.1]
+    y[:3] = [60.2, np.nan, 60.1]
+    ipoint, ipoly = points_in_polygons(x, y, gpd.GeoSeries(POLYGONS))
+    expected = {(i, j) for i in range(len(x)) for j, poly in enumerate(POLYGONS)
+                if not np.isnan(x[i] + y[i]) and poly.intersects(Point(x[i], y[i]))}
+    assert set(zip(ipoint.tolist(), ipoly.tolist())) == expected
+    assert len(ipoint) == len(expected)
+    assert (2, 2) in expected
+
+# function to get tweets with coordinates in and around the study area
+def located_tweets():
+    tweets = make_frame(60)
+    tweets['geo.coordinates.x'] = np.where(tweets['geo.coordinates.x'].notna(), tweets['geo.coordinates.x'] + 0.1, np.nan)
+    return tweets
+
+def test_filter_keeps_and_tags_tweets():
+    tweets = located_tweets()
+    area = gpd.GeoSeries([POLYGONS[1]])
+    x, y, gps = tweet_coordinates(tweets)
+    inside = np.array([POLYGONS[1].intersects(Point(a, b)) for a, b in zip(x, y)])
+    assert 0 < inside.sum() < len(tweets)
+
+    kept = filter_study_area(tweets, area)
+    assert kept['id'].tolist() == tweets.loc[inside, 'id'].tolist()
+    tagged = filter_study_area(tweets, area, 'tag')
+    assert tagged['in_study_area'].tolist() == inside.tolist()
+
+def test_combine_with_study_area(tmp_path):
+    tweets = located_tweets()
+    tweets.to_pickle(tmp_path / 'tweets2020-01-01.pkl')
+    gpd.GeoDataFrame(geometry=[POLYGONS[1]], crs='EPSG:4326').to_crs('EPSG:3067').to_file(tmp_path / 'area.gpkg')
+    run_script('combine_tweets.py', ['-f', 'pkl', '-o', 'combined.pkl', '-sa', 'area.gpkg', '-sm', 'tag'], tmp_path)
+    combined = read_tweets(str(tmp_path / 'combined.pkl'))
+    expected = filter_study_area(tweets, gpd.GeoSeries([POLYGONS[1]]), 'tag')
+    assert dict(zip(combined['id'], combined['in_study_area'])) == dict(zip(expected['id'], expected['in_study_area']))
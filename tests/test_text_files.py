@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that csv and json lines files saved in compressed chunks on several
+threads read back as the saved tweets, also after appending, and that
+text_chunks reads them a chunk at a time.
+"""
+
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_frame, write_keys, run_script
+from util_functions import save_text, read_text, text_chunks, read_tweets
+
+# extensions of the text formats, zstd files are written with zstandard or pyarrow
+FORMATS = ['csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'jsonl.zst']
+
+# function to compare values of two dataframes with missing values as None
+def values(frame, columns):
+    return [[None if not isinstance(v, (list, dict)) and pd.isna(v) else v for v in frame[col]] for col in columns]
+
+@pytest.mark.parametrize('ext', FORMATS)
+def test_chunks_read_back(tmp_path, ext):
+    if ext.endswith('.zst'):
+        pytest.importorskip('pyarrow')
+    tweets = make_frame(50)
+    path = str(tmp_path / ('tweets.' + ext))
+    save_text(tweets, path, chunksize=7, threads=3)
+    back = read_text(path)
+    assert len(back) == 50
+    assert back['id'].tolist() == tweets['id'].tolist()
+    assert back['created_at'].tolist() == tweets['created_at'].tolist()
+    scalar = ['author_id', 'text', 'lang', 'public_metrics.like_count']
+    assert values(back, scalar) == values(tweets, scalar)
+    assert np.allclose(back['geo.coordinates.x'], tweets['geo.coordinates.x'], equal_nan=True)
+    if ext.startswith('jsonl'):
+        assert values(back, ['entities.hashtags']) == values(tweets, ['entities.hashtags'])
+
+    # one file written at once is read the same
+    single = str(tmp_path / ('single.' + ext))
+    save_text(tweets, single, threads=1)
+    pd.testing.assert_frame_equal(read_text(single), back)
+
+    # chunks of the file hold the rows in order
+    chunks = list(text_chunks(path, chunksize=20, columns=['id', 'text']))
+    assert [len(chunk) for chunk in chunks] == [20, 20, 10]
+    assert pd.concat(chunks)['id'].tolist() == tweets['id'].tolist()
+    assert read_text(path, columns=['id', 'lang'], nrows=5).shape == (5, 2)
+
+@pytest.mark.parametrize('ext', ['csv.gz', 'jsonl.zst'])
+def test_append(tmp_path, ext):
+    if ext.endswith('.zst'):
+        pytest.importorskip('pyarrow')
+    first, second = make_frame(12), make_frame(8, '2020-01-02', seed=1)
+    second.index = range(12, 20)
+    path = str(tmp_path / ('tweets.' + ext))
+    save_text(first, path, chunksize=5)
+    save_text(second, path, append=True, chunksize=5)
+    back = read_tweets(path)
+    assert back['id'].tolist() == first['id'].tolist() + second['id'].tolist()
+    if ext.startswith('csv'):
+        assert back.index.tolist() == list(range(20))
+
+def test_gzip_members_are_one_file(tmp_path):
+    save_text(make_frame(30), str(tmp_path / 'tweets.jsonl.gz'), chunksize=4)
+    with gzip.open(tmp_path / 'tweets.jsonl.gz', 'rt', encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 30
+
+def test_collector_saves_compressed_text(tmp_path, api):
+    pytest.importorskip('pyarrow')
+    write_keys(tmp_path, api, results_per_call=100)
+    run_script('v2_tweets_to_file.py', ['-s', 'iterative', '-o', 'jsonl.zst', '-sd', '2020-01-01', '-ed', '2020-01-02'], tmp_path)
+    tweets = read_tweets(str(tmp_path / 'tweets2020-01-01.jsonl.zst'))
+    assert len(tweets) == 12
+    assert isinstance(tweets['created_at'].dtype, pd.DatetimeTZDtype)
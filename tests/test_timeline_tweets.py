@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that timeline_tweets_to_file.py writes parts by tweet volume or user
+chunks, and that the manifest finds the parts of each user.
+"""
+
+import os
+
+import pandas as pd
+
+from conftest import write_keys, run_script
+from util_functions import read_user_tweets
+
+# user ids of the list, one without tweets
+USERS = ['1', '2', '3', 'nothing', '4', '5']
+
+# function to run the timeline collector against the local api
+def collect(path, api, *extra):
+    write_keys(path, api, results_per_call=100)
+    pd.DataFrame({'usr_id': USERS}).to_csv(path / 'users.csv', index=False)
+    return run_script('timeline_tweets_to_file.py', ['-ul', 'users.csv', '-sd', '2020-01-01', '-ed', '2020-01-03',
+                                                     '-o', 'pkl'] + list(extra), path)
+
+def test_parts_by_tweet_volume(tmp_path, api):
+    proc = collect(tmp_path, api, '-r', '50')
+    assert 'Collected 0 tweets from user nothing' in proc.stdout
+    parts = ['tweets2020-01-01_part' + str(i) + '.pkl' for i in range(3)]
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith('.pkl')) == parts
+    assert [len(pd.read_pickle(tmp_path / part)) for part in parts] == [50, 50, 20]
+
+    # the manifest lists the parts of every user, also of users split over parts
+    manifest = pd.read_csv(tmp_path / 'tweets2020-01-01_manifest.csv', sep=';', dtype={'usr_id': str})
+    assert manifest.groupby('usr_id')['tweets'].sum().to_dict() == {'1': 24, '2': 24, '3': 24, '4': 24, '5': 24, 'nothing': 0}
+    assert manifest.loc[manifest['usr_id'] == 'nothing', 'status'].tolist() == ['empty']
+    assert sorted(manifest.loc[manifest['usr_id'] == '3', 'part']) == parts[:2]
+    user = read_user_tweets(str(tmp_path / 'tweets2020-01-01_manifest.csv'), '3', str(tmp_path) + '/')
+    assert len(user) == 24
+    assert set(user['author_id']) == {'3'}
+
+def test_parts_by_user_chunk(tmp_path, api):
+    collect(tmp_path, api, '-c', '4')
+    files = sorted(f for f in os.listdir(tmp_path) if f.endswith('.pkl'))
+    assert files == ['tweets2020-01-01_from_1_to_nothing.pkl', 'tweets2020-01-01_from_4_to_5.pkl']
+    assert [len(pd.read_pickle(tmp_path / file)) for file in files] == [72, 48]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Checks timestamp parsing, snowflake id decoding and time bins against
+pandas parsing of the same timestamps.
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from conftest import snowflake, make_frame
+from util_functions import parse_times, utc_datetimes, utc_columns, snowflake_times, tweet_times, time_bins, save_text, read_text
+
+# timestamps in the format of the api, one missing
+STAMPS = ['2020-01-01T00:00:00.000Z', '2020-02-29T23:59:59.000Z', None, '2021-06-07T12:30:15.000Z']
+
+def test_parse_times_matches_pandas():
+    expected = pd.to_datetime(pd.Series(STAMPS), utc=True).dt.tz_convert(None).to_numpy()
+    np.testing.assert_array_equal(parse_times(STAMPS), expected)
+
+    # datetimes with and without a time zone give the same naive utc times
+    aware = pd.Series(pd.to_datetime(STAMPS, utc=True))
+    np.testing.assert_array_equal(parse_times(aware), expected)
+    np.testing.assert_array_equal(parse_times(aware.dt.tz_convert('Europe/Helsinki')), expected)
+
+def test_utc_columns_mixes_strings_and_datetimes():
+    old = pd.DataFrame({'id': ['1', '2'], 'created_at': STAMPS[:2], 'user.created_at': STAMPS[2:]})
+    new = utc_columns(old.copy())
+    assert isinstance(new['created_at'].dtype, pd.DatetimeTZDtype)
+    assert new['created_at'].iloc[1] == pd.Timestamp('2020-02-29 23:59:59', tz='UTC')
+    assert pd.isna(new['user.created_at'].iloc[0])
+
+    # converted columns are left as they are
+    assert utc_columns(new.copy())['created_at'].equals(new['created_at'])
+    assert utc_datetimes(pd.Series(STAMPS[:2], index=[5, 7])).index.tolist() == [5, 7]
+
+def test_snowflake_times():
+    times = [datetime(2015, 3, 1, 12, 0, 0, 123000, tzinfo=timezone.utc),
+             datetime(2020, 1, 1, tzinfo=timezone.utc)]
+    ids = [snowflake(t, 77) for t in times]
+    expected = np.array(['2015-03-01T12:00:00.123', '2020-01-01T00:00:00.000'], dtype='datetime64[ms]')
+
+    # ids as strings, integers and floats with missing values
+    np.testing.assert_array_equal(snowflake_times(ids), expected)
+    np.testing.assert_array_equal(snowflake_times([int(i) for i in ids]), expected)
+    decoded = snowflake_times(pd.Series([float(ids[1]), np.nan]))
+    assert abs(decoded[0] - expected[1]) < np.timedelta64(1, 's')
+    assert np.isnat(decoded[1])
+
+    # ids from before snowflakes hold no time
+    assert np.isnat(snowflake_times(['20', '29700859246'])).all()
+
+def test_tweet_times_from_ids_and_created_at():
+    tweets = make_frame(12)
+    from_created = tweet_times(tweets)
+    from_ids = tweet_times(tweets.drop(columns=['created_at']))
+    np.testing.assert_array_equal(from_created.astype('datetime64[s]'), from_ids.astype('datetime64[s]'))
+
+def test_time_bins():
+    bins = {timebin: time_bins(STAMPS[1:2] + STAMPS[3:], timebin) for timebin in ['hour', 'day', 'week', 'month']}
+    assert str(bins['hour'][1]).startswith('2021-06-07T12:00')
+    assert str(bins['day'][0]).startswith('2020-02-29T00:00')
+    assert str(bins['week'][0]).startswith('2020-02-24T00:00')
+    assert str(bins['week'][1]).startswith('2021-06-07T00:00')
+    assert str(bins['month'][1]).startswith('2021-06-01T00:00')
+
+def test_csv_keeps_api_timestamps(tmp_path):
+    tweets = make_frame(5)
+    save_text(tweets, str(tmp_path / 'tweets.csv'))
+    with open(tmp_path / 'tweets.csv', encoding='utf-8') as f:
+        assert tweets['created_at'].iloc[0].strftime('%Y-%m-%dT%H:%M:%S.000Z') in f.read()
+    back = utc_columns(read_text(str(tmp_path / 'tweets.csv')))
+    assert back['created_at'].tolist() == tweets['created_at'].tolist()
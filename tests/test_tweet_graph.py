@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that the compressed sparse row graphs of graph_tweets.py give the
+same references, threads and user interactions as the edge lists of the
+tweets, counting tweets in several files and replies with a reply user once.
+"""
+
+import os
+
+import pandas as pd
+
+from conftest import make_frame, run_script
+from util_functions import TweetGraph, REFERENCE_TYPES
+
+# function to make tweets of a reply thread with a quote, a retweet and a missing reference
+def thread_tweets():
+    return pd.DataFrame({'id': ['101', '102', '103', '104', '105', '106'],
+                         'author_id': ['1', '2', '3', '2', '4', '1'],
+                         'in_reply_to_user_id': [None, '1', '2', None, None, None],
+                         'referenced_tweets.id': [None, '101', '102', '101', '101', '99;101'],
+                         'referenced_tweets.type': [None, 'replied_to', 'replied_to', 'quoted', 'retweeted', 'replied_to;quoted'],
+                         'referenced_tweets.author_id': [None, '1', '2', '1', '1', ';1'],
+                         'entities.mentions': [None, [{'id': '1', 'username': 'u1'}], None, None, None, None]})
+
+# function to build the graph of tweet files with the script
+def build(path, frames):
+    os.makedirs(path / 'tweets')
+    for i, frame in enumerate(frames):
+        frame.to_pickle(path / 'tweets' / ('t' + str(i) + '.pkl'))
+    proc = run_script('graph_tweets.py', ['-i', 'tweets', '-g', 'graph'], path)
+    return TweetGraph(str(path / 'graph')), proc
+
+def test_thread_and_interactions(tmp_path):
+    tweets = thread_tweets()
+    graph, proc = build(tmp_path, [tweets.iloc[:3], tweets.iloc[1:]])
+    assert 'Saved 7 tweets with 6 references and 4 users' in proc.stdout
+
+    assert graph.thread('103') == ['101', '102', '103']
+    assert graph.thread('101') == ['101', '102', '103']
+    assert graph.thread('999') == []
+    assert graph.references('106').values.tolist() == [['99', 'replied_to'], ['101', 'quoted']]
+    incoming = graph.references('101', incoming=True)
+    assert sorted(incoming.values.tolist()) == [['102', 'replied_to'], ['104', 'quoted'], ['105', 'retweeted'], ['106', 'quoted']]
+    assert graph.references('101', kind='quoted', incoming=True)['id'].tolist() == ['104', '106']
+
+    # the reply of 102 is counted once although it is in references and in_reply_to_user_id
+    neighbours = graph.neighbours('2').sort_values('type').values.tolist()
+    assert neighbours == [['1', 'mention', 1], ['1', 'quote', 1], ['1', 'reply', 1]]
+    assert graph.degrees(incoming=True).to_dict() == {'1': 5, '2': 1, '3': 0, '4': 0}
+    assert graph.degrees('reply', incoming=True, weighted=False).to_dict() == {'1': 1, '2': 1, '3': 0, '4': 0}
+
+# function to get references and user interactions of parsed tweets as edge lists
+def edge_lists(tweets):
+    refs, users = [], set()
+    for values in tweets.to_dict('records'):
+        if isinstance(values['referenced_tweets.id'], str):
+            for ref, kind, author in zip(values['referenced_tweets.id'].split(';'), values['referenced_tweets.type'].split(';'),
+                                         values['referenced_tweets.author_id'].split(';')):
+                refs.append((values['id'], ref, kind))
+                if author:
+                    users.add((values['id'], values['author_id'], author, {'replied_to': 'reply', 'quoted': 'quote', 'retweeted': 'retweet'}[kind]))
+        if isinstance(values['in_reply_to_user_id'], str):
+            users.add((values['id'], values['author_id'], values['in_reply_to_user_id'], 'reply'))
+        for mention in values['entities.mentions'] if isinstance(values['entities.mentions'], list) else []:
+            users.add((values['id'], values['author_id'], mention['id'], 'mention'))
+    return refs, users
+
+def test_graph_matches_edge_lists(tmp_path):
+    tweets = pd.concat([make_frame(40, '2020-01-01'), make_frame(40, '2020-01-02', seed=1)], ignore_index=True)
+    graph, proc = build(tmp_path, [tweets.iloc[:50], tweets.iloc[30:]])
+    refs, users = edge_lists(tweets)
+
+    for tid in tweets['id']:
+        expected = sorted((ref, kind) for src, ref, kind in refs if src == tid)
+        assert sorted(map(tuple, graph.references(tid).values.tolist())) == expected
+    assert all(kind in REFERENCE_TYPES for _, _, kind in refs)
+
+    pairs = pd.DataFrame(list(users), columns=['tweet', 'user', 'dst', 'type'])
+    for user, expected in pairs.groupby('user'):
+        counts = expected.groupby(['dst', 'type']).size().to_dict()
+        neighbours = graph.neighbours(user)
+        assert dict(zip(zip(neighbours['user_id'], neighbours['type']), neighbours['tweets'])) == counts
+    assert graph.degrees(incoming=True).to_dict() == \
+        pairs.groupby('dst').size().reindex(graph.user_ids.astype(str), fill_value=0).to_dict()
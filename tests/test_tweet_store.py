@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that TweetStore queries give the same tweets as filtering all
+collected tweets with pandas, while skipping files by their statistics, and
+that the statistics follow new, changed and removed files.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_frame
+from util_functions import TweetStore, save_text, save_feather, tweet_coordinates, STORE_STATS
+
+pytest.importorskip('pyarrow')
+
+# function to turn a query time to a utc timestamp
+def utc_stamp(value):
+    stamp = pd.Timestamp(value)
+    return stamp.tz_localize('UTC') if stamp.tzinfo is None else stamp.tz_convert('UTC')
+
+# function to save days of tweets in the formats of the collectors
+def make_store(path):
+    os.makedirs(path / 'bbox')
+    frames = {'t1.pkl': make_frame(30, '2020-01-01', seed=1), 't2.pkl': make_frame(30, '2020-01-02', seed=2),
+              'bbox/t3.jsonl.gz': make_frame(20, '2020-02-01', seed=3)}
+    frames['t2.pkl'][['geo.coordinates.x', 'geo.centroid.x']] += 1
+    frames['bbox/t4.feather'] = make_frame(20, '2020-03-01', seed=4)
+    for name, frame in frames.items():
+        if name.endswith('.pkl'):
+            frame.to_pickle(path / name)
+        elif name.endswith('.feather'):
+            save_feather(frame, str(path / name))
+        else:
+            save_text(frame, str(path / name))
+    return pd.concat(frames.values(), ignore_index=True)
+
+# function to filter tweets with pandas
+def brute_force(tweets, start=None, end=None, bbox=None, locinfo=None, lang=None):
+    x, y, gps = tweet_coordinates(tweets)
+    mask = pd.Series(True, index=tweets.index)
+    if start is not None:
+        mask &= tweets['created_at'] >= utc_stamp(start)
+    if end is not None:
+        mask &= tweets['created_at'] < utc_stamp(end)
+    if bbox is not None:
+        mask &= (x >= bbox[0]) & (x <= bbox[2]) & (y >= bbox[1]) & (y <= bbox[3])
+    if locinfo == 'gps':
+        mask &= gps
+    elif locinfo == 'bbox':
+        mask &= ~gps & ~np.isnan(x)
+    if lang is not None:
+        mask &= tweets['lang'].isin([lang] if isinstance(lang, str) else lang)
+    return sorted(tweets.loc[mask, 'id'])
+
+QUERIES = [{}, {'start': '2020-01-01 12:00', 'end': '2020-02-01'}, {'start': '2020-01-02T01:00:00+02:00'},
+           {'bbox': (24.9, 60.1, 24.915, 60.2)}, {'locinfo': 'gps'}, {'locinfo': 'bbox', 'lang': ['fi', 'sv']},
+           {'lang': 'en', 'end': '2020-01-02'}, {'start': '2021-01-01'}]
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_queries_match_brute_force(tmp_path, query):
+    tweets = make_store(tmp_path)
+    store = TweetStore(str(tmp_path))
+    result = store.read(columns=['id', 'created_at', 'lang', 'x_coord', 'y_coord'], **query)
+    assert sorted(result['id']) == brute_force(tweets, **query)
+    assert result.columns.tolist() == ['id', 'created_at', 'lang', 'x_coord', 'y_coord']
+    if len(result) > 0:
+        assert isinstance(result['created_at'].dtype, pd.DatetimeTZDtype)
+
+def test_files_are_skipped_by_stats(tmp_path):
+    make_store(tmp_path)
+    store = TweetStore(str(tmp_path))
+    assert len(store.files()) == 4
+    assert store.files(start='2020-01-02', end='2020-02-01') == [str(tmp_path / 't2.pkl')]
+    assert store.files(bbox=(25.8, 60.0, 26.0, 61.0)) == [str(tmp_path / 't2.pkl')]
+    assert store.files(lang='xx') == []
+    with pytest.raises(ValueError):
+        store.files(locinfo='place')
+
+def test_stats_follow_files(tmp_path):
+    make_store(tmp_path)
+    TweetStore(str(tmp_path))
+    statfile = tmp_path / STORE_STATS
+    written = os.stat(statfile).st_mtime_ns
+
+    # unchanged files are not read again
+    TweetStore(str(tmp_path))
+    assert os.stat(statfile).st_mtime_ns == written
+
+    # changed, new and removed files update the statistics
+    make_frame(5, '2020-05-01').to_pickle(tmp_path / 't1.pkl')
+    make_frame(3, '2020-06-01').to_pickle(tmp_path / 't5.pkl')
+    os.remove(tmp_path / 't2.pkl')
+    pd.to_pickle({'not': 'tweets'}, tmp_path / 'other.pkl')
+    store = TweetStore(str(tmp_path))
+    with open(statfile) as f:
+        stats = json.load(f)
+    assert stats['t1.pkl']['rows'] == 5 and stats['t5.pkl']['rows'] == 3 and stats['other.pkl']['rows'] == 0
+    assert 't2.pkl' not in stats
+    assert len(store.read(start='2020-05-01')) == 8
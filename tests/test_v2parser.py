@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that v2parser keeps every tweet of the streamed pages whether or not
+they have includes, and that field profiles project the request and the
+parsed columns.
+"""
+
+import pytest
+
+from conftest import make_tweets, make_pages, make_messages
+from util_functions import v2parser, message_pages, field_profile, project_fields, TWEET_FIELDS
+
+def test_pages_with_includes():
+    tweets = make_tweets(25)
+    outdf = v2parser(make_messages(make_pages(tweets, per_page=10)), 3)
+    assert sorted(outdf['id']) == sorted(t['id'] for t in tweets)
+    assert outdf['user.username'].notna().all()
+    assert outdf['geo.full_name'].notna().all()
+
+def test_pages_without_includes_keep_all_tweets():
+    tweets = make_tweets(3)
+    outdf = v2parser(make_messages(make_pages(tweets, includes=False)), 1)
+    assert sorted(outdf['id']) == sorted(t['id'] for t in tweets)
+    assert 'user.username' not in outdf.columns
+
+def test_mixed_and_empty_pages():
+    first, second = make_tweets(4, seed=1), make_tweets(3, seed=2)
+    pages = make_pages(first) + make_pages([]) + make_pages(second, includes=False)
+    assert [len(tweets) for tweets, _ in message_pages(make_messages(pages))] == [4, 0, 3]
+
+    outdf = v2parser(make_messages(pages), 3)
+    assert sorted(outdf['id']) == sorted(t['id'] for t in first + second)
+
+def test_only_empty_pages():
+    outdf = v2parser(make_messages(make_pages([])), 1)
+    assert len(outdf) == 0
+    assert len(outdf.columns) == 0
+
+def test_field_profile_projects_columns():
+    fields = field_profile({'field_profile': 'geo-minimal'})
+    assert fields['tweet_fields'] == 'author_id,created_at,geo,id,text'
+    assert fields['user_fields'] == ''
+    assert set(project_fields(TWEET_FIELDS, fields['tweet_fields'], 'tweet_fields')) == \
+        {'id', 'author_id', 'created_at', 'text', 'geo.place_id', 'geo.coordinates.type',
+         'geo.coordinates.coordinates'}
+
+    # the api leaves out fields that were not requested
+    keep = set(fields['tweet_fields'].split(','))
+    tweets = [{k: v for k, v in t.items() if k in keep} for t in make_tweets(6)]
+    outdf = v2parser(make_messages(make_pages(tweets)), 1, fields)
+    assert len(outdf) == 6
+    assert 'lang' not in outdf.columns
+    assert outdf['geo.coordinates.x'].notna().sum() == 2
+
+def test_field_profile_overrides_and_errors():
+    fields = field_profile({'field_profile': 'geo-users', 'user_fields': 'username, location'})
+    assert fields['user_fields'] == 'username,location'
+    assert fields['expansions'] == 'author_id,geo.place_id'
+    with pytest.raises(ValueError):
+        field_profile({'field_profile': 'missing'})
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the lease semantics of WorkQueue, and that queue_tweets.py workers in
+separate processes collect every unit of a job once, also units whose
+worker died.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from conftest import ROOT, write_keys, run_script
+from util_functions import WorkQueue
+
+# code of a worker process leasing units and logging each run of a unit
+WORKER = '''
+import sys, time
+sys.path.insert(0, sys.argv[1])
+from util_functions import WorkQueue
+queue = WorkQueue(sys.argv[2], lease=float(sys.argv[3]))
+while True:
+    unit = queue.lease(sys.argv[4])
+    if unit is None:
+        counts = queue.status().sum()
+        if counts['todo'] + counts['leased'] + counts['expired'] == 0:
+            break
+        time.sleep(0.05)
+        continue
+    with open(sys.argv[5], 'a') as f:
+        f.write(unit['key'] + ' ' + sys.argv[4] + '\\n')
+    time.sleep(0.01)
+    assert queue.complete(unit, 1)
+'''
+
+# function to make a queue with units of one job
+def make_queue(path, n=3, **kwargs):
+    queue = WorkQueue(str(path / 'queue.sqlite'), **kwargs)
+    queue.publish([('job/' + str(i), 'job', {'day': i}) for i in range(n)])
+    return queue
+
+def test_publish_and_lease_in_order(tmp_path):
+    queue = make_queue(tmp_path)
+    assert queue.publish([('job/0', 'job', {}), ('job/3', 'job', {'day': 3})]) == 1
+
+    unit = queue.lease('a')
+    assert unit['key'] == 'job/0'
+    assert unit['payload'] == {'day': 0}
+    assert queue.lease('b')['key'] == 'job/1'
+    assert queue.status().loc['job'].to_dict() == {'todo': 2, 'leased': 2, 'done': 0, 'failed': 0, 'expired': 0}
+
+def test_expired_lease_is_taken_over(tmp_path):
+    queue = make_queue(tmp_path, n=1, lease=0.2)
+    first = queue.lease('a')
+    assert queue.lease('b') is None
+
+    # the lease runs out and the unit goes to the next worker with a new token
+    time.sleep(0.3)
+    assert queue.status().loc['job', 'expired'] == 1
+    second = queue.lease('b')
+    assert second['key'] == first['key']
+    assert second['token'] == first['token'] + 1
+
+    # the first worker can no longer renew or complete the unit
+    assert not queue.heartbeat(first)
+    assert not queue.complete(first, 5)
+    assert queue.complete(second, 7)
+    assert queue.status().loc['job', 'done'] == 1
+
+def test_heartbeat_keeps_lease(tmp_path):
+    queue = make_queue(tmp_path, n=1, lease=0.3)
+    unit = queue.lease('a')
+    with queue.keep_alive(unit) as lost:
+        time.sleep(0.6)
+        assert queue.lease('b') is None
+    assert not lost.is_set()
+    assert queue.complete(unit)
+
+def test_release_retries_until_failed(tmp_path):
+    queue = make_queue(tmp_path, n=1, max_attempts=2)
+    unit = queue.lease('a')
+    assert queue.release(unit, 'timeout')
+    assert queue.status().loc['job', 'todo'] == 1
+
+    unit = queue.lease('b')
+    assert queue.release(unit, 'timeout')
+    assert queue.status().loc['job', 'failed'] == 1
+    assert queue.lease('c') is None
+
+    # retry puts failed units back with their attempts reset
+    assert queue.retry() == 1
+    assert queue.lease('c')['key'] == 'job/0'
+
+def test_expired_lease_on_last_attempt_fails(tmp_path):
+    queue = make_queue(tmp_path, n=1, lease=0.1, max_attempts=1)
+    queue.lease('a')
+    time.sleep(0.2)
+    assert queue.lease('b') is None
+    assert queue.status().loc['job', 'failed'] == 1
+
+def test_two_processes_run_each_unit_once(tmp_path):
+    queue = make_queue(tmp_path, n=40, lease=0.5)
+
+    # a worker that died holding a unit
+    dead = queue.lease('dead')
+    log = str(tmp_path / 'runs.log')
+    procs = [subprocess.Popen([sys.executable, '-c', WORKER, ROOT, queue.path, '0.5', name, log])
+             for name in ('w1', 'w2')]
+    for proc in procs:
+        assert proc.wait(timeout=60) == 0
+
+    runs = pd.read_csv(log, sep=' ', names=['key', 'worker'])
+    assert sorted(runs['key']) == sorted('job/' + str(i) for i in range(40))
+    assert runs.loc[runs['key'] == dead['key'], 'worker'].iloc[0] != 'dead'
+    assert not queue.complete(dead)
+    assert queue.status().loc['job', 'done'] == 40
+
+def test_queue_tweets_workers(tmp_path, api):
+    write_keys(tmp_path, api)
+    with open(tmp_path / 'jobs.yaml', 'w') as f:
+        f.write('jobs:\n    - name: weather\n      type: query\n      config: search_config.yaml\n'
+                '      startdate: 2020-01-01\n      enddate: 2020-01-05\n      output: pkl\n      outpath: out/\n')
+    os.mkdir(tmp_path / 'out')
+    run_script('queue_tweets.py', ['-m', 'publish', '-q', 'queue.sqlite', '-j', 'jobs.yaml'], tmp_path)
+    proc = run_script('queue_tweets.py', ['-m', 'publish', '-q', 'queue.sqlite', '-j', 'jobs.yaml'], tmp_path)
+    assert 'Published 0 new of 4 units' in proc.stdout
+
+    # two workers share the units
+    procs = [subprocess.Popen([sys.executable, os.path.join(ROOT, 'queue_tweets.py'), '-m', 'work', '-q', 'queue.sqlite',
+                               '-wk', name, '-p', '0.1'], cwd=tmp_path, stdout=subprocess.PIPE, text=True)
+             for name in ('w1', 'w2')]
+    outputs = [proc.communicate(timeout=120)[0] for proc in procs]
+    assert [proc.returncode for proc in procs] == [0, 0]
+
+    # each day was requested and saved once
+    days = sorted(request['start_time'][:10] for request in api.requests)
+    assert days == ['2020-01-01', '2020-01-01', '2020-01-02', '2020-01-02',
+                    '2020-01-03', '2020-01-03', '2020-01-04', '2020-01-04']
+    assert sorted(os.listdir(tmp_path / 'out')) == ['tweets2020-01-0' + str(i) + '.pkl' for i in range(1, 5)]
+    assert sum(output.count('Got 12 tweets from unit') for output in outputs) == 4
+    assert len(pd.read_pickle(tmp_path / 'out' / 'tweets2020-01-02.pkl')) == 12
@@ -45,17 +45,27 @@ ends the collection on 23:59:59 on the day before the end date.
 @author: Tuomas Väisänen & Seija Sirkiä
 """
 
-from util_functions import v2parser, daterange
-from searchtweets import ResultStream, gen_request_parameters, load_credentials, read_config
 from datetime import datetime
 import time
 import argparse
-import pandas as pd
 import gc
 
-# define function to iterate over users in chunks
-def chunker(sequence, size):
-    return (sequence[pos:pos + size] for pos in range(0, len(sequence), size))
+# define function to save a part file and record its users in the manifest
+def save_part(results, partname, manifest):
+    
+    # save to file
+    if args['output'] == 'pkl':
+        # save to pickle
+        results.to_pickle(outpath + partname)
+    elif args['output'] in TEXT_FORMATS:
+        # save to csv or json lines, compressed by extension
+        save_text(results, outpath + partname)
+    
+    # record tweet counts per user in the part
+    for usr_id, count in results['author_id'].astype(str).value_counts(sort=False).items():
+        manifest.append({'usr_id': usr_id, 'part': partname, 'tweets': count, 'status': 'saved'})
+    
+    print('[INFO] - Saved ' + str(len(results)) + ' tweets to ' + partname)
 
 # Set up the argument parser
 ap = argparse.ArgumentParser()
@@ -78,7 +88,8 @@ ap.add_argument("-ed", "--enddate", required=True,
 
 # get save format
 ap.add_argument("-o", "--output", required=True, default='pkl',
-                help="Output file format, valid options are either pkl or csv. "
+                help="Output file format, valid options are pkl, csv or jsonl, csv and "
+                "jsonl optionally compressed as csv.gz, csv.zst, jsonl.gz or jsonl.zst. "
                 "Default: pkl")
 
 # get output path
@@ -88,17 +99,42 @@ ap.add_argument("-op", "--outpath", required=False,
 
 # get user chunk size
 ap.add_argument("-c", "--chunksize", required=False, default=20,
-                help="The number of users to save into single dataframe."
+                help="The number of users to save into single dataframe. "
+                "Used only if neither --rows nor --membudget is set. "
                 "Default: 20")
 
+# get target row count per file
+ap.add_argument("-r", "--rows", required=False, default=None,
+                help="Target number of tweets per output file. Collected tweets "
+                "are written out in files of this many tweets regardless of "
+                "how many users they come from.")
+
+# get memory budget per file
+ap.add_argument("-mb", "--membudget", required=False, default=None,
+                help="Memory budget in megabytes for collected tweets held "
+                "before writing them out to a file.")
+
 # Parse arguments
 args = vars(ap.parse_args())
 
+# output formats, the text formats are TEXT_FORMATS of util_functions.py
+OUTPUTS = ['pkl', 'csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'jsonl.zst']
+
+# check arguments before importing heavy libraries, so errors return at once
+if args['output'] not in OUTPUTS:
+    ap.error('invalid output file, valid options are ' + ', '.join(OUTPUTS))
+if args['enddate'] <= args['startdate']:
+    ap.error('end date has to be after the start date')
+
 # get output path
-outpath = args['output']
+outpath = args['outpath'] if args['outpath'] is not None else ''
 
 # get chunk size
-user_chunksize = args['chunksize']
+user_chunksize = int(args['chunksize'])
+
+# get target rows and memory budget in bytes
+target_rows = int(args['rows']) if args['rows'] is not None else None
+membudget = float(args['membudget']) * 1024 * 1024 if args['membudget'] is not None else None
 
 # check if output filetypes are valid
 if args['output'] == 'pkl':
@@ -106,15 +142,21 @@ if args['output'] == 'pkl':
     # save to pickle
     print('[INFO] - Output file set to pickle')
     
-elif args['output'] == 'csv':
-    
-    # save to csv
-    print('[INFO] - Output file set to csv')
-    
 else:
     
-    print('[INFO] - Invalid output file! Valid options are pickle or csv. Exiting...')
-    exit
+    # save to csv or json lines
+    print('[INFO] - Output file set to ' + args['output'])
+
+# load twitter keys and configuration for search query
+from searchtweets import gen_request_parameters, load_credentials, read_config
+search_creds = load_credentials('.twitter_keys.yaml',
+                               yaml_key = 'search_tweets_v2',
+                               env_overwrite = False)
+config = read_config('search_config.yaml')
+
+# import heavy libraries after checking arguments and config
+from util_functions import v2parser, field_profile, TEXT_FORMATS, save_text, order_columns, make_pooled_session, stream_tweets, is_tweet, session_stats, RateLimiter
+import pandas as pd
 
 # read user list here
 users = pd.read_csv(args['userlist'])
@@ -122,184 +164,189 @@ users = pd.read_csv(args['userlist'])
 # convert to list
 users = users['usr_id'].values.tolist()
 
-# load twitter keys
-search_creds = load_credentials('.twitter_keys.yaml',
-                               yaml_key = 'search_tweets_v2',
-                               env_overwrite = False)
-
-# load configuration for search query
-config = read_config('search_config.yaml')
+# open one pooled session and rate limiter for the whole run
+session = make_pooled_session(search_creds['bearer_token'])
+limiter = RateLimiter()
 
-# fields for v2 api
-tweetfields = ",".join(["attachments", "author_id", "conversation_id", "created_at",
-                        "entities", "geo", "id", "in_reply_to_user_id", "lang",
-                        "public_metrics", "possibly_sensitive", "referenced_tweets",
-                        "reply_settings", "text", "withheld",])
-userfields = ",".join(["created_at", "description", "entities", "location",
-                       "name", "profile_image_url", "protected", "public_metrics",
-                       "url", "username", "verified", "withheld"])
-mediafields= ",".join(["media_key", "type", "url"])
-placefields = ",".join(["contained_within", "country", "country_code", "full_name",
-                        "geo", "id", "name",  "place_type"])
-expansions = ",".join(["attachments.media_keys", "author_id", "entities.mentions.username",
-                       "geo.place_id", "in_reply_to_user_id", "referenced_tweets.id",
-                       "referenced_tweets.id.author_id"])
+# get request fields and expansions of the field profile
+fields = field_profile(config)
 
 # set interval to loop through
 start_date = args['startdate'].date()
 end_date = args['enddate'].date()
 
-# get chunks of user list
-for userchunk in chunker(users, 20):
-    print('users in chunk ' + str(len(userchunk)) + ' and second user id is ' + str(userchunk[1]))
+# set up file prefix from config
+file_prefix_w_date = config['filename_prefix'] + start_date.isoformat()
+outmanifest = file_prefix_w_date + '_manifest.csv'
+
+# buffered user dataframes with their tweet and byte counts
+dflist = []
+buffer_rows = 0
+buffer_bytes = 0
+buffer_users = 0
+
+# manifest rows of users to output parts and part counter
+manifest = []
+part = 0
+
+# loop over users
+for ix, user in enumerate(users):
     
-    # get list for user dataframes
-    dflist = []
+    # form search query per user and rule out retweets, replies and quote tweets
+    search_q = 'from:{} -is:retweet has:geo'.format(user)
     
-    # get first and last users
-    fuser = userchunk[0]
-    luser = userchunk[-1]
+    # payload rules for v2 api
+    rule = gen_request_parameters(query = search_q,
+                                  results_per_call = config['results_per_call'],
+                                  start_time = start_date.isoformat(),
+                                  end_time = end_date.isoformat(),
+                                  **fields,
+                                  stringify = False)
     
-    # loop over users in chunk
-    for user in userchunk:
-        
-        # form search query per user and rule out retweets, replies and quote tweets
-        search_q = 'from:{} -is:retweet has:geo'.format(user)
-        
-        # payload rules for v2 api
-        rule = gen_request_parameters(query = search_q,
-                                      results_per_call = config['results_per_call'],
-                                      start_time = start_date.isoformat(),
-                                      end_time = end_date.isoformat(),
-                                      tweet_fields = tweetfields,
-                                      user_fields = userfields,
-                                      media_fields = mediafields,
-                                      place_fields = placefields,
-                                      expansions = expansions,
-                                      stringify = False)
-        
-        # result stream from twitter v2 api
-        rs = ResultStream(request_parameters = rule,
-                          max_results=100000,
-                          max_pages=1,
-                          max_tweets = config['max_tweets'],
-                          **search_creds)
-        
-        # number of reconnection tries
-        tries = 10
-        
-        # while loop to protect against 104 error
-        while True:
-            tries -= 1
-            
-            # attempt retrieving tweets
-            try:
-                # indicate which day is getting retrieved
-                print('[INFO] - Retrieving tweets between ' + str(start_date) + ' and ' + str(end_date))
-            
-                # get json response to list
-                tweets = list(rs.stream())
-                
-                # add check to adjust wait time
-                if len(tweets) < 500:
-                        
-                    # wait for 7 seconds to not hit rate limits if zero tweets
-                    time.sleep(7)
-                    
-                else:
-                    
-                    # wait a bit longer
-                    time.sleep(18)
-                    
-                # break free from while loop
-                break
-            except Exception as err:
-                if tries == 0:
-                    raise err
-                else:
-                    print('[INFO] - Got connection error, waiting 15 seconds and trying again. ' + str(tries) + ' tries left.')
-                    time.sleep(15)
+    # number of reconnection tries
+    tries = 10
+    
+    # while loop to protect against 104 error
+    while True:
+        tries -= 1
         
-        # inform how many tweets per user were collected
-        print('[INFO] - Collected ' + str(len(tweets)) + ' tweets from user ' + str(user))
+        # attempt retrieving tweets
+        try:
+            # indicate which day is getting retrieved
+            print('[INFO] - Retrieving tweets between ' + str(start_date) + ' and ' + str(end_date))
         
-        # parse results to dataframe
-        if len(tweets) != 0:
-            try:
-                # convert json to dataframe
-                print('[INFO] - Parsing collected tweets of user ' + str(user) + ' from ' + str(start_date) + ' to ' + str(end_date))
-                tweetdf = v2parser(tweets, config['results_per_call'])
+            # get json response to list, the rate limiter spaces the requests
+            tweets = list(stream_tweets(session, search_creds['endpoint'], rule, config['max_tweets'], limiter))
             
-            except:
-                print('[INFO] - User id ' + str(user) + ' tweets could not be converted to dataframe..')
-                pass
-        else:
-            print('[INFO] - User id ' + str(user) + ' is missing or has no tweets. Moving on...')
-            pass
-                
-        
-        # try to order columns semantically
+            # break free from while loop
+            break
+        except Exception as err:
+            if tries == 0:
+                raise err
+            else:
+                print('[INFO] - Got connection error, waiting 15 seconds and trying again. ' + str(tries) + ' tries left.')
+                time.sleep(15)
+    
+    # inform how many tweets per user were collected, leaving out includes and meta objects
+    count = len([d for d in tweets if is_tweet(d)])
+    print('[INFO] - Collected ' + str(count) + ' tweets from user ' + str(user))
+    
+    # placeholder for parsed tweets
+    tweetdf = None
+    
+    # parse results to dataframe
+    if count != 0:
         try:
-            tweetdf = tweetdf[['id', 'author_id', 'created_at', 'reply_settings', 'conversation_id',
-                               'in_reply_to_user_id', 'text', 'possibly_sensitive',
-                               'lang', 'referenced_tweets', 'referenced_tweets.id', 
-                               'referenced_tweets.author_id', 'referenced_tweets.type',
-                               'public_metrics.retweet_count', 'public_metrics.reply_count',
-                               'public_metrics.like_count', 'public_metrics.quote_count',
-                               'entities.mentions', 'entities.urls', 'entities.hashtags',
-                               'entities.annotations', 'attachments.media_keys',
-                               'attachments.media_types', 'user.description', 'user.verified', 'user.id', 'user.protected',
-                               'user.url', 'user.profile_image_url', 'user.location', 'user.name',
-                               'user.created_at', 'user.username', 'user.public_metrics.followers_count',
-                               'user.public_metrics.following_count', 'user.public_metrics.tweet_count',
-                               'user.public_metrics.listed_count', 'user.entities.description.hashtags',
-                               'user.entities.url.urls', 'user.entities.description.mentions',
-                               'user.entities.description.urls', 'geo.place_id', 'geo.coordinates.type',
-                               'geo.coordinates.coordinates', 'geo.coordinates.x', 'geo.coordinates.y',
-                               'geo.full_name', 'geo.name', 'geo.place_type', 'geo.country',
-                               'geo.country_code', 'geo.type', 'geo.bbox', 'geo.centroid',
-                               'geo.centroid.x', 'geo.centroid.y']]
-        except:
-            pass
+            # convert json to dataframe
+            print('[INFO] - Parsing collected tweets of user ' + str(user) + ' from ' + str(start_date) + ' to ' + str(end_date))
+            tweetdf = v2parser(tweets, config['results_per_call'], fields)
         
-        # append dataframe to dataframe list
-        try:
-            dflist.append(tweetdf)
-            gc.collect()
-            
-            # delete dataframe variable to cleanse the memory buffer
-            del tweetdf
         except:
-            print('[INFO] - No tweets saved because users have no content from the time period. Moving on..')
-            pass
-    
-    # concatenate result dataframe
-    if len(dflist) > 0:
+            print('[INFO] - User id ' + str(user) + ' tweets could not be converted to dataframe..')
+            
+            # record user whose tweets were lost in the manifest
+            manifest.append({'usr_id': str(user), 'part': None, 'tweets': 0, 'status': 'failed'})
+    else:
+        print('[INFO] - User id ' + str(user) + ' is missing or has no tweets. Moving on...')
         
-        # concatenate
-        results = pd.concat(dflist, ignore_index=True)
+        # record user without tweets in the manifest
+        manifest.append({'usr_id': str(user), 'part': None, 'tweets': 0, 'status': 'empty'})
+    
+    # free memory from raw tweets
+    del tweets
     
-        # set up file prefix from config
-        file_prefix_w_date = config['filename_prefix'] + start_date.isoformat()
-        userstring = '_from_' + str(fuser) + '_to_' + str(luser)
-        outpickle = file_prefix_w_date + userstring + '.pkl'
-        outcsv = file_prefix_w_date + userstring + '.csv'
+    # remember first user of the buffer for naming user chunks
+    if buffer_users == 0:
+        first_user = user
+    
+    # append parsed tweets to buffer
+    if tweetdf is not None:
         
-        # save to file
-        if args['output'] == 'pkl':
-            # save to pickle
-            results.to_pickle(outpath + outpickle)
-        elif args['output'] == 'csv':
-            # save to csv
-            results.to_csv(outpath + outcsv, sep=';', encoding='utf-8')
+        # try to order columns semantically
+        tweetdf = order_columns(tweetdf)
         
-        # free up memory
-        del results, dflist
-        gc.collect()
+        # add to buffer and update its size
+        dflist.append(tweetdf)
+        buffer_rows += len(tweetdf)
+        if membudget is not None:
+            buffer_bytes += tweetdf.memory_usage(deep=True).sum()
+        del tweetdf
+    
+    # count users in buffer and remember part counter before flushing
+    buffer_users += 1
+    parts_before = part
+    
+    # check if buffer is flushed by user count
+    if target_rows is None and membudget is None:
         
+        # flush whole buffer when user chunk is full or users run out
+        if buffer_users >= user_chunksize or ix == len(users) - 1:
+            
+            # concatenate and save if there are tweets, named after the first and last user of the chunk
+            if len(dflist) > 0:
+                results = pd.concat(dflist, ignore_index=True)
+                userstring = '_from_' + str(first_user) + '_to_' + str(user)
+                save_part(results, file_prefix_w_date + userstring + '.' + args['output'], manifest)
+                part += 1
+                del results
+            else:
+                print('[INFO] - No data in current user chunk. Moving on...')
+            
+            # empty the buffer
+            dflist = []
+            buffer_rows = 0
+            buffer_users = 0
+            gc.collect()
+    
+    # otherwise flush full parts by tweet volume and memory
     else:
         
-        print('[INFO] - No data in current user chunk. Moving on...')
-        pass
+        # check if the buffer exceeds the row target or memory budget
+        if len(dflist) > 0 and ((target_rows is not None and buffer_rows >= target_rows) or
+                                (membudget is not None and buffer_bytes >= membudget)):
+            
+            # concatenate buffer
+            results = pd.concat(dflist, ignore_index=True)
+            
+            # get number of rows in a part, the smaller of row target and memory budget
+            part_rows = len(results)
+            if target_rows is not None:
+                part_rows = min(part_rows, target_rows)
+            if membudget is not None and buffer_bytes >= membudget:
+                part_rows = min(part_rows, max(1, int(len(results) * membudget / buffer_bytes)))
+            
+            # write out full parts of even size
+            start = 0
+            while len(results) - start >= part_rows:
+                save_part(results.iloc[start:start + part_rows], file_prefix_w_date + '_part' + str(part) + '.' + args['output'], manifest)
+                part += 1
+                start += part_rows
+            
+            # keep the remainder in the buffer
+            rest = results.iloc[start:].reset_index(drop=True)
+            dflist = [rest] if len(rest) > 0 else []
+            buffer_rows = len(rest)
+            buffer_bytes = buffer_bytes * len(rest) / len(results)
+            del results, rest
+            gc.collect()
+        
+        # flush remainder after the last user
+        if ix == len(users) - 1 and len(dflist) > 0:
+            results = pd.concat(dflist, ignore_index=True)
+            save_part(results, file_prefix_w_date + '_part' + str(part) + '.' + args['output'], manifest)
+            part += 1
+            del results
+            dflist = []
+            gc.collect()
+    
+    # update manifest after every written part
+    if part != parts_before or ix == len(users) - 1:
+        pd.DataFrame(manifest, columns=['usr_id', 'part', 'tweets', 'status']).to_csv(outpath + outmanifest, sep=';',
+                                                                           encoding='utf-8', index=False)
+
+# report connection reuse and close session
+n_requests, n_connections = session_stats(session)
+print('[INFO] - Sent ' + str(n_requests) + ' requests over ' + str(n_connections) + ' connections.')
+session.close()
 
 print('[INFO] - ... done!')
\ No newline at end of file
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:02:37 2026
+
+INFO
+####
+
+This script is a single entry point to the collector scripts. The first
+argument picks the mode and the remaining arguments are passed on to the
+script of the mode as they are:
+
+    query       v2_tweets_to_file.py
+    bbox        bbox_tweets_to_file.py
+    timeline    timeline_tweets_to_file.py
+    preview     preview_tweets.py
+    combine     combine_tweets.py
+
+Only the standard library is imported here, and the scripts import pandas,
+geopandas and searchtweets after checking their arguments, so help, argument
+errors and typos return in a fraction of a second. util_functions.py imports
+geopandas, shapely, requests, pyarrow and zstandard only in the functions
+using them.
+
+REQUIREMENTS
+############
+
+Files:
+    the files the script of the mode needs
+
+Installed:
+    Python 3.8 or newer
+
+USAGE
+#####
+
+Run a mode by typing the arguments of its script after the mode, like:
+
+    python tweetsearcher.py query -sd YEAR-MO-DA -ed YEAR-MO-DA -o pkl -w 45 -s iterative
+    python tweetsearcher.py bbox -sd YEAR-MO-DA -ed YEAR-MO-DA -w 15 -in 20 -b /path/to/bbox.gpkg -o path/to/results/
+
+See the arguments of a mode with:
+
+    python tweetsearcher.py bbox --help
+
+NOTE
+####
+
+The scripts can still be run on their own.
+
+@author: Tuomas Väisänen & Seija Sirkiä
+"""
+
+import argparse
+import runpy
+import sys
+import os
+
+# scripts and descriptions of the modes
+MODES = {'query': ('v2_tweets_to_file.py', 'Collect tweets of a search query'),
+         'bbox': ('bbox_tweets_to_file.py', 'Collect tweets of a bounding box grid'),
+         'timeline': ('timeline_tweets_to_file.py', 'Collect tweets of a list of users'),
+         'preview': ('preview_tweets.py', 'Sample a search query and estimate its tweets'),
+         'combine': ('combine_tweets.py', 'Combine collected files into one file')}
+
+# Set up the argument parser
+ap = argparse.ArgumentParser(description='Collect and combine tweets. Arguments after the mode are '
+                             'passed to its script, see them with: tweetsearcher.py MODE --help')
+
+# get mode, the rest of the arguments go to its script
+modes = ap.add_subparsers(dest='mode', metavar='MODE', required=True)
+for mode, (script, description) in MODES.items():
+    modes.add_parser(mode, help=description + ' (' + script + ')', add_help=False)
+
+# Parse arguments, keeping the unknown ones for the script
+args, arguments = ap.parse_known_args()
+args = vars(args)
+
+# run the script of the mode as if it was started itself
+script = os.path.join(os.path.dirname(os.path.abspath(__file__)), MODES[args['mode']][0])
+sys.argv = [script] + arguments
+runpy.run_path(script, run_name='__main__')
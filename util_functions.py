@@ -27,117 +27,3163 @@ functionality. Create a new branch, test, test, test, and send a pull request.
 @author: Tuomas Väisänen
 """
 
-from shapely.geometry import Point, Polygon
 import pandas as pd
-import copy
-from datetime import timedelta
+import numpy as np
+import sys
+import os
+import glob
+import fnmatch
+import json
+import urllib.parse
+import re
+import time
+import sqlite3
+import gzip
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
+
+# geopandas, shapely, requests, pyarrow and zstandard are imported in the functions
+# using them, so scripts not using them start faster
+
+# semantic column order of parsed tweets
+TWEET_COLUMNS = ['id', 'author_id', 'created_at', 'reply_settings', 'conversation_id',
+                 'in_reply_to_user_id', 'text', 'possibly_sensitive',
+                 'lang', 'referenced_tweets', 'referenced_tweets.id',
+                 'referenced_tweets.author_id', 'referenced_tweets.type',
+                 'public_metrics.retweet_count', 'public_metrics.reply_count',
+                 'public_metrics.like_count', 'public_metrics.quote_count',
+                 'entities.mentions', 'entities.urls', 'entities.hashtags',
+                 'entities.annotations', 'attachments.media_keys',
+                 'attachments.media_types', 'user.description', 'user.verified', 'user.id', 'user.protected',
+                 'user.url', 'user.profile_image_url', 'user.location', 'user.name',
+                 'user.created_at', 'user.username', 'user.public_metrics.followers_count',
+                 'user.public_metrics.following_count', 'user.public_metrics.tweet_count',
+                 'user.public_metrics.listed_count', 'user.entities.description.hashtags',
+                 'user.entities.url.urls', 'user.entities.description.mentions',
+                 'user.entities.description.urls', 'geo.place_id', 'geo.coordinates.type',
+                 'geo.coordinates.coordinates', 'geo.coordinates.x', 'geo.coordinates.y',
+                 'geo.full_name', 'geo.name', 'geo.place_type', 'geo.country',
+                 'geo.country_code', 'geo.type', 'geo.bbox', 'geo.centroid',
+                 'geo.centroid.x', 'geo.centroid.y']
+
+# semantic column order of parsed bounding box tweets
+BBOX_COLUMNS = ['id', 'author_id', 'created_at', 'conversation_id',
+                'in_reply_to_user_id', 'text', 'lang',
+                'public_metrics.retweet_count',
+                'public_metrics.reply_count', 'public_metrics.like_count',
+                'public_metrics.quote_count', 'user.location',
+                'user.created_at', 'user.username',
+                'user.public_metrics.followers_count',
+                'user.public_metrics.following_count',
+                'user.public_metrics.tweet_count',
+                'geo.place_id', 'geo.coordinates.type',
+                'geo.coordinates.coordinates',
+                'geo.coordinates.x', 'geo.coordinates.y', 'geo.full_name',
+                'geo.name', 'geo.place_type', 'geo.country',
+                'geo.country_code', 'geo.type', 'geo.bbox',
+                'geo.centroid', 'geo.centroid.x', 'geo.centroid.y']
 
 # define date range function
 def daterange(start_date, end_date):
     for n in range(int((end_date - start_date).days)):
         yield start_date + timedelta(n)
 
-# function to parse references in original tweets
-def ref_parse(tweets):
+# declared fields of v2 objects for the flattening engine, column name: kind
+TWEET_FIELDS = {'id': 'str', 'author_id': 'str', 'created_at': 'str', 'text': 'str',
+                'lang': 'str', 'conversation_id': 'str', 'in_reply_to_user_id': 'str',
+                'reply_settings': 'str', 'possibly_sensitive': 'bool', 'source': 'str',
+                'referenced_tweets': 'object',
+                'public_metrics.retweet_count': 'int', 'public_metrics.reply_count': 'int',
+                'public_metrics.like_count': 'int', 'public_metrics.quote_count': 'int',
+                'entities.hashtags': 'object', 'entities.mentions': 'object',
+                'entities.urls': 'object', 'entities.annotations': 'object',
+                'entities.cashtags': 'object',
+                'attachments.media_keys': 'object', 'attachments.poll_ids': 'object',
+                'geo.place_id': 'str', 'geo.coordinates.type': 'str',
+                'geo.coordinates.coordinates': 'object'}
+USER_FIELDS = {'id': 'str', 'username': 'str', 'name': 'str', 'created_at': 'str',
+               'location': 'str', 'description': 'str', 'url': 'str',
+               'profile_image_url': 'str', 'protected': 'bool', 'verified': 'bool',
+               'public_metrics.followers_count': 'int', 'public_metrics.following_count': 'int',
+               'public_metrics.tweet_count': 'int', 'public_metrics.listed_count': 'int',
+               'entities.url.urls': 'object', 'entities.description.hashtags': 'object',
+               'entities.description.mentions': 'object', 'entities.description.urls': 'object'}
+PLACE_FIELDS = {'id': 'str', 'full_name': 'str', 'name': 'str', 'country': 'str',
+                'country_code': 'str', 'place_type': 'str', 'geo.type': 'str',
+                'geo.bbox': 'object'}
+MEDIA_FIELDS = {'media_key': 'str', 'type': 'str', 'url': 'str'}
+REFERENCED_FIELDS = {'id': 'str', 'author_id': 'str'}
+
+# presets of requested v2 fields and expansions, profile name: request parameters
+FIELD_PROFILES = {
+    'full': {'tweet_fields': ["attachments", "author_id", "conversation_id", "created_at",
+                              "entities", "geo", "id", "in_reply_to_user_id", "lang",
+                              "public_metrics", "possibly_sensitive", "referenced_tweets",
+                              "reply_settings", "text", "withheld"],
+             'user_fields': ["created_at", "description", "entities", "location",
+                             "name", "profile_image_url", "protected", "public_metrics",
+                             "url", "username", "verified", "withheld"],
+             'media_fields': ["media_key", "type", "url"],
+             'place_fields': ["contained_within", "country", "country_code", "full_name",
+                              "geo", "id", "name",  "place_type"],
+             'expansions': ["attachments.media_keys", "author_id", "entities.mentions.username",
+                            "geo.place_id", "in_reply_to_user_id", "referenced_tweets.id",
+                            "referenced_tweets.id.author_id"]},
+    'geo-minimal': {'tweet_fields': ["author_id", "created_at", "geo", "id", "text"],
+                    'user_fields': [],
+                    'media_fields': [],
+                    'place_fields': ["country", "country_code", "full_name", "geo",
+                                     "id", "name", "place_type"],
+                    'expansions': ["geo.place_id"]},
+    'geo-users': {'tweet_fields': ["author_id", "conversation_id", "created_at", "geo",
+                                   "id", "in_reply_to_user_id", "lang", "public_metrics",
+                                   "text"],
+                  'user_fields': ["created_at", "location", "name", "public_metrics",
+                                  "username"],
+                  'media_fields': [],
+                  'place_fields': ["country", "country_code", "full_name", "geo",
+                                   "id", "name", "place_type"],
+                  'expansions': ["author_id", "geo.place_id"]}
+    }
+
+# fields the v2 api returns for every object regardless of the request
+DEFAULT_FIELDS = {'tweet_fields': ["id", "text"],
+                  'user_fields': ["id", "name", "username"],
+                  'media_fields': ["media_key", "type"],
+                  'place_fields': ["id", "full_name"]}
+
+# function to get request fields of the field profile in search config
+def field_profile(config):
+    '''
+    Returns the fields and expansions of the field profile named with
+    field_profile in the search config as comma separated strings, keyed with
+    the parameter names of gen_request_parameters. Fields given in the config
+    (as a list or a comma separated string) replace those of the profile.
+    Defaults to the full profile.
+    '''
+    name = config.get('field_profile') or 'full'
+    try:
+        profile = FIELD_PROFILES[name]
+    except KeyError:
+        raise ValueError('Unknown field profile "' + str(name) + '", valid profiles are: '
+                         + ', '.join(FIELD_PROFILES))
+
+    fields = {}
+    for param, values in profile.items():
+        values = config.get(param, values)
+        if isinstance(values, str):
+            values = [value.strip() for value in values.split(',') if value.strip()]
+        fields[param] = ",".join(values or [])
+
+    return fields
+
+# function to project declared fields to the requested ones
+def project_fields(declared, requested, param):
+    '''
+    Returns the declared fields whose top level field is requested in the
+    comma separated requested fields, or is returned by default.
+    '''
+    keep = set(requested.split(',')).union(DEFAULT_FIELDS[param])
+    return {col: kind for col, kind in declared.items() if col.split('.')[0] in keep}
+
+# function to build a trie of declared field paths
+def field_trie(fields):
+    '''
+    Turns dotted column names to a nested dict of path parts, where leaves
+    hold the column name.
+    '''
+    trie = {}
+    for col in fields:
+        node = trie
+        parts = col.split('.')
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = col
+    
+    return trie
+
+# cache of row getters per declared fields
+_row_getters = {}
+
+# function to build a getter of declared fields from one record
+def row_getter(fields):
+    '''
+    Builds a function returning the values of the declared fields of one
+    record as a tuple, followed by the nested dicts the fields are read from.
+    Nested levels missing from a record read as empty dicts. Returns the
+    function, the column names of the values and the prefixes and trie nodes
+    of the nested levels.
+    '''
+    key = tuple(fields)
+    if key in _row_getters:
+        return _row_getters[key]
+    
+    # lookups of nested levels and values as the index of the parent level and the key,
+    # the record itself is level -1
+    nested = []
+    leaves = []
+    cols = []
+    levels = []
+    
+    # function to add lookups of one nesting level
+    def add(node, parent, prefix):
+        for part, target in node.items():
+            if isinstance(target, str):
+                leaves.append((parent, part))
+                cols.append(target)
+            else:
+                nested.append((parent, part))
+                levels.append((prefix + part + '.', target))
+                add(target, len(nested) - 1, prefix + part + '.')
+    
+    add(field_trie(fields), -1, '')
+    empty = {}
+    
+    # function to read the nested levels and values of one record
+    def row(record):
+        dicts = []
+        for parent, part in nested:
+            dicts.append((dicts[parent] if parent >= 0 else record).get(part) or empty)
+        return tuple([(dicts[parent] if parent >= 0 else record).get(part) for parent, part in leaves] + dicts)
+    
+    _row_getters[key] = (row, cols, levels)
+    return _row_getters[key]
+
+# function to flatten v2 objects to columns without json_normalize
+def flatten_records(records, fields, generic=True):
+    '''
+    Builds the same dotted columns as pd.json_normalize from a list of v2
+    tweet or expansion dicts. Declared fields are read with one getter call
+    per record and transposed to numpy column buffers. Fields not declared
+    are flattened generically, or skipped if generic is False. Only columns
+    present in at least one record are returned.
+    
+    Unlike pd.json_normalize, missing values are None instead of NaN in
+    columns of python objects, and an explicit null of a declared nested
+    object, like 'geo': None, gets no column of its own.
+    '''
+    n = len(records)
+    columns = {}
+    empty = {}
+    
+    # function to fill the column of a field
+    def put_field(col, values):
+        kind = fields.get(col, 'object')
+        
+        # numeric fields to float buffers, integers if no values are missing
+        if kind in ('int', 'float'):
+            data = np.array(values, dtype=float)
+            if kind == 'int' and not np.isnan(data).any():
+                data = data.astype(np.int64)
+            columns[col] = pd.Series(data, copy=False)
+        
+        # boolean fields to boolean buffers if no values are missing
+        elif kind == 'bool' and None not in values:
+            columns[col] = pd.Series(np.array(values, dtype=bool), copy=False)
+        
+        # others as python objects
+        else:
+            columns[col] = pd.Series(values, dtype=object)
+    
+    # function to build columns of the given keys of one nesting level generically
+    def build(objs, node, prefix, keys):
+        for key in keys:
+            target = node.get(key)
+            values = [obj.get(key) for obj in objs]
+            
+            # declared leaf field
+            if isinstance(target, str):
+                put_field(target, values)
+                continue
+            
+            # split values to nested dicts and plain values
+            nested = [v if type(v) is dict else empty for v in values]
+            plain = [None if type(v) is dict else v for v in values]
+            
+            # plain values, including explicit nulls, to a column of their own
+            if any(type(obj[key]) is not dict for obj in objs if key in obj):
+                put_field(prefix + key, plain)
+            
+            # nested dicts to the next level
+            if any(nested):
+                child = target if target is not None else {}
+                nkeys = set().union(*nested)
+                build(nested, child, prefix + key + '.',
+                      [k for k in child if k in nkeys] + sorted(nkeys.difference(child)))
+    
+    # return empty dataframe if there are no records
+    if n == 0:
+        return pd.DataFrame(index=pd.RangeIndex(0))
+    
+    # get getter of declared fields
+    row, cols, levels = row_getter(fields)
+    trie = field_trie(fields)
+    
+    try:
+        # read declared fields of all records and transpose to columns
+        values = list(zip(*map(row, records)))
+    except AttributeError:
+        # a declared level is not a dict in some record, build everything generically
+        keys = set().union(*records)
+        build(records, trie, '', [k for k in trie if k in keys] + sorted(keys.difference(trie)))
+        return pd.DataFrame(columns, copy=False)
+    
+    # get keys present on top level and nested levels
+    present = {'': set().union(*records)}
+    for i, (prefix, node) in enumerate(levels):
+        present[prefix] = set().union(*values[len(cols) + i])
+    
+    # fill columns of declared fields present in records
+    for i, col in enumerate(cols):
+        prefix, _, part = col.rpartition('.')
+        if part in present[prefix + '.' if prefix else '']:
+            put_field(col, list(values[i]))
+    
+    # flatten undeclared fields generically
+    if generic:
+        unknown = sorted(present[''].difference(trie))
+        if unknown:
+            build(records, {}, '', unknown)
+        for i, (prefix, node) in enumerate(levels):
+            unknown = sorted(present[prefix].difference(node))
+            if unknown:
+                build(values[len(cols) + i], {}, prefix, unknown)
+    
+    return pd.DataFrame(columns, copy=False)
+
+# function to order columns semantically
+def order_columns(tweetdf, columns=TWEET_COLUMNS, keep_rest=True):
+    '''
+    Returns the dataframe with the given columns first in the given order,
+    followed by its other columns, like fields of the field profile that are
+    not listed. Columns missing from the dataframe, e.g. ones not requested
+    with the field profile, are skipped. With keep_rest=False only the given
+    columns are returned.
+    '''
+    ordered = [col for col in columns if col in tweetdf.columns]
+    if keep_rest:
+        listed = set(ordered)
+        ordered += [col for col in tweetdf.columns if col not in listed]
+    
+    return tweetdf[ordered]
+
+# function to estimate memory footprint of raw json responses
+def deep_sizeof(obj):
+    '''
+    Approximates the memory used by nested dicts, lists and scalars of the raw
+    v2 responses in bytes. Shared objects are counted only once.
+    '''
+    # set of already counted object ids and stack of objects to visit
+    seen = set()
+    stack = [obj]
+    size = 0
+    
+    # walk the nested structure without recursion
+    while stack:
+        item = stack.pop()
+        
+        # skip already counted objects
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        
+        # add size of the object itself
+        size += sys.getsizeof(item)
+        
+        # queue keys and values of dicts, and items of lists
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    
+    return size
+
+# function to read tweets of one user from timeline output parts
+def read_user_tweets(manifest, usr_id, outpath=''):
+    '''
+    Uses the manifest csv written by timeline_tweets_to_file.py to read only
+    the output parts that contain tweets of the given user.
+    '''
+    # read manifest and get parts of the user
+    mdf = pd.read_csv(manifest, sep=';', dtype={'usr_id': str})
+    parts = mdf[(mdf['usr_id'] == str(usr_id)) & (mdf['tweets'] > 0)]['part'].unique()
+    
+    # list for user tweets per part
+    dflist = []
+    
+    # loop over parts
+    for part in parts:
+        
+        # read part in as a pandas dataframe
+        if part.endswith('.pkl'):
+            data = pd.read_pickle(outpath + part)
+        else:
+            data = pd.read_csv(outpath + part, sep=';', encoding='utf-8', dtype={'author_id': str})
+        
+        # keep only tweets of the user
+        dflist.append(data[data['author_id'].astype(str) == str(usr_id)])
+    
+    # return empty dataframe if user has no tweets
+    if len(dflist) == 0:
+        return pd.DataFrame()
+    
+    return pd.concat(dflist, ignore_index=True)
+
+# function to read newest collected tweet id of a query tag
+def read_since_id(statefile, tag):
+    '''
+    Returns the newest tweet id stored for the query tag in the json state
+    file, or None if the tag has not been collected yet.
+    '''
+    # check if state file exists
+    if not os.path.exists(statefile):
+        return None
+    
+    # read state
+    with open(statefile, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    
+    return state.get(tag)
+
+# function to store newest collected tweet id of a query tag
+def write_since_id(statefile, tag, since_id):
+    '''
+    Stores the newest tweet id for the query tag in the json state file. The
+    file is replaced atomically so an interrupted run never corrupts it.
+    '''
+    # read existing state
+    state = {}
+    if os.path.exists(statefile):
+        with open(statefile, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    
+    # update tag
+    state[tag] = str(since_id)
+    
+    # write to temporary file and replace state file with it
+    tmpfile = statefile + '.tmp'
+    with open(tmpfile, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmpfile, statefile)
+
+# class to share one request budget between collection jobs
+class RateLimiter:
+    '''
+    Keeps the requests made with one bearer token within the rate limit of
+    the endpoint. Full archive search allows 300 requests per 15 minute window
+    and one request per second. The rate limit headers of responses are used
+    to pause all requests until the window resets when the limit is hit.
+    '''
+    def __init__(self, max_requests=300, window=900, min_interval=1):
+        self.max_requests = max_requests
+        self.window = window
+        self.min_interval = min_interval
+        
+        # timestamps of requests sent within the window
+        self.sent = deque()
+        
+        # epoch time until which no requests are sent
+        self.paused_until = 0
+    
+    def wait(self):
+        '''
+        Blocks until the next request fits the budget and records it.
+        '''
+        while True:
+            now = time.time()
+            
+            # forget requests older than the window
+            while self.sent and self.sent[0] <= now - self.window:
+                self.sent.popleft()
+            
+            # get time to wait for pause, full window or minimum interval
+            delay = 0
+            if self.paused_until > now:
+                delay = self.paused_until - now
+            elif len(self.sent) >= self.max_requests:
+                delay = self.sent[0] + self.window - now
+            elif self.sent and now - self.sent[-1] < self.min_interval:
+                delay = self.min_interval - (now - self.sent[-1])
+            
+            if delay <= 0:
+                break
+            
+            # inform about longer waits
+            if delay > 5:
+                print('[INFO] - Rate limit budget used, waiting ' + str(int(delay)) + ' seconds..')
+            time.sleep(delay)
+        
+        self.sent.append(time.time())
+    
+    def update(self, status, headers):
+        '''
+        Pauses requests until the window resets if the response tells the
+        limit is reached.
+        '''
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        
+        # check if rate limit was hit or is about to be hit
+        if status == 429 or (remaining is not None and int(remaining) == 0):
+            if reset is not None:
+                self.paused_until = max(self.paused_until, int(reset) + 1)
+            else:
+                self.paused_until = max(self.paused_until, time.time() + self.window)
+
+# function to request one page of search results
+def get_page(session, endpoint, rule, next_token=None):
+    '''
+    Sends one search request with the request parameters and returns the
+    response. The next token is added for paging through results.
+    '''
+    params = dict(rule)
+    if next_token is not None:
+        params['next_token'] = next_token
+    
+    return session.get(endpoint, params=params)
+
+# function to open one keep-alive session for a whole collection run
+def make_pooled_session(bearer_token, pool_size=4, extra_headers_dict=None):
+    '''
+    Returns a requests session with a connection pool, so connections to the
+    API are kept alive and reused across days, bounding boxes and users
+    instead of paying the TLS handshake again for every one of them.
+    '''
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    
+    # set authentication and compression headers
+    session.headers.update({'Accept-encoding': 'gzip',
+                            'User-Agent': 'tweetsearcher',
+                            'Authorization': 'Bearer {}'.format(bearer_token)})
+    if extra_headers_dict:
+        session.headers.update(extra_headers_dict)
+    
+    # mount a pooled adapter for both protocols
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    
+    return session
+
+# function to get numbers of requests and opened connections of a session
+def session_stats(session):
+    '''
+    Returns the number of requests sent and connections opened through the
+    connection pools of the session.
+    '''
+    n_requests = 0
+    n_connections = 0
+    
+    # loop over distinct adapters and their connection pools
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            n_requests += pools[key].num_requests
+            n_connections += pools[key].num_connections
+    
+    return n_requests, n_connections
+
+# function to stream all pages of a search through a shared session
+def stream_tweets(session, endpoint, rule, max_tweets=None, limiter=None, max_pages=None):
+    '''
+    Pages through the results of the request parameters and yields tweets,
+    includes and meta objects in the same order as ResultStream.stream(). Rate
+    limit and server errors are retried, other errors raise an HTTPError.
+    Stops after max_tweets tweets or max_pages pages if given.
+    '''
+    import requests
+    
+    next_token = None
+    total = 0
+    pages = 0
+    tries = 0
+    
+    while True:
+        
+        # wait for rate limit budget
+        if limiter is not None:
+            limiter.wait()
+        
+        # request page
+        resp = get_page(session, endpoint, rule, next_token)
+        if limiter is not None:
+            limiter.update(resp.status_code, resp.headers)
+        
+        # retry rate limit and server errors with a backoff
+        if resp.status_code == 429 or resp.status_code >= 500:
+            tries += 1
+            if tries > 10:
+                raise requests.exceptions.HTTPError('Too many failed requests: ' + str(resp.status_code))
+            print('[INFO] - Got HTTP error ' + str(resp.status_code) + ', retrying..')
+            if limiter is None or resp.status_code >= 500:
+                time.sleep(min((tries * 2) ** 2, 900) if resp.status_code == 429 else 30)
+            continue
+        
+        # other errors are not retried
+        elif resp.status_code != 200:
+            raise requests.exceptions.HTTPError('HTTP error ' + str(resp.status_code) + ': ' + resp.text)
+        
+        # give out tweets, includes and meta of the page
+        tries = 0
+        page = resp.json()
+        yield from page_messages(page)
+        
+        # get next page if there is one and tweets are still wanted
+        meta = page.get('meta', {})
+        total += meta.get('result_count', 0)
+        pages += 1
+        next_token = meta.get('next_token')
+        if next_token is None or (max_tweets is not None and total >= max_tweets) \
+                or (max_pages is not None and pages >= max_pages):
+            break
+
+# function to turn a response page to the message format of ResultStream
+def page_messages(page):
+    '''
+    Returns the tweets of a response page followed by its includes and meta
+    objects, which is the format v2parser expects.
+    '''
+    messages = list(page.get('data', []))
+    if page.get('includes') is not None:
+        messages.append(page['includes'])
+    if page.get('meta') is not None:
+        messages.append(page['meta'])
+    
+    return messages
+
+# function to check if a streamed message is a tweet
+def is_tweet(message):
+    '''
+    Returns True for tweets among the messages of stream_tweets or
+    ResultStream.stream(), which also give out includes and meta objects.
+    '''
+    return 'id' in message and 'text' in message
+
+# function to split streamed messages to the tweets and includes of each page
+def message_pages(messages):
+    '''
+    Groups streamed messages by the meta object ending each page and returns
+    a list of the tweets and includes of each page. Messages are told apart
+    by their content, so pages without includes keep all their tweets and
+    get an empty includes dict.
+    '''
+    pages = []
+    tweets = []
+    includes = {}
+    for message in messages:
+        if is_tweet(message):
+            tweets.append(message)
+        elif 'result_count' in message or 'newest_id' in message:
+            pages.append((tweets, includes))
+            tweets = []
+            includes = {}
+        else:
+            includes = message
+    
+    # tweets after the last meta object form a page of their own
+    if tweets:
+        pages.append((tweets, includes))
+    
+    return pages
+
+# function to pick short windows at random places over a time span
+def preview_windows(start, end, windows=20, minutes=60, seed=None):
+    '''
+    Splits the span from start to end into equal strata and returns the start
+    and end times of one window of whole minutes at a random place in each,
+    so the windows cover the whole span. Windows are shortened to the length
+    of the strata if these are shorter than the given minutes.
+    '''
+    rng = np.random.default_rng(seed)
+    span = int((end - start).total_seconds() // 60)
+    windows = max(1, min(windows, span))
+    
+    # strata in whole minutes and one window of equal length in each
+    edges = np.arange(windows + 1) * span // windows
+    length = int(min(minutes, np.diff(edges).min()))
+    offsets = edges[:-1] + rng.integers(0, np.diff(edges) - length + 1)
+    
+    return [(start + timedelta(minutes=int(offset)), start + timedelta(minutes=int(offset) + length))
+            for offset in offsets]
+
+# function to estimate the tweets of a window from its messages
+def window_volume(messages, start, end):
+    '''
+    Returns the number of tweets received from a window, the estimated number
+    of all its tweets and whether results were left unread. Results come
+    newest first, so the tweets received from a window left unread cover the
+    time from the oldest of them, decoded from its id, to the end of the
+    window, and the rest of the window is estimated at the same rate.
+    '''
+    metas = [m for m in messages if 'result_count' in m.keys()]
+    received = sum([m['result_count'] for m in metas])
+    truncated = len(metas) > 0 and metas[-1].get('next_token') is not None
+    if not truncated or received == 0:
+        return received, float(received), truncated
+    
+    # share of the window covered by the received tweets
+    oldest = snowflake_times([min([int(m['oldest_id']) for m in metas if 'oldest_id' in m.keys()])])[0]
+    covered = (np.datetime64(end, 'ms') - oldest) / np.timedelta64(1, 'ms')
+    length = (end - start).total_seconds() * 1000
+    
+    return received, received * length / min(max(covered, 1), length), truncated
+
+# function to add tweets to a weighted reservoir sample
+def reservoir_sample(reservoir, tweetdf, weight, size, rng):
+    '''
+    Adds tweets to a reservoir sample of at most size tweets and returns it.
+    Tweets are kept by the largest random keys log(u) / weight (Efraimidis &
+    Spirakis), so a tweet of weight two is about twice as likely to be in the
+    sample. The keys are kept in the sample_key column for later additions.
+    '''
+    tweetdf = tweetdf.assign(sample_key=np.log(rng.random(len(tweetdf))) / weight)
+    if reservoir is not None:
+        tweetdf = pd.concat([reservoir, tweetdf], ignore_index=True)
+    
+    return tweetdf.nlargest(size, 'sample_key').reset_index(drop=True)
+
+# function to extrapolate tweets of a span from sampled windows
+def extrapolate_volume(estimates, window_minutes, span_minutes):
+    '''
+    Returns the estimated number of tweets of the whole span with the low and
+    high ends of its 95 % interval, from the estimated tweets of sampled
+    windows of equal length. The interval comes from the variation between
+    windows, so it is wide for few windows or bursty queries.
+    '''
+    rates = np.asarray(estimates, dtype=float) / window_minutes
+    total = rates.mean() * span_minutes
+    if len(rates) < 2:
+        return total, np.nan, np.nan
+    
+    # standard error of the mean rate, less the more of the span is sampled
+    sampled = min(len(rates) * window_minutes / span_minutes, 1)
+    error = 1.96 * rates.std(ddof=1) / np.sqrt(len(rates)) * np.sqrt(1 - sampled) * span_minutes
+    
+    return total, max(total - error, 0), total + error
+
+# states of units in a work queue
+UNIT_STATES = ['todo', 'leased', 'done', 'failed']
+
+# class to share collection units between workers on several machines
+class WorkQueue:
+    '''
+    Queue of collection units, like days of a search or bounding boxes of an
+    interval, in a SQLite file that workers on several machines can reach.
+    Workers lease one unit at a time for lease seconds and renew the lease
+    while collecting. A unit whose lease runs out, because its worker died or
+    lost its connection, is leased again to another worker, and a unit which
+    failed max_attempts times is marked failed. Every lease gets a new token,
+    so a worker whose lease was taken over cannot renew or complete it.
+    
+    The file has to be on a file system with working locks, like a local
+    disk or NFS with locking, and the clocks of the machines should agree
+    within a small part of the lease time.
+    '''
+    def __init__(self, path, lease=600, max_attempts=3):
+        self.path = path
+        self.lease_time = lease
+        self.max_attempts = max_attempts
+        with closing(self.connect()) as con:
+            con.execute('CREATE TABLE IF NOT EXISTS units (key TEXT PRIMARY KEY, job TEXT, payload TEXT, '
+                        'state TEXT NOT NULL DEFAULT \'todo\', worker TEXT, token INTEGER NOT NULL DEFAULT 0, '
+                        'attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, error TEXT, result TEXT, updated REAL)')
+            con.execute('CREATE INDEX IF NOT EXISTS units_state ON units (state, lease_until)')
+    
+    def connect(self):
+        '''
+        Opens a connection in autocommit mode, transactions are started
+        explicitly. Each call gets its own connection, so the queue can be
+        used from several threads.
+        '''
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+    
+    def publish(self, units):
+        '''
+        Adds units given as (key, job, payload) tuples, the payload being
+        anything json can store. Units already in the queue are kept as they
+        are, so publishing again adds only new units. Returns the number of
+        added units.
+        '''
+        rows = [(key, job, json.dumps(payload), time.time()) for key, job, payload in units]
+        with closing(self.connect()) as con:
+            con.execute('BEGIN IMMEDIATE')
+            before = con.execute('SELECT COUNT(*) FROM units').fetchone()[0]
+            con.executemany('INSERT OR IGNORE INTO units (key, job, payload, updated) VALUES (?, ?, ?, ?)', rows)
+            added = con.execute('SELECT COUNT(*) FROM units').fetchone()[0] - before
+            con.execute('COMMIT')
+        return added
+    
+    def lease(self, worker):
+        '''
+        Leases the next unit waiting or with an expired lease to the worker.
+        Returns the unit as a dict with key, job, payload, worker and token,
+        or None if no unit is available right now. Expired units which have
+        used all their attempts are marked failed.
+        '''
+        now = time.time()
+        with closing(self.connect()) as con:
+            con.execute('BEGIN IMMEDIATE')
+            con.execute("UPDATE units SET state = 'failed', error = 'lease expired', updated = ? "
+                        "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+            row = con.execute("SELECT key, job, payload, token FROM units WHERE state = 'todo' "
+                              "OR (state = 'leased' AND lease_until < ?) ORDER BY rowid LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                con.execute("UPDATE units SET state = 'leased', worker = ?, token = token + 1, attempts = attempts + 1, "
+                            "lease_until = ?, updated = ? WHERE key = ?", (worker, now + self.lease_time, now, row[0]))
+            con.execute('COMMIT')
+        
+        if row is None:
+            return None
+        return {'key': row[0], 'job': row[1], 'payload': json.loads(row[2]), 'worker': worker, 'token': row[3] + 1}
+    
+    def set_state(self, unit, state, **values):
+        '''
+        Updates a leased unit if the lease is still held by the worker and
+        returns whether it was.
+        '''
+        names = ''.join(', ' + name + ' = ?' for name in values)
+        with closing(self.connect()) as con:
+            cur = con.execute("UPDATE units SET state = ?, updated = ?" + names + " WHERE key = ? AND worker = ? "
+                              "AND token = ? AND state = 'leased'",
+                              [state, time.time()] + list(values.values()) + [unit['key'], unit['worker'], unit['token']])
+            return cur.rowcount == 1
+    
+    def heartbeat(self, unit):
+        '''
+        Renews the lease of a unit. Returns False if the lease was lost.
+        '''
+        return self.set_state(unit, 'leased', lease_until=time.time() + self.lease_time)
+    
+    def complete(self, unit, result=None):
+        '''
+        Marks a unit done, with an optional json result like the number of
+        collected tweets. Returns False if the lease was lost.
+        '''
+        return self.set_state(unit, 'done', result=json.dumps(result), lease_until=None, error=None)
+    
+    def release(self, unit, error=None):
+        '''
+        Gives a unit back to the queue after an error, or marks it failed if
+        it has used all its attempts. Returns False if the lease was lost.
+        '''
+        with closing(self.connect()) as con:
+            attempts = con.execute('SELECT attempts FROM units WHERE key = ?', (unit['key'],)).fetchone()[0]
+        state = 'failed' if attempts >= self.max_attempts else 'todo'
+        return self.set_state(unit, state, error=None if error is None else str(error), lease_until=None)
+    
+    @contextmanager
+    def keep_alive(self, unit):
+        '''
+        Renews the lease of a unit on a thread while the block runs, also
+        while waiting for the rate limit. Gives an event which is set if the
+        lease was lost, after which the unit should not be saved.
+        '''
+        lost = threading.Event()
+        stop = threading.Event()
+        
+        def beat():
+            while not stop.wait(self.lease_time / 3):
+                try:
+                    if not self.heartbeat(unit):
+                        lost.set()
+                        return
+                except sqlite3.OperationalError as err:
+                    print('[INFO] - Could not renew lease of ' + unit['key'] + ': ' + str(err))
+        
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+    
+    def retry(self, states=('failed',)):
+        '''
+        Puts units in the given states back in the queue with their attempts
+        reset. Returns the number of units put back.
+        '''
+        with closing(self.connect()) as con:
+            cur = con.execute("UPDATE units SET state = 'todo', attempts = 0, worker = NULL, lease_until = NULL, "
+                              "updated = ? WHERE state IN (" + ', '.join('?' * len(states)) + ")",
+                              [time.time()] + list(states))
+            return cur.rowcount
+    
+    def status(self):
+        '''
+        Returns the number of units per job and state, with leased units
+        whose lease has run out counted as expired.
+        '''
+        with closing(self.connect()) as con:
+            rows = con.execute("SELECT job, CASE WHEN state = 'leased' AND lease_until < ? THEN 'expired' "
+                               "ELSE state END, COUNT(*) FROM units GROUP BY 1, 2", (time.time(),)).fetchall()
+        counts = pd.DataFrame(rows, columns=['job', 'state', 'units'])
+        counts = counts.pivot(index='job', columns='state', values='units')
+        return counts.reindex(columns=UNIT_STATES + ['expired']).fillna(0).astype(int)
+
+# columns of the collection history of bounding box cells
+CELL_HISTORY_COLUMNS = ['cell', 'start', 'end', 'tweets', 'truncated', 'run']
+
+# function to get the key of a bounding box cell in the collection history
+def cell_key(west, south, east, north):
+    return f'{west:.5f} {south:.5f} {east:.5f} {north:.5f}'
+
+# function to read the collection history of bounding box cells
+def read_cell_history(path):
+    '''
+    Returns the collection history of bounding box cells with a row per
+    collected cell and time window, or an empty history if the file does not
+    exist yet.
+    '''
+    if path is None or not os.path.exists(path):
+        return pd.DataFrame({'cell': pd.Series([], dtype=object),
+                             'start': pd.Series([], dtype='datetime64[ns]'),
+                             'end': pd.Series([], dtype='datetime64[ns]'),
+                             'tweets': pd.Series([], dtype=np.int64),
+                             'truncated': pd.Series([], dtype=bool),
+                             'run': pd.Series([], dtype='datetime64[ns]')})
+    return pd.read_pickle(path)
+
+# function to add collected windows to the collection history
+def update_cell_history(path, history, rows):
+    '''
+    Adds rows of collected cells and windows to the history and saves it,
+    replacing earlier rows of the same cell and window. Returns the updated
+    history.
+    '''
+    history = pd.concat([history, pd.DataFrame(rows, columns=CELL_HISTORY_COLUMNS)], ignore_index=True)
+    history = history.drop_duplicates(subset=['cell', 'start', 'end'], keep='last').reset_index(drop=True)
+    history.to_pickle(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return history
+
+# function to summarize the collection history per cell
+def cell_stats(history):
+    '''
+    Returns the days collected, tweets, truncated windows, last run and
+    tweets per day of each cell in the history. Windows which hit max_tweets
+    hold more tweets than were collected, so their tweets count twice for
+    the rate.
+    '''
+    rows = pd.DataFrame({'cell': history['cell'],
+                         'days': (history['end'] - history['start']).dt.total_seconds() / 86400,
+                         'tweets': history['tweets'],
+                         'weighted': history['tweets'] * np.where(history['truncated'], 2, 1),
+                         'truncated': history['truncated'].astype(int),
+                         'run': history['run']})
+    stats = rows.groupby('cell').agg(days=('days', 'sum'), tweets=('tweets', 'sum'), weighted=('weighted', 'sum'),
+                                     truncated=('truncated', 'sum'), last_run=('run', 'max'))
+    stats['rate'] = stats['weighted'] / stats['days'].clip(lower=1 / 1440)
+    return stats.drop(columns='weighted')
+
+# function to plan the collection of bounding box cells from their history
+def plan_cells(keys, stats, start, end, target=100000, skip_days=365, probe_days=90, now=None):
+    '''
+    Plans the collection of bounding box cells between start and end
+    datetimes. Returns (position, start, end) tasks of the cells to collect,
+    with windows at minute precision. Cells without tweets in at least
+    skip_days days of history are skipped, unless skip_days is 0 or None.
+    Skipped cells last collected more than probe_days days before now are
+    collected again in one window, so cells which get tweets later are
+    found. Cells expected to have more than target tweets are split into windows of
+    equal length expected to hold target tweets each. Tasks go round the
+    cells one window at a time, dense and sparse cells taking turns, so the
+    requests of dense cells are spread over the run. Cells without history
+    come last in one window each.
+    '''
+    stats = stats.reindex(keys)
+    expected = (stats['rate'] * (end - start).total_seconds() / 86400).to_numpy()
+    minutes = max(int((end - start).total_seconds() // 60), 1)
+    parts = np.clip(np.nan_to_num(np.ceil(expected / target), nan=1), 1, minutes).astype(int)
+    skip = np.zeros(len(keys), dtype=bool)
+    if skip_days:
+        now = datetime.utcnow() if now is None else now
+        probe = (stats['last_run'] < now - timedelta(days=probe_days)).to_numpy() if probe_days else False
+        skip = ((stats['tweets'] == 0) & (stats['days'] >= skip_days)).to_numpy() & ~probe
+    
+    # alternate between the densest and sparsest cells left
+    known = np.nonzero(~np.isnan(expected) & ~skip)[0]
+    known = known[np.argsort(-expected[known], kind='stable')]
+    order = [known[i // 2] if i % 2 == 0 else known[len(known) - 1 - i // 2] for i in range(len(known))]
+    
+    # take a window of each cell in turn, windows split at minute precision
+    tasks = []
+    for turn in range(parts.max() if len(order) > 0 else 0):
+        for pos in order:
+            if turn < parts[pos]:
+                tasks.append((int(pos), start + timedelta(minutes=minutes * turn // int(parts[pos])),
+                              start + timedelta(minutes=minutes * (turn + 1) // int(parts[pos]))
+                              if turn + 1 < parts[pos] else end))
+    tasks += [(int(pos), start, end) for pos in np.nonzero(np.isnan(expected) & ~skip)[0]]
+    
+    return tasks
+
+# function to parse references in original tweets
+def ref_parse(tweets):
+    
+    # get initial output df
+    outdf = tweets.copy()
+    
+    # check if there are references
+    if 'referenced_tweets' in outdf.columns:
+        
+        # get reference lists
+        refs = outdf['referenced_tweets'].tolist()
+        
+        # join ids and types of references on rows with references to strings
+        outdf['referenced_tweets.id'] = [';'.join([ref['id'] for ref in item]) if type(item) == list else None for item in refs]
+        outdf['referenced_tweets.type'] = [';'.join([ref['type'] for ref in item]) if type(item) == list else None for item in refs]
+        
+    else:
+        outdf['referenced_tweets.id'] = None
+        outdf['referenced_tweets.type'] = None
+        
+    return outdf
+
+# function to parse entity annotations
+def media_parse(tweets, media):
+    # get initial output df
+    outdf = tweets.copy()
+    
+    # get media keys of tweets
+    keys = tweets['attachments.media_keys'].tolist()
+    
+    # look types of all media keys up at once from a hash index of media keys
+    flat = [key for item in keys if type(item) == list for key in item]
+    media = media.drop_duplicates(subset=['media_key'])
+    pos = pd.Index(media['media_key']).get_indexer(flat)
+    mtypes = media['type'].tolist()
+    found = [mtypes[p] if p >= 0 else None for p in pos]
+    
+    # split media types back to tweets
+    types = []
+    i = 0
+    for item in keys:
+        if type(item) == list:
+            types.append(found[i:i + len(item)])
+            i += len(item)
+        else:
+            types.append(None)
+    outdf['attachments.media_types'] = pd.Series(types, index=outdf.index, dtype=object)
+    
+    # give output
+    return outdf
+
+# function to turn id columns to join keys
+def id_keys(left, right):
+    '''
+    Returns the two id columns as int64 arrays if both hold only numeric
+    string ids, like tweet and user ids do, otherwise as object arrays.
+    '''
+    try:
+        return np.array(left.tolist(), dtype=np.int64), np.array(right.tolist(), dtype=np.int64)
+    except (TypeError, ValueError, OverflowError):
+        return left.to_numpy(dtype=object), right.to_numpy(dtype=object)
+
+# function to left join a dataframe on a hash index
+def index_join(left, right, left_on, right_on):
+    '''
+    Left joins the right dataframe to the left one by looking the left keys
+    up from a hash index of the right keys. Keeps every row of the left
+    dataframe in order, rows without a match get missing values. Right keys
+    should be unique, only the first row of duplicate keys is used.
+    '''
+    # build the index and get positions of matching right rows, -1 if none
+    lkeys, rkeys = id_keys(left[left_on], right[right_on])
+    index = pd.Index(rkeys)
+    if not index.is_unique:
+        first = ~index.duplicated()
+        right, index = right[first], index[first]
+    pos = index.get_indexer(lkeys)
+    matched = pos >= 0
+    
+    # take right columns by position, missing values where there is no match
+    columns = {}
+    for col in right.columns:
+        values = right[col].to_numpy()
+        if not matched.all():
+            filled = np.full(len(pos), np.nan if values.dtype.kind in 'iuf' else None,
+                             dtype=float if values.dtype.kind in 'iuf' else object)
+            filled[matched] = values.take(pos[matched])
+            values = filled
+        else:
+            values = values.take(pos)
+        columns[col] = pd.Series(values, index=left.index, dtype=values.dtype, copy=False)
+    
+    return pd.concat([left, pd.DataFrame(columns, copy=False)], axis=1)
+
+# function to join authors of referenced tweets
+def ref_join(tweets, refs):
+    '''
+    Adds the semicolon joined author ids of referenced tweets in the order of
+    referenced_tweets.id. References are exploded to one row each and joined
+    to the referenced tweets expansion, so tweets with several references get
+    the authors of all of them. Authors missing from the expansion are left
+    empty, and tweets without any known author get None.
+    '''
+    # explode references to one row per referenced tweet
+    lists = [item.split(';') if type(item) == str else [] for item in tweets['referenced_tweets.id'].tolist()]
+    exploded = pd.DataFrame({'referenced_tweets.id': pd.Series([ref for item in lists for ref in item], dtype=object)})
+    exploded = index_join(exploded, refs[['referenced_tweets.tweet_id', 'referenced_tweets.author_id']],
+                          'referenced_tweets.id', 'referenced_tweets.tweet_id')
+    authors = exploded['referenced_tweets.author_id'].tolist()
+    
+    # aggregate authors back to tweets
+    joined = []
+    i = 0
+    for item in lists:
+        found = [a if type(a) == str else '' for a in authors[i:i + len(item)]]
+        i += len(item)
+        joined.append(';'.join(found) if any(found) else None)
+    
+    outdf = tweets.copy()
+    outdf['referenced_tweets.author_id'] = pd.Series(joined, index=outdf.index, dtype=object)
+    
+    return outdf
+
+# funcion to parse coordinates
+def coord_parse(tweets):
+    # get initial copy of df
+    outdf = tweets.copy()
+    
+    # check if coordinates exist
+    if 'geo.coordinates.coordinates' in outdf.columns.tolist():
+        
+        # get coordinate lists
+        coords = outdf['geo.coordinates.coordinates'].tolist()
+        
+        # extract x and y coords from rows with coordinate list
+        outdf['geo.coordinates.x'] = np.array([c[0] if type(c) == list else np.nan for c in coords], dtype=float)
+        outdf['geo.coordinates.y'] = np.array([c[1] if type(c) == list else np.nan for c in coords], dtype=float)
+                
+    else:
+        outdf['geo.coordinates.coordinates'] = None
+        outdf['geo.coordinates.x'] = None
+        outdf['geo.coordinates.y'] = None
+        
+    # return output df
+    return outdf
+
+# long format entity tables, table name: entity column and entity keys to columns
+ENTITY_TABLES = {'hashtags': ('entities.hashtags', {'tag': 'tag'}),
+                 'cashtags': ('entities.cashtags', {'tag': 'tag'}),
+                 'mentions': ('entities.mentions', {'username': 'username', 'id': 'user_id'}),
+                 'urls': ('entities.urls', {'url': 'url', 'expanded_url': 'expanded_url',
+                                            'display_url': 'display_url'}),
+                 'annotations': ('entities.annotations', {'normalized_text': 'normalized_text',
+                                                          'type': 'type',
+                                                          'probability': 'probability'})}
+
+# function to explode entity columns to long format tables
+def entity_tables(tweetdf):
+    '''
+    Returns a dict of long format tables, one row per hashtag, cashtag,
+    mention, url or annotation of the tweets, with the tweet id, creation
+    time, position of the entity in the tweet, its character offsets and
+    values. Tables are built in bulk from flattened entity lists, entity
+    columns missing from the dataframe are skipped.
+    '''
+    tables = {}
+    ids = tweetdf['id'].to_numpy(dtype=object)
+    created = tweetdf['created_at'] if 'created_at' in tweetdf.columns else None
+    
+    for name, (col, keys) in ENTITY_TABLES.items():
+        if col not in tweetdf.columns:
+            continue
+        
+        # flatten entity lists of all tweets and count entities per tweet
+        cells = tweetdf[col].tolist()
+        counts = np.array([len(c) if isinstance(c, (list, np.ndarray)) else 0 for c in cells], dtype=np.int64)
+        flat = [e for c in cells if isinstance(c, (list, np.ndarray)) for e in c]
+        
+        # repeat tweet level values and number entities within tweets
+        table = {'tweet_id': pd.Series(ids.repeat(counts), dtype=object)}
+        if created is not None:
+            table['created_at'] = created.iloc[np.repeat(np.arange(len(created)), counts)].reset_index(drop=True)
+        table['position'] = np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)
+        
+        # entity offsets and values to columns
+        for key in ['start', 'end']:
+            values = np.array([e.get(key, np.nan) for e in flat], dtype=float)
+            table[key] = values if np.isnan(values).any() else values.astype(np.int64)
+        for key, column in keys.items():
+            table[column] = pd.Series([e.get(key) for e in flat], dtype=object)
+        
+        tables[name] = pd.DataFrame(table, copy=False)
+    
+    return tables
+
+# function to save entity tables next to a tweet file
+def save_entities(tables, file_prefix, output, update_ids=None):
+    '''
+    Saves entity tables as file_prefix_<table>.<output>, where output is pkl,
+    feather or one of TEXT_FORMATS. If update_ids is given, the tables are
+    added to existing tables, replacing their rows of tweets with those ids.
+    '''
+    for name, table in tables.items():
+        path = file_prefix + '_' + name + '.' + output
+        
+        # add to existing table without rows of replaced tweets
+        if update_ids is not None and os.path.exists(path):
+            old = read_tweets(path)
+            old = old[~old['tweet_id'].isin(update_ids)]
+            table = pd.concat([old, table], ignore_index=True)
+        
+        if output == 'pkl':
+            table.to_pickle(path)
+        elif output == 'feather':
+            save_feather(table, path)
+        elif output in TEXT_FORMATS:
+            save_text(table, path)
+
+# function to get one coordinate pair per tweet
+def tweet_coordinates(tweetdf):
+    '''
+    Returns x and y coordinate arrays of tweets and a boolean array telling
+    which are gps coordinates. Gps coordinates are preferred over bounding
+    box centroids of places, tweets with neither get NaN.
+    '''
+    nans = pd.Series(np.nan, index=tweetdf.index)
+    gps_x = tweetdf.get('geo.coordinates.x', nans).astype(float)
+    gps_y = tweetdf.get('geo.coordinates.y', nans).astype(float)
+    gps = gps_x.notna().to_numpy()
+    x = gps_x.where(gps, tweetdf.get('geo.centroid.x', nans)).astype(float).to_numpy()
+    y = gps_y.where(gps, tweetdf.get('geo.centroid.y', nans)).astype(float).to_numpy()
+    return x, y, gps
+
+# function to read study area polygons
+def read_study_area(path):
+    '''
+    Reads study area polygons from a GIS file as a GeoSeries in WGS-84.
+    '''
+    import geopandas as gpd
+    
+    area = gpd.read_file(path)
+    if area.crs is not None:
+        area = area.to_crs('EPSG:4326')
+    return area.geometry[area.geometry.notna()].reset_index(drop=True)
+
+# function to count vertices of a polygonal geometry
+def count_vertices(geom):
+    return sum(len(part.exterior.coords) + sum(len(ring.coords) for ring in part.interiors)
+               for part in getattr(geom, 'geoms', [geom]) if part.geom_type == 'Polygon')
+
+# function to split a polygon to small pieces for the spatial index
+def subdivide_polygon(geom, max_vertices=64):
+    '''
+    Splits a polygon recursively in halves along its longer side until each
+    piece has at most max_vertices vertices. A spatial index of small pieces
+    rules most points in or out by bounding box alone, and the remaining
+    predicates are tested against simple pieces instead of the whole
+    polygon.
+    '''
+    if geom.is_empty:
+        return []
+    if count_vertices(geom) <= max_vertices:
+        return [geom]
+    
+    from shapely.geometry import box
+    
+    # split bounds in halves
+    minx, miny, maxx, maxy = geom.bounds
+    if maxx - minx >= maxy - miny:
+        mid = (minx + maxx) / 2
+        halves = [box(minx, miny, mid, maxy), box(mid, miny, maxx, maxy)]
+    else:
+        mid = (miny + maxy) / 2
+        halves = [box(minx, miny, maxx, mid), box(minx, mid, maxx, maxy)]
+    
+    # subdivide polygonal parts of both halves
+    pieces = []
+    for half in halves:
+        part = geom.intersection(half)
+        for piece in getattr(part, 'geoms', [part]):
+            if piece.geom_type in ('Polygon', 'MultiPolygon'):
+                pieces.extend(subdivide_polygon(piece, max_vertices))
+    
+    return pieces
+
+# function to subdivide polygons for bulk point queries
+def polygon_index(polygons):
+    '''
+    Returns the subdivided pieces of polygons as a GeoSeries and the position
+    of the polygon each piece belongs to. Build this once when querying the
+    same polygons several times.
+    '''
+    import geopandas as gpd
+    
+    pieces = []
+    parents = []
+    for i, geom in enumerate(polygons):
+        parts = subdivide_polygon(geom)
+        pieces.extend(parts)
+        parents.extend([i] * len(parts))
+    
+    return gpd.GeoSeries(pieces), np.array(parents, dtype=np.int64)
+
+# function to test points against polygons in bulk
+def points_in_polygons(x, y, polygons, index=None):
+    '''
+    Returns positions of points and polygons for each point intersecting a
+    polygon, from one bulk query of a spatial index of the subdivided
+    polygons. Points with missing coordinates never match. The index from
+    polygon_index is built here if not given.
+    '''
+    import geopandas as gpd
+    
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+    points = gpd.GeoSeries(gpd.points_from_xy(x[valid], y[valid]))
+    pieces, parents = index if index is not None else polygon_index(polygons)
+    
+    # query_bulk in geopandas before 1.0, query takes arrays after that
+    sindex = pieces.sindex
+    query = sindex.query_bulk if hasattr(sindex, 'query_bulk') else sindex.query
+    ipoint, ipiece = query(points, predicate='intersects')
+    
+    # map pieces to polygons, points on edges between pieces match once
+    pairs = np.unique(np.column_stack([valid[ipoint], parents[ipiece]]), axis=0)
+    
+    return pairs[:, 0], pairs[:, 1]
+
+# function to tell which points are within the study area
+def study_area_mask(x, y, polygons):
+    '''
+    Returns a boolean array telling which points intersect any of the study
+    area polygons.
+    '''
+    inside = np.zeros(len(x), dtype=bool)
+    inside[points_in_polygons(x, y, polygons)[0]] = True
+    return inside
+
+# function to keep or tag tweets within the study area
+def filter_study_area(tweetdf, polygons, mode='keep'):
+    '''
+    Keeps only tweets whose gps coordinates, or place centroid if there are
+    none, are within the study area polygons, or with mode 'tag' keeps all
+    tweets and adds a boolean in_study_area column.
+    '''
+    x, y, gps = tweet_coordinates(tweetdf)
+    inside = study_area_mask(x, y, polygons)
+    print('[INFO] - ' + str(inside.sum()) + ' of ' + str(len(tweetdf)) + ' tweets within study area')
+    
+    if mode == 'tag':
+        tweetdf = tweetdf.copy()
+        tweetdf['in_study_area'] = inside
+        return tweetdf
+    
+    return tweetdf[inside].reset_index(drop=True)
+
+# function to read boundary polygons and their ids
+def read_areas(spec):
+    '''
+    Reads boundary polygons for an area join from a GIS file as a GeoSeries
+    in WGS-84, with an array of their ids. The spec is the path of the file,
+    optionally followed by a colon and the name of the id column, otherwise
+    row numbers of the polygons are used as ids. Returns the name of the
+    area column too, which is the file name and id column separated by a dot.
+    '''
+    path, column = spec, None
+    if not os.path.exists(spec) and ':' in spec:
+        path, column = spec.rsplit(':', 1)
+    
+    import geopandas as gpd
+    
+    area = gpd.read_file(path)
+    if area.crs is not None:
+        area = area.to_crs('EPSG:4326')
+    area = area[area.geometry.notna()].reset_index(drop=True)
+    
+    # get ids and name of the area column
+    if column is None:
+        ids = area.index.to_numpy()
+        column = 'index'
+    elif column in area.columns:
+        ids = area[column].to_numpy()
+    else:
+        raise ValueError('Column ' + column + ' not found in ' + path)
+    name = os.path.splitext(os.path.basename(path))[0] + '.' + column
+    
+    return area.geometry, ids, name
+
+# function to get a signature of a boundary file for the area cache
+def area_signature(spec, decimals):
+    '''
+    Returns a key for the area cache which changes if the boundary file is
+    modified, so ids of an edited file are not taken from the cache.
+    '''
+    path = spec if os.path.exists(spec) else spec.rsplit(':', 1)[0]
+    stat = os.stat(path)
+    return (os.path.abspath(path), spec, stat.st_size, stat.st_mtime_ns, decimals)
+
+# function to get area join keys of tweets
+def area_keys(tweetdf, decimals=6):
+    '''
+    Returns the coordinates of tweets with an int64 key of the gps coordinates
+    rounded to at most 6 decimals, and the place id as key of tweets located by place
+    centroid only. Tweets at the same rounded coordinates or in the same
+    place always fall in the same area, so each key is joined only once. The
+    coordinate key is -1 and the place key None if not applicable.
+    '''
+    x, y, gps = tweet_coordinates(tweetdf)
+    located = ~(np.isnan(x) | np.isnan(y))
+    
+    # pack rounded coordinates into one integer, 29 bits for x and 28 for y
+    scale = 10 ** decimals
+    coord = np.full(len(x), -1, dtype=np.int64)
+    usegps = gps & located
+    xi = np.round((x[usegps] + 180) * scale).astype(np.int64)
+    yi = np.round((y[usegps] + 90) * scale).astype(np.int64)
+    coord[usegps] = (xi << 28) | yi
+    
+    # place ids of tweets without gps coordinates
+    place = tweetdf.get('geo.place_id', pd.Series(None, index=tweetdf.index, dtype=object))
+    place = place.to_numpy(dtype=object).copy()
+    place[gps | ~located] = None
+    
+    return x, y, coord, place
+
+# function to join areas to unique keys through the cache
+def cached_area_join(keys, x, y, polygons, ids, cache, index=None):
+    '''
+    Returns area ids for the keys, and the number of keys looked up from the
+    cache and tested against the polygons. Keys not in the cache are tested
+    at the coordinates of their first tweet and added to the cache, keys
+    outside all polygons are cached as None. Overlapping polygons give the
+    id of the first one.
+    '''
+    codes, uniques = pd.factorize(keys)
+    pos = cache.index.get_indexer(uniques)
+    
+    # test keys missing from the cache
+    missing = np.flatnonzero(pos < 0)
+    if len(missing) > 0:
+        rows = np.unique(codes, return_index=True)[1][missing]
+        ipoint, ipoly = points_in_polygons(x[rows], y[rows], polygons, index)
+        found = np.full(len(missing), None, dtype=object)
+        
+        # points are sorted, take the first polygon of each point
+        ipoint, firstpoly = np.unique(ipoint, return_index=True)
+        found[ipoint] = ids[ipoly[firstpoly]]
+        cache = pd.concat([cache, pd.Series(found, index=uniques[missing], dtype=object)])
+        pos = cache.index.get_indexer(uniques)
+    
+    # map unique keys back to tweets
+    values = cache.to_numpy(dtype=object)[pos][codes]
+    
+    return values, cache, len(uniques) - len(missing), len(missing)
+
+# function to attach area ids to tweets
+def join_areas(tweetdf, polygons, ids, name, cache=None, decimals=6):
+    '''
+    Adds a column of area ids to tweets from a bulk join of their gps
+    coordinates, or place centroid if there are none, against boundary
+    polygons. The cache is a dict of 'coord' and 'place' Series of known
+    area ids, which is updated and returned with the tweets.
+    '''
+    if cache is None:
+        cache = {}
+    x, y, coord, place = area_keys(tweetdf, decimals)
+    values = np.full(len(tweetdf), None, dtype=object)
+    hits = tested = 0
+    index = None
+    
+    # join gps coordinates and place centroids separately
+    for kind, keys, valid in [('coord', coord, coord >= 0),
+                              ('place', place, pd.notna(place))]:
+        known = cache.get(kind, pd.Series([], dtype=object))
+        if valid.any():
+            rows = np.flatnonzero(valid)
+            
+            # subdivide polygons only if something is not cached yet, and only once
+            if index is None and not pd.Index(keys[rows]).isin(known.index).all():
+                index = polygon_index(polygons)
+            values[rows], known, hit, miss = cached_area_join(keys[rows], x[rows], y[rows],
+                                                              polygons, ids, known, index)
+            hits += hit
+            tested += miss
+        cache[kind] = known
+    
+    print('[INFO] - ' + name + ': ' + str(pd.notna(values).sum()) + ' of ' + str(len(tweetdf))
+          + ' tweets within areas, ' + str(tested) + ' locations tested, '
+          + str(hits) + ' from cache')
+    
+    tweetdf = tweetdf.copy()
+    tweetdf[name] = pd.Series(values, index=tweetdf.index, dtype=object)
+    
+    return tweetdf, cache
+
+# function to read the area cache
+def read_area_cache(path):
+    '''
+    Reads a pickled dict of area caches keyed by boundary file signatures,
+    or returns an empty dict if there is no cache file yet.
+    '''
+    if path is None or not os.path.exists(path):
+        return {}
+    return pd.read_pickle(path)
+
+# name patterns of files next to collected tweets which hold no collected tweets, like
+# spill files of older versions, cell histories, combined outputs and preview samples
+SKIP_PATTERNS = ['*_spill*', '*_combined*', '*_history.pkl', '*_preview_*', '*_cache.pkl']
+
+# files marking directories of derived tables, like rollups and duplicate clusters
+DERIVED_MARKERS = ['rollup_files.json', 'duplicate_files.json']
+
+# function to list outputs of combine_tweets.py in a directory
+def combined_outputs(directory):
+    '''
+    Returns normalised paths of the files combined by combine_tweets.py in a
+    directory, found by the manifests written next to them.
+    '''
+    outputs = set()
+    for manifest in glob.glob(os.path.join(glob.escape(directory), '*_manifest.json')):
+        name = os.path.basename(manifest)[:-len('_manifest.json')]
+        for ext in ['pkl', 'feather'] + TEXT_FORMATS:
+            if name.endswith('_' + ext):
+                outputs.add(os.path.normpath(os.path.join(directory, name[:-len(ext) - 1] + '.' + ext)))
+    return outputs
+
+# function to list collected tweet files
+def tweet_files(path='.', patterns=('*.pkl', '*.feather', '*.jsonl', '*.jsonl.gz', '*.jsonl.zst'), recursive=False):
+    '''
+    Returns sorted paths of pickled, feather and json lines tweet files in a
+    directory, or also in its subdirectories if recursive. Entity tables,
+    outputs of combine_tweets.py, files matching SKIP_PATTERNS and files in
+    directories of rollups and duplicate clusters are skipped, so every
+    collected tweet is listed once.
+    '''
+    skip = tuple('_' + name + '.' + ext for name in ENTITY_TABLES for ext in ['pkl', 'feather'] + TEXT_FORMATS)
+    files = []
+    for pattern in patterns:
+        pattern = os.path.join('**', pattern) if recursive else pattern
+        files += [f for f in glob.glob(os.path.join(path, pattern), recursive=recursive) if not f.endswith(skip)]
+    
+    # skip derived files, checking each directory and its parents below path once
+    directories = {}
+    def derived(directory):
+        if directory not in directories:
+            marked = any([os.path.exists(os.path.join(directory, marker)) for marker in DERIVED_MARKERS])
+            parent = os.path.dirname(directory)
+            inside = os.path.normpath(directory) != os.path.normpath(path) and parent != directory
+            directories[directory] = marked or (inside and derived(parent))
+        return directories[directory]
+    outputs = {}
+    kept = []
+    for f in files:
+        directory = os.path.dirname(f)
+        if derived(directory):
+            continue
+        if directory not in outputs:
+            outputs[directory] = combined_outputs(directory)
+        if os.path.normpath(f) in outputs[directory]:
+            continue
+        if any([fnmatch.fnmatch(os.path.basename(f), pattern) for pattern in SKIP_PATTERNS]):
+            continue
+        kept.append(f)
+    
+    return sorted(kept)
+
+# function to import pyarrow, it is only needed for feather files and zstd without zstandard
+def import_arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.feather
+    except ImportError:
+        return None
+    return pa
+
+# function to import zstandard, it compresses zstd files with several threads
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+# function to save tweets as an uncompressed feather file
+def save_feather(tweetdf, path):
+    '''
+    Saves a dataframe as an Arrow IPC (feather) file without compression,
+    so it can be memory-mapped when read. Lists and dicts are stored as
+    Arrow lists and structs. Columns Arrow cannot type, like columns mixing
+    numbers and strings, are stored as strings.
+    '''
+    pa = import_arrow()
+    if pa is None:
+        raise ImportError('Saving feather files needs pyarrow, install it with: conda install -c conda-forge pyarrow')
+    
+    try:
+        table = pa.Table.from_pandas(tweetdf, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        arrays = {}
+        for col in tweetdf.columns:
+            try:
+                arrays[col] = pa.array(tweetdf[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                print('[INFO] - Saving column ' + col + ' as strings')
+                arrays[col] = pa.array(tweetdf[col].map(lambda v: None if v is None else str(v)), type=pa.string())
+        table = pa.table(arrays)
+    
+    pa.feather.write_feather(table, path, compression='uncompressed')
+
+# function to read tweets as an arrow table
+def read_table(path, columns=None):
+    '''
+    Reads a feather file as a memory-mapped Arrow table, with only the given
+    columns that are in the file if any. Data stays in the file until it is
+    converted to pandas.
+    '''
+    pa = import_arrow()
+    if pa is None:
+        raise ImportError('Reading feather files needs pyarrow, install it with: conda install -c conda-forge pyarrow')
+    
+    if columns is not None:
+        names = pa.ipc.open_file(pa.memory_map(path)).schema.names
+        columns = [col for col in columns if col in names]
+    
+    return pa.feather.read_table(path, columns=columns, memory_map=True)
+
+# function to concatenate arrow tables by reference
+def concat_tables(tables):
+    '''
+    Concatenates Arrow tables without copying their data. Columns missing
+    from some of the tables are filled with nulls. Columns of different types
+    in different tables are converted, timestamps saved as strings in old
+    files to utc datetimes and other columns to strings.
+    '''
+    import pyarrow as pa
+    
+    tables = list(tables)
+    types = {}
+    for table in tables:
+        for field in table.schema:
+            if not pa.types.is_null(field.type):
+                types.setdefault(field.name, set()).add(field.type)
+    
+    for name in [name for name, kinds in types.items() if len(kinds) > 1]:
+        for i, table in enumerate(tables):
+            if name not in table.column_names:
+                continue
+            if name in TIME_COLUMNS:
+                column = pa.array(utc_datetimes(table.column(name).to_pandas()))
+            else:
+                column = table.column(name).cast(pa.string())
+            tables[i] = table.set_column(table.schema.get_field_index(name), name, column)
+    
+    try:
+        return pa.concat_tables(tables, promote_options='permissive')
+    except TypeError:
+        return pa.concat_tables(tables, promote=True)
+
+# function to add a column of one value to an arrow table
+def constant_column(table, name, value):
+    import pyarrow as pa
+    return table.append_column(name, pa.array([value] * table.num_rows, type=pa.string()))
+
+# function to convert an arrow table to a tweet dataframe
+def table_to_frame(table):
+    '''
+    Converts an Arrow table to a dataframe like the collector scripts make,
+    with list columns as python lists instead of numpy arrays.
+    '''
+    import pyarrow as pa
+    
+    lists = [field.name for field in table.schema if pa.types.is_list(field.type) or pa.types.is_large_list(field.type)]
+    data = table.drop_columns(lists).to_pandas() if hasattr(table, 'drop_columns') else table.drop(lists).to_pandas()
+    for col in lists:
+        data[col] = pd.Series(table.column(col).to_pylist(), index=data.index, dtype=object)
+    
+    return data[table.column_names]
+
+# text output formats, csv or json lines, uncompressed or compressed with gzip or zstd
+TEXT_FORMATS = ['csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'jsonl.zst']
+
+# id columns kept as strings when reading csv files
+ID_COLUMNS = ['id', 'author_id', 'conversation_id', 'in_reply_to_user_id', 'referenced_tweets.id',
+              'referenced_tweets.author_id', 'user.id', 'geo.place_id', 'tweet_id', 'user_id']
+
+# function to compress a block of a text file
+def compress_block(data, compression, level=None):
+    '''
+    Compresses bytes as a complete gzip member or zstd frame. Members and
+    frames written one after another make a valid gzip or zstd file, so
+    blocks can be compressed in parallel and files appended to.
+    '''
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6 if level is None else level)
+    zstandard = import_zstandard()
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3 if level is None else level, threads=-1).compress(data)
+    pa = import_arrow()
+    if pa is None:
+        raise ImportError('Zstd files need zstandard or pyarrow, install one with: conda install -c conda-forge zstandard')
+    return pa.Codec('zstd', compression_level=3 if level is None else level).compress(data, asbytes=True)
+
+# function to open a text file for reading
+def open_text(path):
+    '''
+    Opens a csv or json lines file for reading as bytes, decompressing gzip
+    and zstd files by their extension.
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        zstandard = import_zstandard()
+        if zstandard is not None:
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        pa = import_arrow()
+        if pa is None:
+            raise ImportError('Zstd files need zstandard or pyarrow, install one with: conda install -c conda-forge zstandard')
+        return pa.input_stream(path, compression='zstd')
+    return open(path, 'rb')
+
+# function to format datetimes as api timestamps
+def time_strings(values):
+    '''
+    Returns datetimes as UTC timestamp strings in the format of the API and
+    CSV_TIME_FORMAT, with None for missing times. Formatted with numpy, which
+    is much faster than strftime or the iso format of to_json.
+    '''
+    if getattr(values.dt, 'tz', None) is not None:
+        values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+    strings = np.char.add(np.datetime_as_string(values.to_numpy(dtype='datetime64[s]'), unit='s'), '.000Z')
+    return pd.Series(np.where(values.isna().to_numpy(), None, strings.astype(object)), index=values.index, dtype=object)
+
+# function to save tweets as a csv or json lines file
+def save_text(tweetdf, path, append=False, chunksize=20000, threads=None):
+    '''
+    Saves a dataframe as a semicolon separated csv or a json lines file by
+    its extension, gzip or zstd compressed if it ends with .gz or .zst. Rows
+    are converted to text and compressed in chunks, compressing on threads
+    while the next chunk is converted, so only a few chunks of text are in
+    memory at a time. Json lines keep lists and dicts as json and timestamps
+    as ISO 8601 UTC strings like the API returns. With append, rows are added
+    to the end of an existing file without a header.
+    '''
+    compression = {'.gz': 'gzip', '.zst': 'zstd'}.get(os.path.splitext(path)[1])
+    lines = path.endswith(('.jsonl', '.jsonl.gz', '.jsonl.zst'))
+    threads = threads or min(4, os.cpu_count() or 1)
+    times = [col for col in tweetdf.columns if pd.api.types.is_datetime64_any_dtype(tweetdf[col])]
+    
+    with open(path, 'ab' if append else 'wb') as f, ThreadPoolExecutor(threads) as pool:
+        pending = deque()
+        for start in range(0, max(len(tweetdf), 1), chunksize):
+            chunk = tweetdf.iloc[start:start + chunksize]
+            if times:
+                chunk = chunk.assign(**{col: time_strings(chunk[col]) for col in times})
+            if lines:
+                text = chunk.to_json(orient='records', lines=True, double_precision=15,
+                                     force_ascii=False) if len(chunk) > 0 else ''
+                text = text if text.endswith('\n') or text == '' else text + '\n'
+            else:
+                text = chunk.to_csv(sep=';', header=start == 0 and not append)
+            data = text.encode('utf-8')
+            
+            # keep at most two chunks per thread waiting to be written
+            pending.append(pool.submit(compress_block, data, compression) if compression else data)
+            while len(pending) > 2 * threads:
+                block = pending.popleft()
+                f.write(block.result() if compression else block)
+        for block in pending:
+            f.write(block.result() if compression else block)
+
+# function to split a binary file to lines a block at a time
+def text_lines(f, blocksize=1 << 20):
+    rest = b''
+    while True:
+        block = f.read(blocksize)
+        if not block:
+            break
+        lines = (rest + block).split(b'\n')
+        rest = lines.pop()
+        yield from lines
+    yield rest
+
+# function to read a csv or json lines file in chunks
+def text_chunks(path, chunksize=20000, columns=None, nrows=None, as_text=False):
+    '''
+    Yields the rows of a csv or json lines file saved by save_text as
+    dataframes of at most chunksize rows, with ids as strings and timestamps
+    as text, so only one chunk of the file is in memory at a time. Only the
+    given columns that are in the file are kept. With as_text, all values of
+    csv files are kept as they are written in the file.
+    '''
+    with open_text(path) as f:
+        if path.endswith(('.jsonl', '.jsonl.gz', '.jsonl.zst')):
+            chunks = (pd.DataFrame(json.loads(b'[' + b','.join(lines) + b']')) for lines in
+                      chunked((line for line in text_lines(f) if line.strip()), chunksize, nrows))
+        else:
+            chunks = pd.read_csv(f, sep=';', index_col=0, nrows=nrows, chunksize=chunksize, encoding='utf-8',
+                                 dtype=str if as_text else {col: str for col in ID_COLUMNS},
+                                 keep_default_na=not as_text)
+        for chunk in chunks:
+            if columns is not None:
+                chunk = chunk[[col for col in columns if col in chunk.columns]]
+            yield chunk
+
+# function to group items of an iterable to lists of at most size items
+def chunked(items, size, limit=None):
+    chunk = []
+    for i, item in enumerate(items):
+        if limit is not None and i >= limit:
+            break
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# function to read tweets from a csv or json lines file
+def read_text(path, columns=None, nrows=None):
+    '''
+    Reads a csv or json lines file saved by save_text as a dataframe, with
+    timestamps as UTC datetimes and ids as strings. Only the given columns
+    that are in the file are kept. Lists in csv files stay as text. Json
+    lines are parsed in chunks, so the text of the whole file is never in
+    memory.
+    '''
+    if path.endswith(('.jsonl', '.jsonl.gz', '.jsonl.zst')):
+        chunks = list(text_chunks(path, columns=columns, nrows=nrows))
+        data = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    else:
+        with open_text(path) as f:
+            data = pd.read_csv(f, sep=';', index_col=0, nrows=nrows, encoding='utf-8',
+                               dtype={col: str for col in ID_COLUMNS})
+        if columns is not None:
+            data = data[[col for col in columns if col in data.columns]]
+    
+    return utc_columns(data)
+
+# function to read a collected tweet file
+def read_tweets(path, columns=None):
+    '''
+    Reads a pickled, feather, csv or json lines tweet file as a dataframe.
+    Only the given columns that are in the file are read from feather files,
+    other files are read in full and the columns selected afterwards.
+    '''
+    if path.endswith('.feather'):
+        return table_to_frame(read_table(path, columns))
+    if path.endswith(tuple('.' + ext for ext in TEXT_FORMATS)):
+        return read_text(path, columns)
+    
+    data = pd.read_pickle(path)
+    if columns is not None and isinstance(data, pd.DataFrame):
+        data = data[[col for col in columns if col in data.columns]]
+    return data
+
+# grid types of tweet aggregation
+GRID_TYPES = ['square', 'hex', 'geohash']
+
+# geohash alphabet
+GEOHASH_BASE32 = np.array(list('0123456789bcdefghjkmnpqrstuvwxyz'))
+
+# function to get geohash bit counts of longitude and latitude
+def geohash_bits(precision):
+    bits = 5 * int(precision)
+    return (bits + 1) // 2, bits // 2
+
+# function to get grid cells of coordinates
+def cell_index(x, y, grid, size):
+    '''
+    Returns integer column and row indices i and j of the grid cells of
+    coordinates. Square cells are size wide, hexagons are pointy-top with a
+    circumradius of size and indexed with axial coordinates, and geohash
+    cells have size characters, indexed by their longitude and latitude bits.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    
+    if grid == 'square':
+        return np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64)
+    
+    elif grid == 'hex':
+        # fractional axial coordinates rounded to the nearest hexagon in cube coordinates
+        q = (np.sqrt(3) / 3 * x - y / 3) / size
+        r = (2 / 3 * y) / size
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fixq = (dq > dr) & (dq > ds)
+        fixr = ~fixq & (dr > ds)
+        rq = np.where(fixq, -rr - rs, rq)
+        rr = np.where(fixr, -rq - rs, rr)
+        return rq.astype(np.int64), rr.astype(np.int64)
+    
+    elif grid == 'geohash':
+        xbits, ybits = geohash_bits(size)
+        i = np.floor((x + 180) / 360 * 2 ** xbits).astype(np.int64)
+        j = np.floor((y + 90) / 180 * 2 ** ybits).astype(np.int64)
+        return np.clip(i, 0, 2 ** xbits - 1), np.clip(j, 0, 2 ** ybits - 1)
+    
+    raise ValueError('Unknown grid type ' + str(grid) + ', use one of ' + ', '.join(GRID_TYPES))
+
+# function to get center coordinates of grid cells
+def cell_centers(i, j, grid, size):
+    i = np.asarray(i, dtype=float)
+    j = np.asarray(j, dtype=float)
+    
+    if grid == 'square':
+        return (i + 0.5) * size, (j + 0.5) * size
+    elif grid == 'hex':
+        return size * np.sqrt(3) * (i + j / 2), size * 1.5 * j
+    elif grid == 'geohash':
+        xbits, ybits = geohash_bits(size)
+        return (i + 0.5) / 2 ** xbits * 360 - 180, (j + 0.5) / 2 ** ybits * 180 - 90
+    
+    raise ValueError('Unknown grid type ' + str(grid) + ', use one of ' + ', '.join(GRID_TYPES))
+
+# function to get ids of grid cells
+def cell_ids(i, j, grid, size):
+    '''
+    Returns geohash strings of geohash cells, otherwise the column and row
+    indices of cells joined with an underscore.
+    '''
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    
+    if grid != 'geohash':
+        return pd.Series(i).astype(str).str.cat(pd.Series(j).astype(str), sep='_').to_numpy(dtype=object)
+    
+    # interleave longitude and latitude bits starting from longitude
+    xbits, ybits = geohash_bits(size)
+    code = np.zeros(len(i), dtype=np.int64)
+    for bit in range(xbits + ybits):
+        if bit % 2 == 0:
+            code = (code << 1) | ((i >> (xbits - 1 - bit // 2)) & 1)
+        else:
+            code = (code << 1) | ((j >> (ybits - 1 - bit // 2)) & 1)
+    
+    # encode five bits per character
+    chars = [GEOHASH_BASE32[(code >> (5 * (int(size) - 1 - c))) & 31] for c in range(int(size))]
+    return np.array([''.join(cell) for cell in zip(*chars)], dtype=object)
+
+# time bins of tweet aggregation
+TIME_BINS = ['hour', 'day', 'week', 'month']
+
+# function to parse tweet timestamps
+def parse_times(created_at):
+    '''
+    Returns tweet timestamps as a naive UTC datetime64 array. Timestamps can
+    be iso strings like the API gives them or datetimes.
+    '''
+    created_at = pd.Series(created_at)
+    
+    # datetime columns only need their time zone dropped
+    if created_at.dtype.kind == 'M':
+        if created_at.dt.tz is not None:
+            created_at = created_at.dt.tz_convert(None)
+        return created_at.to_numpy()
+    
+    # parse the seconds part of iso timestamps in utc with numpy, much faster than pandas
+    if pd.api.types.infer_dtype(created_at, skipna=True) in ('string', 'empty'):
+        try:
+            return np.array(created_at.fillna('NaT').tolist(), dtype='U19').astype('datetime64[s]')
+        except ValueError:
+            pass
+    return pd.to_datetime(created_at, utc=True).dt.tz_convert(None).to_numpy()
+
+# function to parse timestamps to a utc datetime column
+def utc_datetimes(values):
+    '''
+    Returns timestamps as a time zone aware UTC datetime series with the
+    index of the values, parsed in bulk.
+    '''
+    values = pd.Series(values)
+    return pd.Series(parse_times(values), index=values.index).dt.tz_localize('UTC')
+
+# columns of tweet dataframes holding timestamps
+TIME_COLUMNS = ['created_at', 'user.created_at']
+
+# format of timestamps in csv files, the format of the API
+CSV_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+
+# function to convert timestamp columns of tweets to utc datetimes
+def utc_columns(tweetdf, columns=TIME_COLUMNS):
+    '''
+    Converts the given timestamp columns of a dataframe to UTC datetime
+    columns in place, columns missing from the dataframe are skipped. Old
+    files with iso string timestamps can be mixed with new ones this way.
+    '''
+    for col in columns:
+        if col in tweetdf.columns and not isinstance(tweetdf[col].dtype, pd.DatetimeTZDtype):
+            tweetdf[col] = utc_datetimes(tweetdf[col])
     
-    # get initial output df
-    outdf = tweets.copy()
+    return tweetdf
+
+# twitter epoch of tweet ids in milliseconds since 1970, and the first tweet id holding a time
+TWITTER_EPOCH = 1288834974657
+SNOWFLAKE_START = 29700859247
+
+# function to decode creation times from tweet ids
+def snowflake_times(ids):
+    '''
+    Returns creation times of tweets decoded from their ids as a naive UTC
+    datetime64 array with millisecond precision. The upper 41 bits of a
+    tweet id are milliseconds since the twitter epoch. Ids of tweets from
+    before November 2010 hold no time and get NaT.
+    '''
+    ids = pd.Series(ids)
     
-    # create empty column
-    outdf['referenced_tweets.id'] = None
-    outdf['referenced_tweets.type'] = None
+    # ids are strings in collected files, convert them to integers in bulk
+    if ids.dtype.kind in 'iu':
+        numbers = ids.to_numpy(dtype=np.int64)
+    elif ids.dtype.kind == 'f':
+        numbers = ids.fillna(0).to_numpy().astype(np.int64)
+    else:
+        numbers = np.array(ids.fillna(0).tolist(), dtype='U20').astype(np.int64)
     
-    # get inital result of unlisted ref dicts
-    try:
-        
-        refs = tweets['referenced_tweets']
+    times = ((numbers >> 22) + TWITTER_EPOCH).astype('datetime64[ms]')
+    times[numbers < SNOWFLAKE_START] = np.datetime64('NaT')
+    return times
+
+# function to get creation times of tweets
+def tweet_times(tweetdf):
+    '''
+    Returns creation times of tweets as a naive UTC datetime64 array, from
+    created_at if the dataframe has it, otherwise decoded from tweet ids.
+    '''
+    if 'created_at' in tweetdf.columns:
+        return parse_times(tweetdf['created_at'])
+    return snowflake_times(tweetdf['id'])
+
+# function to get starting times of time bins
+def time_bins(created_at, timebin):
+    '''
+    Returns the UTC starting times of the hour, day, week (starting on
+    Monday) or month of tweet timestamps as a datetime64 array.
+    '''
+    times = parse_times(created_at)
+    
+    if timebin == 'hour':
+        return times.astype('datetime64[h]').astype('datetime64[ns]')
+    elif timebin == 'day':
+        return times.astype('datetime64[D]').astype('datetime64[ns]')
+    elif timebin == 'week':
+        days = times.astype('datetime64[D]')
+        return (days - (days.astype(np.int64) + 3) % 7).astype('datetime64[ns]')
+    elif timebin == 'month':
+        return times.astype('datetime64[M]').astype('datetime64[ns]')
+    
+    raise ValueError('Unknown time bin ' + str(timebin) + ', use one of ' + ', '.join(TIME_BINS))
+
+# columns of aggregate tables
+AGGREGATE_KEYS = ['i', 'j', 'time_bin']
+AGGREGATE_COUNTS = ['tweets', 'gps']
+
+# function to count tweets per grid cell and time bin
+def aggregate_tweets(tweetdf, grid, size, timebin, transformer=None):
+    '''
+    Counts tweets and gps tagged tweets per grid cell and time bin. Tweets are
+    located by their gps coordinates, or the centroid of their place if there
+    are no gps coordinates, and tweets with neither are left out. Coordinates
+    are transformed with a pyproj transformer before binning, if given.
+    '''
+    x, y, gps = tweet_coordinates(tweetdf)
+    located = ~(np.isnan(x) | np.isnan(y))
+    x, y, gps = x[located], y[located], gps[located]
+    if transformer is not None and len(x) > 0:
+        x, y = transformer.transform(x, y)
+    
+    # bin and count
+    i, j = cell_index(x, y, grid, size)
+    counts = pd.DataFrame({'i': i, 'j': j,
+                           'time_bin': time_bins(tweet_times(tweetdf)[located], timebin),
+                           'tweets': 1, 'gps': gps.astype(np.int64)})
+    
+    return counts.groupby(AGGREGATE_KEYS, sort=False, as_index=False)[AGGREGATE_COUNTS].sum()
+
+# function to combine partial aggregates into an aggregate table
+def finish_aggregate(partials, grid, size):
+    '''
+    Sums partial aggregates by grid cell and time bin and adds cell ids and
+    center coordinates of the cells. Partials can have negative counts to
+    subtract previous counts, cells and time bins left without tweets are
+    dropped.
+    '''
+    partials = [p[AGGREGATE_KEYS + AGGREGATE_COUNTS] for p in partials if len(p) > 0]
+    if len(partials) == 0:
+        return pd.DataFrame(columns=['cell', 'i', 'j', 'x', 'y', 'time_bin'] + AGGREGATE_COUNTS)
+    
+    agg = pd.concat(partials, ignore_index=True).groupby(AGGREGATE_KEYS, as_index=False)[AGGREGATE_COUNTS].sum()
+    agg = agg[agg['tweets'] != 0].reset_index(drop=True)
+    agg.insert(0, 'cell', cell_ids(agg['i'], agg['j'], grid, size))
+    agg['x'], agg['y'] = cell_centers(agg['i'], agg['j'], grid, size)
+    
+    return agg[['cell', 'i', 'j', 'x', 'y', 'time_bin'] + AGGREGATE_COUNTS]
+
+# rollups of daily tweet counts and the columns they are counted by
+ROLLUPS = {'day': [], 'lang': ['lang'], 'country_code': ['geo.country_code'],
+           'place_type': ['geo.place_type'], 'user': ['author_id']}
+
+# function to count tweets of one file for a rollup
+def rollup_counts(tweetdf, columns):
+    '''
+    Counts tweets per UTC day and the values of the columns. Missing values
+    and columns not in the dataframe are counted as empty strings.
+    '''
+    counts = pd.DataFrame({'day': time_bins(tweet_times(tweetdf), 'day')})
+    for col in columns:
+        values = tweetdf[col] if col in tweetdf.columns else pd.Series(None, index=tweetdf.index, dtype=object)
+        counts[col] = values.fillna('').astype(str).to_numpy()
+    
+    return counts.groupby(['day'] + columns, sort=False).size().rename('tweets').reset_index()
+
+# function to read a rollup table
+def read_rollup(path, name):
+    '''
+    Returns the tweet counts of a rollup, or an empty table if the rollup has
+    not been made yet.
+    '''
+    table = os.path.join(path, name + '.pkl')
+    if os.path.exists(table):
+        return pd.read_pickle(table)
+    return pd.DataFrame(columns=['day'] + ROLLUPS[name] + ['tweets'])
+
+# function to sum and write a rollup table
+def write_rollup(path, name, table):
+    table = table.astype({'day': 'datetime64[ns]', 'tweets': np.int64})
+    table = table.groupby(['day'] + ROLLUPS[name], as_index=False)['tweets'].sum()
+    table[table['tweets'] != 0].reset_index(drop=True).to_pickle(os.path.join(path, name + '.pkl'))
+
+# function to get the key of a tweet file in a directory of derived tables
+def file_key(file, path):
+    '''
+    Returns the path of a tweet file relative to a directory of derived
+    tables, like rollups or duplicate clusters, with forward slashes. Files
+    of the same name in different directories get different keys, and the
+    keys stay the same when the scripts are run from another directory.
+    '''
+    return os.path.relpath(os.path.abspath(file), os.path.abspath(path)).replace(os.sep, '/')
+
+# function to get the table of a tweet file in a directory of derived tables
+def key_table(path, folder, key):
+    return os.path.join(path, folder, urllib.parse.quote(key, safe='') + '.pkl')
+
+# function to list tables of tweet files in a directory of derived tables
+def key_tables(path, folder):
+    return sorted([os.path.join(path, folder, f) for f in os.listdir(os.path.join(path, folder)) if f.endswith('.pkl')]) \
+        if os.path.isdir(os.path.join(path, folder)) else []
+
+# function to move an entry keyed by file name by older versions to the key of the file
+def migrate_key(done, key, path, folder):
+    '''
+    Older versions kept tweet files in manifests and tables of derived
+    tables by file name only. Moves the entry and table of the file name to
+    the key of the file, if the key is not in the manifest yet.
+    '''
+    name = key.split('/')[-1]
+    if key in done or name not in done or name == key:
+        return
+    done[key] = done.pop(name)
+    old = os.path.join(path, folder, name + '.pkl')
+    if os.path.exists(old):
+        os.replace(old, key_table(path, folder, key))
+
+# function to update rollups with new or changed files
+def update_rollups(path, files, frames=None):
+    '''
+    Updates the rollup tables in a directory with tweet files that are new or
+    have changed since they were last rolled up. Counts of each file are kept
+    as partials, so the old counts of a changed file are subtracted before its
+    new counts are added and only the buckets of the file are touched. Files
+    are compared by size and modification time, listed in rollup_files.json
+    by their path relative to the rollup directory. Dataframes of the files
+    can be given as frames if they are in memory already, otherwise the files
+    are read as pickles. Returns the keys of rolled up files.
+    '''
+    os.makedirs(os.path.join(path, 'partials'), exist_ok=True)
+    manifest = os.path.join(path, 'rollup_files.json')
+    done = {}
+    if os.path.exists(manifest):
+        with open(manifest, 'r') as f:
+            done = json.load(f)
+    
+    # get files which are new or changed
+    updates = []
+    for i, file in enumerate(files):
+        stat = os.stat(file)
+        name = file_key(file, path)
+        migrate_key(done, name, path, 'partials')
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if done.get(name) != signature:
+            updates.append((name, signature, frames[i] if frames is not None else None, file))
+    if len(updates) == 0:
+        return []
+    
+    totals = {rollup: read_rollup(path, rollup) for rollup in ROLLUPS}
+    deltas = {rollup: [] for rollup in ROLLUPS}
+    partials = {}
+    for name, signature, tweetdf, file in updates:
         
-        # loop over references
-        for i, item in refs.items():
-            
-            # check if there are references on row
-            if type(item) == list:
-                
-                # create empty lists
-                refids = []
-                reftypes = []
-                
-                # loop over refs and append to list
-                for ref in item:
-                    reftypes.append(ref['type'])
-                    refids.append(ref['id'])
-                    
-                # convert refs to string
-                refids = ';'.join(refids)
-                reftypes = ';'.join(reftypes)
-                
-                # add parsed refs to correct cell
-                outdf.at[i, 'referenced_tweets.id'] = refids
-                outdf.at[i, 'referenced_tweets.type'] = reftypes
-    except:
-        pass
+        # count new tweets of the file
+        if tweetdf is None:
+            tweetdf = read_tweets(file, ['id', 'created_at'] + [col for cols in ROLLUPS.values() for col in cols])
+        partial = key_table(path, 'partials', name)
+        counts = {rollup: rollup_counts(tweetdf, columns) for rollup, columns in ROLLUPS.items()}
         
-    return outdf
+        # subtract previous counts of a changed file
+        if os.path.exists(partial):
+            for rollup, old in pd.read_pickle(partial).items():
+                deltas[rollup].append(old.assign(tweets=-old['tweets']))
+        for rollup in ROLLUPS:
+            deltas[rollup].append(counts[rollup])
+        partials[partial] = counts
+        done[name] = signature
+    
+    # add changes to the rollup tables
+    for rollup, columns in ROLLUPS.items():
+        table = pd.concat([totals[rollup]] + deltas[rollup], ignore_index=True)
+        write_rollup(path, rollup, table)
+    
+    # write partials and manifest only after the tables, rebuild_rollups fixes interrupted updates
+    for partial, counts in partials.items():
+        pd.to_pickle(counts, partial)
+    with open(manifest, 'w') as f:
+        json.dump(done, f, indent=1)
+    
+    return [update[0] for update in updates]
 
-# function to parse entity annotations
-def media_parse(tweets, media):
-    # get initial output df
-    outdf = tweets.copy()
+# function to rebuild rollup tables from partials
+def rebuild_rollups(path):
+    '''
+    Sums the rollup tables again from the partial counts of all rolled up
+    files, for example after an interrupted update.
+    '''
+    partials = [pd.read_pickle(f) for f in key_tables(path, 'partials')]
+    for rollup in ROLLUPS:
+        write_rollup(path, rollup, pd.concat([read_rollup(path, rollup).iloc[:0]]
+                                             + [counts[rollup] for counts in partials], ignore_index=True))
+
+# file of per-file statistics of a tweet store
+STORE_STATS = 'tweetstore_stats.json'
+
+# function to get statistics of a tweet file
+def file_stats(tweetdf):
+    '''
+    Returns the row count, columns, time range, coordinate bounds, counts of
+    gps and place located tweets and languages of a tweet dataframe, used to
+    skip files which cannot hold tweets matching a query.
+    '''
+    x, y, gps = tweet_coordinates(tweetdf)
+    located = ~(np.isnan(x) | np.isnan(y))
+    stats = {'rows': len(tweetdf), 'columns': list(tweetdf.columns), 'time': None, 'bounds': None,
+             'gps': int((gps & located).sum()), 'bbox': int((~gps & located).sum()), 'lang': None}
     
-    # create column
-    outdf['attachments.media_types'] = None
+    if ('created_at' in tweetdf.columns or 'id' in tweetdf.columns) and len(tweetdf) > 0:
+        times = tweet_times(tweetdf)
+        times = times[~np.isnat(times)]
+        if len(times) > 0:
+            stats['time'] = [str(times.min()), str(times.max())]
+    if located.any():
+        stats['bounds'] = [float(x[located].min()), float(y[located].min()),
+                           float(x[located].max()), float(y[located].max())]
+    if 'lang' in tweetdf.columns:
+        stats['lang'] = sorted(str(lang) for lang in tweetdf['lang'].dropna().unique())
     
-    # get inital results
-    medf = tweets['attachments.media_keys']
+    return stats
+
+# function to turn a date or time to naive utc datetime64
+def utc_time(value):
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is not None:
+        stamp = stamp.tz_convert('UTC').tz_localize(None)
+    return np.datetime64(stamp)
+
+# class to read collected tweets by time, area, location type and language
+class TweetStore:
+    '''
+    Reads collected tweets from a directory of pickled, feather or json lines
+    files and its subdirectories, skipping files tweet_files does not list.
+    Statistics of every file are kept in tweetstore_stats.json
+    in the directory and updated for new or changed files when the store is
+    opened, so queries skip files which cannot hold matching tweets without
+    reading them. Tweets are located by their gps coordinates, or the
+    centroid of their place if there are no gps coordinates. Timestamps
+    are returned as UTC datetimes, also from older files holding strings.
     
-    # loop over media keys
-    for i, item in medf.items():
+    For example gps tagged tweets of July 2021 in Helsinki:
         
-        # placholder for media types
-        types = None
+        store = TweetStore('results/')
+        tweets = store.read(start='2021-07-01', end='2021-08-01',
+                            bbox=(24.8, 60.1, 25.3, 60.3), locinfo='gps',
+                            columns=['id', 'text', 'x_coord', 'y_coord'])
+    '''
+    def __init__(self, path='.'):
+        self.path = path
+        self.stats = self.update_stats()
+    
+    def update_stats(self):
+        '''
+        Computes statistics of files which are new or have changed since the
+        statistics file was written and drops removed files from it.
+        '''
+        statfile = os.path.join(self.path, STORE_STATS)
+        old = {}
+        if os.path.exists(statfile):
+            with open(statfile, 'r') as f:
+                old = json.load(f)
         
-        # check if current row has media key
-        if type(item) == list:
+        stats = {}
+        for file in tweet_files(self.path, recursive=True):
+            name = os.path.relpath(file, self.path)
+            stat = os.stat(file)
+            signature = [stat.st_size, stat.st_mtime_ns]
+            if name in old and old[name]['signature'] == signature:
+                stats[name] = old[name]
+                continue
             
-            # empty list for media types
-            types = []
+            # other pickles in the directory are never read
+            data = read_tweets(file)
+            if isinstance(data, pd.DataFrame) and 'id' in data.columns:
+                stats[name] = dict(signature=signature, **file_stats(data))
+            else:
+                stats[name] = {'signature': signature, 'rows': 0}
+        
+        if stats != old:
+            with open(statfile, 'w') as f:
+                json.dump(stats, f)
+        
+        return stats
+    
+    def files(self, start=None, end=None, bbox=None, locinfo=None, lang=None):
+        '''
+        Returns paths of files which may hold tweets matching the query,
+        judging by their statistics.
+        '''
+        if locinfo not in (None, 'gps', 'bbox'):
+            raise ValueError('Unknown location type ' + str(locinfo) + ', use gps or bbox')
+        start = utc_time(start) if start is not None else None
+        end = utc_time(end) if end is not None else None
+        langs = [lang] if isinstance(lang, str) else lang
+        
+        files = []
+        for name, stats in sorted(self.stats.items()):
+            if stats['rows'] == 0:
+                continue
+            if (start is not None or end is not None) and stats['time'] is None:
+                continue
+            if start is not None and np.datetime64(stats['time'][1]) < start:
+                continue
+            if end is not None and np.datetime64(stats['time'][0]) >= end:
+                continue
+            if bbox is not None:
+                if stats['bounds'] is None:
+                    continue
+                minx, miny, maxx, maxy = stats['bounds']
+                if minx > bbox[2] or maxx < bbox[0] or miny > bbox[3] or maxy < bbox[1]:
+                    continue
+            if locinfo is not None and stats[locinfo] == 0:
+                continue
+            if langs is not None and not set(langs) & set(stats['lang'] or []):
+                continue
+            files.append(os.path.join(self.path, name))
+        
+        return files
+    
+    def select(self, tweetdf, start=None, end=None, bbox=None, locinfo=None, lang=None):
+        '''
+        Returns a boolean array telling which tweets of a dataframe match the
+        query. Start is inclusive and end exclusive, and times without a
+        time zone are UTC. Bbox is (minx, miny, maxx, maxy) in WGS-84 and
+        locinfo is 'gps' or 'bbox'.
+        '''
+        mask = np.ones(len(tweetdf), dtype=bool)
+        if start is not None or end is not None:
+            times = tweet_times(tweetdf)
+            if start is not None:
+                mask &= times >= utc_time(start)
+            if end is not None:
+                mask &= times < utc_time(end)
+        if bbox is not None or locinfo is not None:
+            x, y, gps = tweet_coordinates(tweetdf)
+            if bbox is not None:
+                mask &= (x >= bbox[0]) & (y >= bbox[1]) & (x <= bbox[2]) & (y <= bbox[3])
+            if locinfo == 'gps':
+                mask &= gps
+            elif locinfo == 'bbox':
+                mask &= ~gps & ~np.isnan(x)
+        if lang is not None:
+            mask &= tweetdf['lang'].isin([lang] if isinstance(lang, str) else lang).to_numpy()
+        
+        return mask
+    
+    def chunks(self, columns=None, **query):
+        '''
+        Yields the matching tweets of each file as a dataframe, with only the
+        given columns if any. Takes the same query arguments as files.
+        '''
+        files = self.files(**query)
+        print('[INFO] - Reading ' + str(len(files)) + ' of ' + str(len(self.stats)) + ' files')
+        # read only requested columns and columns of the query from feather files
+        needed = None
+        if columns is not None:
+            needed = list(dict.fromkeys(list(columns) + ['id', 'created_at', 'lang', 'geo.coordinates.x',
+                                                         'geo.coordinates.y', 'geo.centroid.x', 'geo.centroid.y']))
+        
+        for file in files:
+            data = utc_columns(read_tweets(file, needed))
+            data = data[self.select(data, **query)]
             
-            # loop over keys per tweet
-            for key in item:
-                med = media[media['media_key'] == key]
-                types.append(med['type'])
-                
-        # add types to correct index and column
-        outdf.at[i, 'attachments.media_types'] = types
+            # coordinate columns like in combined files
+            if 'x_coord' not in data.columns:
+                x, y, gps = tweet_coordinates(data)
+                data = data.assign(locinfo_type=np.where(gps, 'gps', 'bbox'), x_coord=x, y_coord=y)
+            if columns is not None:
+                data = data.reindex(columns=columns)
+            if len(data) > 0:
+                yield data.reset_index(drop=True)
     
-    # give output
-    return outdf
+    def read(self, columns=None, **query):
+        '''
+        Returns the matching tweets of all files as one dataframe, with only
+        the given columns if any. Takes the same query arguments as files.
+        '''
+        chunks = list(self.chunks(columns, **query))
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(chunks, ignore_index=True)
 
-# funcion to parse coordinates
-def coord_parse(tweets):
-    # get initial copy of df
-    outdf = tweets.copy()
+# types of tweet references and user interactions in tweet graphs
+REFERENCE_TYPES = ['replied_to', 'quoted', 'retweeted']
+INTERACTION_TYPES = ['reply', 'quote', 'retweet', 'mention']
+
+# columns needed to build tweet graphs
+GRAPH_COLUMNS = ['id', 'author_id', 'in_reply_to_user_id', 'referenced_tweets.id',
+                 'referenced_tweets.type', 'referenced_tweets.author_id', 'entities.mentions']
+
+# function to convert string ids to integers
+def int_ids(values):
+    '''
+    Returns tweet or user ids as an int64 array, with -1 for missing ids.
+    '''
+    values = pd.Series(values, dtype=object)
+    valid = (values.notna() & (values != '')).to_numpy()
+    numbers = np.full(len(values), -1, dtype=np.int64)
+    numbers[valid] = np.array(values[valid].tolist(), dtype='U20').astype(np.int64)
+    return numbers
+
+# function to split semicolon joined reference columns to one row per reference
+def split_refs(tweetdf, col, counts):
+    '''
+    Returns the values of a semicolon joined reference column one reference
+    per item, given the number of references of each row. Rows missing
+    values get empty strings, as many as they have references.
+    '''
+    values = tweetdf[col].tolist() if col in tweetdf.columns else [None] * len(tweetdf)
+    values = [v if type(v) == str else ';' * (c - 1) for v, c in zip(values, counts) if c > 0]
     
-    # check if coordinates exist
-    if 'geo.coordinates.coordinates' in outdf.columns.tolist():
-        
-        # loop over df
-        for i, row in outdf.iterrows():
-                
-            # check if row contains coordinate list
-            if type(row['geo.coordinates.coordinates']) == list:
-                
-                # extract x and y coords
-                outdf.at[i, 'geo.coordinates.x'] = row['geo.coordinates.coordinates'][0]
-                outdf.at[i, 'geo.coordinates.y'] = row['geo.coordinates.coordinates'][1]
-                
+    # split all rows at once, joined rows have as many semicolons as references
+    return np.array(';'.join(values).split(';') if values else [], dtype=object)
+
+# function to get edges of tweet graphs from a tweet dataframe
+def graph_edges(tweetdf):
+    '''
+    Returns the tweets, tweet references and user interactions of a tweet
+    dataframe as int64 arrays: tweet ids and authors, referenced tweets with
+    reference types, and interacted users with interaction types, each with
+    the row of the tweet they come from.
+    '''
+    tweets = int_ids(tweetdf['id'])
+    authors = int_ids(tweetdf['author_id']) if 'author_id' in tweetdf.columns else np.full(len(tweets), -1)
+    edges = {'tweets': tweets, 'authors': authors}
+    
+    # one row per reference, repeating the row of the referencing tweet
+    if 'referenced_tweets.id' in tweetdf.columns:
+        refs = tweetdf['referenced_tweets.id']
+        counts = np.array([ref.count(';') + 1 if type(ref) == str else 0 for ref in refs.tolist()], dtype=np.int64)
+        rows = np.repeat(np.arange(len(tweets)), counts)
+        dst = int_ids(split_refs(tweetdf, 'referenced_tweets.id', counts))
+        dst_author = int_ids(split_refs(tweetdf, 'referenced_tweets.author_id', counts))
+        kind = pd.Index(REFERENCE_TYPES).get_indexer(split_refs(tweetdf, 'referenced_tweets.type', counts))
     else:
-        outdf['geo.coordinates.coordinates'] = None
-        outdf['geo.coordinates.x'] = None
-        outdf['geo.coordinates.y'] = None
+        rows = dst = dst_author = kind = np.array([], dtype=np.int64)
+    keep = (dst >= 0) & (kind >= 0)
+    edges.update(ref_row=rows[keep], ref_dst=dst[keep], ref_type=kind[keep].astype(np.int8))
+    
+    # user interactions by replies, quotes and retweets, and mentions, reference types map to the first interaction types
+    rows, dst, kind = [rows], [dst_author], [kind]
+    if 'in_reply_to_user_id' in tweetdf.columns:
+        rows.append(np.arange(len(tweets)))
+        dst.append(int_ids(tweetdf['in_reply_to_user_id']))
+        kind.append(np.full(len(tweets), INTERACTION_TYPES.index('reply')))
+    if 'entities.mentions' in tweetdf.columns:
+        cells = [c if isinstance(c, (list, np.ndarray)) else [] for c in tweetdf['entities.mentions'].tolist()]
+        rows.append(np.repeat(np.arange(len(cells)), [len(c) for c in cells]))
+        dst.append(int_ids([m.get('id') for c in cells for m in c]))
+        kind.append(np.full(len(rows[-1]), INTERACTION_TYPES.index('mention')))
+    rows, dst, kind = [np.concatenate(arrays).astype(np.int64) for arrays in (rows, dst, kind)]
+    keep = (authors[rows] >= 0) & (dst >= 0) & (kind >= 0)
+    edges.update(user_row=rows[keep], user_dst=dst[keep], user_type=kind[keep].astype(np.int8))
+    
+    return edges
+
+# function to get sorted unique integers
+def sorted_unique(values):
+    '''
+    Returns the sorted unique values of an integer array by sorting, faster
+    than np.unique on large id arrays with newer numpy versions.
+    '''
+    values = np.sort(values)
+    return values[np.r_[True, values[1:] != values[:-1]]] if len(values) > 0 else values
+
+# function to save arrays of compressed sparse rows
+def save_csr(path, name, src, dst, n, values):
+    '''
+    Saves edges from and to integer node indices as compressed sparse rows:
+    name_indptr.npy with the start of the edges of every node,
+    name_indices.npy with the nodes they lead to, and an array of each of the
+    given edge values, like name_types.npy.
+    '''
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    np.save(os.path.join(path, name + '_indptr.npy'), indptr)
+    np.save(os.path.join(path, name + '_indices.npy'), dst[order].astype(np.int64))
+    for key, value in values.items():
+        np.save(os.path.join(path, name + '_' + key + '.npy'), value[order])
+
+# function to build tweet graphs of collected tweets
+def build_graph(files, path):
+    '''
+    Builds the reference graph of tweets and the interaction graph of users
+    of the given tweet files and saves them in the graph directory as
+    compressed sparse row arrays. Tweets and users are numbered by their
+    sorted ids, saved in tweet_ids.npy and user_ids.npy, and edges are saved
+    both ways, from referencing to referenced tweets and back, and from
+    interacting to interacted users and back. Tweets in several files are
+    counted once. Returns the numbers of nodes and edges.
+    '''
+    os.makedirs(path, exist_ok=True)
+    
+    # get edges of all files, numbering rows over all files
+    parts = {}
+    offset = 0
+    for file in files:
+        tweetdf = read_tweets(file, GRAPH_COLUMNS)
+        if not isinstance(tweetdf, pd.DataFrame) or 'id' not in tweetdf.columns:
+            continue
+        for key, values in graph_edges(tweetdf).items():
+            parts.setdefault(key, []).append(values + offset if key.endswith('_row') else values)
+        offset += len(tweetdf)
+        del tweetdf
+    keys = ['tweets', 'authors', 'ref_row', 'ref_dst', 'ref_type', 'user_row', 'user_dst', 'user_type']
+    edges = {key: np.concatenate(parts[key]) if key in parts else np.array([], dtype=np.int64) for key in keys}
+    
+    # keep the first row of tweets in several files
+    first = np.zeros(len(edges['tweets']), dtype=bool)
+    first[np.unique(edges['tweets'], return_index=True)[1]] = True
+    for name in ['ref', 'user']:
+        keep = first[edges[name + '_row']]
+        for key in ['_row', '_dst', '_type']:
+            edges[name + key] = edges[name + key][keep]
+    tweets, authors = edges['tweets'][first], edges['authors'][first]
+    
+    # number tweets and users by sorted ids, ids of tweets are in time order
+    tweet_ids = sorted_unique(np.concatenate([tweets, edges['ref_dst']]))
+    user_ids = sorted_unique(np.concatenate([authors[authors >= 0], edges['user_dst']]))
+    tweet_index = np.searchsorted(tweet_ids, edges['tweets'])
+    user_index = np.full(len(edges['authors']), -1, dtype=np.int64)
+    user_index[edges['authors'] >= 0] = np.searchsorted(user_ids, edges['authors'][edges['authors'] >= 0])
+    
+    # authors of tweets, -1 if not known
+    tweet_authors = np.full(len(tweet_ids), -1, dtype=np.int64)
+    tweet_authors[tweet_index[first]] = user_index[first]
+    
+    # references from tweets to tweets
+    src = tweet_index[edges['ref_row']]
+    dst = np.searchsorted(tweet_ids, edges['ref_dst'])
+    kind = edges['ref_type']
+    save_csr(path, 'references', src, dst, len(tweet_ids), {'types': kind})
+    save_csr(path, 'referenced_by', dst, src, len(tweet_ids), {'types': kind})
+    
+    # interactions counted once per tweet, replies are in both references and in_reply_to_user_id
+    users = len(user_ids) * len(INTERACTION_TYPES)
+    dst = np.searchsorted(user_ids, edges['user_dst']) * len(INTERACTION_TYPES) + edges['user_type']
+    unique = sorted_unique(edges['user_row'] * users + dst)
+    
+    # sum interactions of tweets to weights of user pairs
+    pairs, weights = np.unique(user_index[unique // users] * users + unique % users, return_counts=True)
+    src, dst, kind = pairs // users, pairs % users // len(INTERACTION_TYPES), (pairs % len(INTERACTION_TYPES)).astype(np.int8)
+    weights = weights.astype(np.int32)
+    save_csr(path, 'interactions', src, dst, len(user_ids), {'types': kind, 'weights': weights})
+    save_csr(path, 'interacted_by', dst, src, len(user_ids), {'types': kind, 'weights': weights})
+    
+    np.save(os.path.join(path, 'tweet_ids.npy'), tweet_ids)
+    np.save(os.path.join(path, 'tweet_authors.npy'), tweet_authors)
+    np.save(os.path.join(path, 'user_ids.npy'), user_ids)
+    
+    return {'tweets': len(tweet_ids), 'references': len(edges['ref_row']), 'users': len(user_ids),
+            'interactions': len(pairs)}
+
+# class to query tweet graphs
+class TweetGraph:
+    '''
+    Reads tweet graphs saved by build_graph from a graph directory. Arrays
+    are memory-mapped, so opening a graph and querying threads, references,
+    neighbours and degrees of single tweets and users only reads the parts
+    of the arrays they need. Ids are given and returned as strings.
+    
+    For example the thread of a tweet and the users most replied to:
         
-    # return output df
-    return outdf
+        graph = TweetGraph('graph/')
+        thread = graph.thread('1412345678901234567')
+        top = graph.degrees('reply', incoming=True).nlargest(10)
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.arrays = {}
+        self.tweet_ids = self.load('tweet_ids')
+        self.tweet_authors = self.load('tweet_authors')
+        self.user_ids = self.load('user_ids')
+    
+    def load(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self.arrays[name]
+    
+    def index(self, ids, nodes):
+        '''
+        Returns the node indices of ids, -1 for ids not in the graph.
+        '''
+        ids = int_ids(np.atleast_1d(np.asarray(ids, dtype=object)))
+        if len(nodes) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.searchsorted(nodes, ids).clip(0, len(nodes) - 1)
+        return np.where(nodes[pos] == ids, pos, -1)
+    
+    def edges(self, name, node, types, kind=None, keys=('types',)):
+        '''
+        Returns the nodes the edges of a graph lead to from a node and the
+        given values of the edges, only edges of the given type if any.
+        '''
+        indptr = self.load(name + '_indptr')
+        start, end = int(indptr[node]), int(indptr[node + 1])
+        nodes = np.array(self.load(name + '_indices')[start:end])
+        values = {key: np.array(self.load(name + '_' + key)[start:end]) for key in keys}
+        if kind is not None:
+            keep = values['types'] == types.index(kind)
+            nodes = nodes[keep]
+            values = {key: value[keep] for key, value in values.items()}
+        return nodes, values
+    
+    def references(self, tweet_id, kind=None, incoming=False):
+        '''
+        Returns the ids and types of tweets a tweet refers to, or of tweets
+        referring to it if incoming, only of the given reference type if any.
+        '''
+        node = self.index(tweet_id, self.tweet_ids)[0]
+        if node < 0:
+            return pd.DataFrame({'id': pd.Series(dtype=object), 'type': pd.Series(dtype=object)})
+        nodes, values = self.edges('referenced_by' if incoming else 'references', node, REFERENCE_TYPES, kind)
+        return pd.DataFrame({'id': self.tweet_ids[nodes].astype(str).astype(object),
+                             'type': np.array(REFERENCE_TYPES, dtype=object)[values['types']]})
+    
+    def thread(self, tweet_id):
+        '''
+        Returns the ids of the tweets of the reply thread of a tweet in time
+        order, from the first tweet of the thread found in the graph to all
+        replies to it, their replies and so on.
+        '''
+        node = self.index(tweet_id, self.tweet_ids)[0]
+        if node < 0:
+            return []
+        
+        # follow replies up to the first tweet of the thread
+        seen = {node}
+        while True:
+            parents, _ = self.edges('references', node, REFERENCE_TYPES, 'replied_to')
+            if len(parents) == 0 or parents[0] in seen:
+                break
+            node = parents[0]
+            seen.add(node)
+        
+        # collect replies level by level
+        thread = [node]
+        level = [node]
+        seen = {node}
+        while level:
+            replies = [reply for parent in level for reply in self.edges('referenced_by', parent, REFERENCE_TYPES, 'replied_to')[0]]
+            level = [reply for reply in replies if reply not in seen]
+            seen.update(level)
+            thread += level
+        
+        return self.tweet_ids[np.sort(thread)].astype(str).tolist()
+    
+    def neighbours(self, user_id, kind=None, incoming=False):
+        '''
+        Returns the ids of users a user has interacted with, or users who
+        have interacted with the user if incoming, with interaction types and
+        numbers of tweets, only of the given interaction type if any.
+        '''
+        node = self.index(user_id, self.user_ids)[0]
+        if node < 0:
+            return pd.DataFrame({'user_id': pd.Series(dtype=object), 'type': pd.Series(dtype=object),
+                                 'tweets': pd.Series(dtype=np.int32)})
+        nodes, values = self.edges('interacted_by' if incoming else 'interactions', node, INTERACTION_TYPES, kind,
+                                   ('types', 'weights'))
+        return pd.DataFrame({'user_id': self.user_ids[nodes].astype(str).astype(object),
+                             'type': np.array(INTERACTION_TYPES, dtype=object)[values['types']],
+                             'tweets': values['weights']})
+    
+    def degrees(self, kind=None, incoming=False, weighted=True):
+        '''
+        Returns the number of interactions of all users, or interactions
+        received if incoming, counted in tweets if weighted and otherwise in
+        users, only of the given interaction type if any, indexed by user id.
+        '''
+        name = 'interacted_by' if incoming else 'interactions'
+        indptr = np.asarray(self.load(name + '_indptr'))
+        weights = np.asarray(self.load(name + '_weights')) if weighted else np.ones(int(indptr[-1]), dtype=np.int32)
+        if kind is not None:
+            weights = np.where(np.asarray(self.load(name + '_types')) == INTERACTION_TYPES.index(kind), weights, 0)
+        nodes = np.repeat(np.arange(len(self.user_ids)), np.diff(indptr))
+        counts = np.bincount(nodes, weights=weights, minlength=len(self.user_ids)).astype(np.int64)
+        return pd.Series(counts, index=pd.Index(np.asarray(self.user_ids).astype(str).astype(object), name='user_id'),
+                         name='degree')
+
+# number of minhash bands and rows per band, tweets sharing half of their word pairs share a band with 2/3 probability
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+
+# links in tweet texts, and bytes of words: letters, digits, #, @, _ and all non-ascii characters
+LINK_PATTERN = re.compile(r'https?://[^\s\x00]+')
+WORD_BYTES = np.zeros(256, dtype=bool)
+WORD_BYTES[[ord(c) for c in 'abcdefghijklmnopqrstuvwxyz0123456789#@_']] = True
+WORD_BYTES[128:] = True
+
+# function to get word pair shingles of tweet texts
+def text_shingles(texts):
+    '''
+    Returns hashes of the word pairs of tweet texts, and the number of word
+    pairs of each text. Texts are lowercased and links, mentions and numbers
+    are replaced by placeholders, so tweets made from the same template with
+    different numbers, like weather reports, get the same word pairs. Texts
+    of one word get that word, empty texts get nothing. Words are found and
+    hashed from the bytes of all texts at once, without splitting texts.
+    '''
+    text = LINK_PATTERN.sub('url', '\x00'.join([t if type(t) == str else '' for t in texts]).lower())
+    data = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+    
+    # find words and the text of each word, texts are separated by null bytes
+    word = WORD_BYTES[data]
+    edges = np.diff(np.r_[False, word, False].astype(np.int8))
+    starts = np.nonzero(edges == 1)[0]
+    lengths = np.nonzero(edges == -1)[0] - starts
+    counts = np.bincount(np.cumsum(data == 0)[starts], minlength=len(texts)).astype(np.int64)
+    
+    # hash words from their bytes and positions, numbers and mentions get placeholders
+    hashes = np.array([], dtype=np.uint64)
+    if len(starts) > 0:
+        keys = (np.arange(1, 65, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)) ^ np.uint64(0xC2B2AE3D27D4EB4F)
+        offsets = np.nonzero(word)[0] - np.repeat(starts, lengths)
+        hashes = np.add.reduceat(data[word] * keys[offsets % 64], np.r_[0, np.cumsum(lengths)[:-1]])
+        first = data[starts]
+        hashes[(first >= ord('0')) & (first <= ord('9'))] = 1
+        hashes[first == ord('@')] = 2
+        hashes = (hashes ^ (hashes >> np.uint64(31))) * np.uint64(0xBF58476D1CE4E5B9)
+    
+    # hash word pairs within texts, dropping pairs over two texts
+    ends = np.cumsum(counts)
+    pairs = hashes[:-1] * np.uint64(0x9E3779B97F4A7C15) + hashes[1:]
+    last = np.zeros(len(hashes), dtype=bool)
+    last[ends[counts > 0] - 1] = True
+    single = np.zeros(len(hashes), dtype=bool)
+    single[ends[counts == 1] - 1] = True
+    keep = ~last[:-1]
+    shingles = np.concatenate([pairs[keep], hashes[single]])
+    order = np.argsort(np.concatenate([np.nonzero(keep)[0], np.nonzero(single)[0]]), kind='stable')
+    
+    return shingles[order], np.where(counts > 1, counts - 1, counts)
+
+# function to get minhash signatures of shingles
+def minhash_signatures(shingles, counts, chunk=1 << 14):
+    '''
+    Returns MinHash signatures of texts as a uint32 array with a row per
+    text, given the shingles of all texts and the number of shingles of each
+    text. Texts without shingles get the largest value in every column.
+    Hash functions are fixed multiply-shift hashes, so signatures of
+    different runs can be compared.
+    '''
+    perms = MINHASH_BANDS * MINHASH_ROWS
+    steps = np.arange(1, perms + 1, dtype=np.uint64)
+    a = (steps * np.uint64(0x9E3779B97F4A7C15) | np.uint64(1))[:, None]
+    b = (steps * np.uint64(0xC2B2AE3D27D4EB4F))[:, None]
+    signatures = np.full((len(counts), perms), np.iinfo(np.uint32).max, dtype=np.uint32)
+    
+    # hash shingles of a chunk of texts at a time, a row per hash function, and take the minimum per text
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        stop = max(int(np.searchsorted(ends, ends[start] - counts[start] + chunk, side='right')), start + 1)
+        first, last = ends[start] - counts[start], ends[stop - 1]
+        hashes = ((shingles[None, first:last] * a + b) >> np.uint64(32)).astype(np.uint32)
+        filled = np.nonzero(counts[start:stop])[0]
+        if len(filled) > 0:
+            offsets = (ends[start:stop] - counts[start:stop] - first)[filled]
+            signatures[start + filled] = np.minimum.reduceat(hashes, offsets, axis=1).T
+        start = stop
+    
+    return signatures
+
+# function to hash minhash bands to lsh keys
+def band_keys(signatures):
+    '''
+    Returns a uint64 key of each band of MinHash signatures, with a row per
+    text and a column per band. Texts sharing a key are likely near-duplicates.
+    '''
+    bands = signatures.reshape(len(signatures), MINHASH_BANDS, MINHASH_ROWS).astype(np.uint64)
+    weights = np.arange(1, MINHASH_ROWS + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    keys = (bands * weights).sum(axis=2, dtype=np.uint64)
+    return keys ^ (np.arange(MINHASH_BANDS, dtype=np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F))
+
+# function to cluster texts by lsh keys
+def cluster_keys(keys, buckets, parents):
+    '''
+    Clusters texts sharing a band key with each other or with texts
+    clustered before. Buckets are the clusters of keys seen before and
+    parents the parent clusters of earlier clusters, a cluster joined to
+    another one pointing to it. Returns the cluster of each text, and the
+    updated buckets and parents.
+    '''
+    n = len(keys)
+    if n == 0:
+        return np.array([], dtype=np.int64), buckets, parents
+    rows = np.repeat(np.arange(n), MINHASH_BANDS)
+    codes, unique = pd.factorize(keys.ravel())
+    known = pd.Index(buckets.index).get_indexer(unique)
+    first = len(parents)
+    
+    # label texts and keys by the smallest cluster they are connected to, new texts by their row after old clusters
+    labels = first + np.arange(n, dtype=np.int64)
+    key_labels = np.full(len(unique), np.iinfo(np.int64).max, dtype=np.int64)
+    key_labels[known >= 0] = parents[buckets.to_numpy()[known[known >= 0]]]
+    order = np.argsort(codes, kind='stable')
+    starts = np.r_[0, np.nonzero(np.diff(codes[order]))[0] + 1]
+    while True:
+        key_labels = np.minimum(key_labels, np.minimum.reduceat(labels[rows[order]], starts))
+        new = key_labels[codes].reshape(n, MINHASH_BANDS).min(axis=1)
+        if (new == labels).all():
+            break
+        labels = new
+    
+    # join old clusters connected by new texts
+    old = parents[buckets.to_numpy()[known[known >= 0]]]
+    parents = parents.copy()
+    np.minimum.at(parents, old, key_labels[known >= 0])
+    
+    # number new clusters after old ones
+    fresh = np.unique(labels[labels >= first])
+    parents = np.concatenate([parents, first + np.arange(len(fresh), dtype=np.int64)])
+    renumber = lambda values: np.where(values >= first, first + np.searchsorted(fresh, values), values)
+    labels = renumber(labels)
+    
+    # resolve parents to top clusters
+    while True:
+        top = parents[parents]
+        if (top == parents).all():
+            break
+        parents = top
+    
+    # add new keys to buckets
+    added = pd.Series(renumber(key_labels[known < 0]), index=unique[known < 0])
+    buckets = pd.concat([buckets, added]) if len(buckets) > 0 else added
+    
+    return parents[labels], buckets, parents
+
+# function to update near-duplicate clusters with new tweet files
+def update_duplicates(path, files):
+    '''
+    Clusters near-duplicate tweets of files which are new or have changed
+    since the last update with each other and with tweets clustered before,
+    using MinHash signatures of word pairs with locality-sensitive hashing.
+    Keys of the hash buckets are kept in buckets.pkl and the cluster of every
+    tweet of a file in the tweets folder, so each update only reads the new
+    files. Clusters joined by new tweets are merged through clusters.npy.
+    Files are compared by size and modification time, listed in
+    duplicate_files.json by their path relative to the directory. Returns the
+    keys of updated files.
+    '''
+    os.makedirs(os.path.join(path, 'tweets'), exist_ok=True)
+    manifest = os.path.join(path, 'duplicate_files.json')
+    done = {}
+    if os.path.exists(manifest):
+        with open(manifest, 'r') as f:
+            done = json.load(f)
+    params = {'bands': MINHASH_BANDS, 'rows': MINHASH_ROWS}
+    if done.get('params', params) != params:
+        raise ValueError('Duplicate clusters in ' + path + ' were made with ' + str(done['params'])
+                         + ', remove the directory to cluster again')
+    files_done = done.get('files', {})
+    
+    # get files which are new or changed
+    updates = []
+    for file in files:
+        stat = os.stat(file)
+        name = file_key(file, path)
+        migrate_key(files_done, name, path, 'tweets')
+        if files_done.get(name) != [stat.st_size, stat.st_mtime_ns]:
+            updates.append((name, [stat.st_size, stat.st_mtime_ns], file))
+    if len(updates) == 0:
+        return []
+    
+    # get lsh keys of the texts of each new file
+    frames = []
+    keys = []
+    for name, signature, file in updates:
+        tweetdf = read_tweets(file, ['id', 'author_id', 'text'])
+        if not isinstance(tweetdf, pd.DataFrame) or 'text' not in tweetdf.columns:
+            continue
+        shingles, counts = text_shingles(tweetdf['text'].tolist())
+        keys.append(band_keys(minhash_signatures(shingles, counts)[counts > 0]))
+        frames.append(pd.DataFrame({'id': tweetdf['id'], 'author_id': tweetdf.get('author_id'),
+                                    'file': name, 'text': counts > 0}))
+    tweetdf = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['id', 'author_id', 'file', 'text'])
+    keys = np.concatenate(keys) if keys else np.zeros((0, MINHASH_BANDS), dtype=np.uint64)
+    
+    # cluster tweets with text
+    texts = tweetdf['text'].to_numpy(dtype=bool)
+    buckets = pd.read_pickle(os.path.join(path, 'buckets.pkl')) if os.path.exists(os.path.join(path, 'buckets.pkl')) \
+        else pd.Series([], dtype=np.int64, index=pd.Index([], dtype=np.uint64))
+    parents = np.load(os.path.join(path, 'clusters.npy')) if os.path.exists(os.path.join(path, 'clusters.npy')) \
+        else np.array([], dtype=np.int64)
+    clusters = np.full(len(tweetdf), -1, dtype=np.int64)
+    clusters[texts], buckets, parents = cluster_keys(keys, buckets, parents)
+    tweetdf['cluster'] = clusters
+    
+    # write clusters of the tweets of each file, then buckets and manifest
+    for name, table in tweetdf.groupby('file', sort=False):
+        table[['id', 'author_id', 'cluster']].reset_index(drop=True).to_pickle(key_table(path, 'tweets', name))
+    buckets.to_pickle(os.path.join(path, 'buckets.pkl'))
+    np.save(os.path.join(path, 'clusters.npy'), parents)
+    for name, signature, file in updates:
+        files_done[name] = signature
+    with open(manifest, 'w') as f:
+        json.dump({'params': params, 'files': files_done}, f, indent=1)
+    
+    return [update[0] for update in updates]
+
+# function to read near-duplicate clusters of tweets
+def read_duplicates(path, min_size=10, min_tweets=20, min_share=0.5):
+    '''
+    Returns the near-duplicate cluster of every clustered tweet with the
+    size of the cluster, and whether the cluster is a template of at least
+    min_size tweets and whether the author is a template author, with at
+    least min_tweets tweets of which at least min_share are in templates.
+    Tweets in several files are counted once.
+    '''
+    tables = [pd.read_pickle(file) for file in key_tables(path, 'tweets')]
+    tweets = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=['id', 'author_id', 'cluster'])
+    tweets = tweets.drop_duplicates(subset=['id']).reset_index(drop=True)
+    parents = np.load(os.path.join(path, 'clusters.npy')) if len(tweets) > 0 else np.array([], dtype=np.int64)
+    
+    # clusters of tweets may have been joined after the tweets were clustered
+    clustered = tweets['cluster'].to_numpy(dtype=np.int64) >= 0
+    tweets.loc[clustered, 'cluster'] = parents[tweets.loc[clustered, 'cluster'].to_numpy(dtype=np.int64)]
+    sizes = tweets.loc[clustered, 'cluster'].value_counts()
+    tweets['cluster_size'] = tweets['cluster'].map(sizes).fillna(0).astype(np.int64)
+    tweets['template'] = tweets['cluster_size'] >= min_size
+    
+    # authors with mostly template tweets
+    authors = tweets.groupby('author_id')['template'].agg(['size', 'mean'])
+    flagged = authors.index[(authors['size'] >= min_tweets) & (authors['mean'] >= min_share)]
+    tweets['template_author'] = tweets['author_id'].isin(flagged)
+    
+    return tweets
+
+# function to list layers of a geopackage
+def gpkg_layers(path):
+    '''
+    Returns the names of the layers in a GeoPackage, or an empty list if the
+    file does not exist.
+    '''
+    if not os.path.exists(path):
+        return []
+    with closing(sqlite3.connect(path)) as con:
+        return [row[0] for row in con.execute('SELECT table_name FROM gpkg_contents')]
+
+# function to get geometry column and fields of a geopackage layer
+def gpkg_fields(path, layer):
+    '''
+    Returns the name of the geometry column and the names of the other
+    columns of a GeoPackage layer.
+    '''
+    with closing(sqlite3.connect(path)) as con:
+        geom = con.execute('SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?',
+                           (layer,)).fetchone()[0]
+        fields = [row[1] for row in con.execute('PRAGMA table_info("' + layer + '")') if row[1] != geom]
+    return geom, fields
+
+# function to import the gdal python bindings
+def import_ogr():
+    '''
+    Returns the ogr and osr modules of the GDAL python bindings, or None for
+    both if the gdal package is not installed.
+    '''
+    try:
+        from osgeo import ogr, osr
+    except ImportError:
+        return None, None
+    return ogr, osr
+
+# function to run sql with the geopackage functions of gdal
+def gpkg_sql(dataset, sql):
+    '''
+    Runs an SQL statement with GDAL on a GeoPackage dataset opened for
+    update, which provides functions like CreateSpatialIndex and
+    DisableSpatialIndex.
+    '''
+    result = dataset.ExecuteSQL(sql)
+    if result is not None:
+        dataset.ReleaseResultSet(result)
+
+# function to get the ogr field type of a column
+def ogr_field(ogr, name, values):
+    '''
+    Returns a field definition for a column, integers as 64 bit integers,
+    booleans as integers of the boolean subtype, datetimes as datetimes and
+    anything else that is not a number as strings.
+    '''
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    types = {'integer': ogr.OFTInteger64, 'floating': ogr.OFTReal, 'mixed-integer-float': ogr.OFTReal,
+             'decimal': ogr.OFTReal, 'boolean': ogr.OFTInteger, 'datetime64': ogr.OFTDateTime,
+             'datetime': ogr.OFTDateTime}
+    field = ogr.FieldDefn(name, types.get(kind, ogr.OFTString))
+    if kind == 'boolean':
+        field.SetSubType(ogr.OFSTBoolean)
+    return field
+
+# function to write points to a geopackage layer in batches
+def write_points_gpkg(path, layer, data, x, y, batch_size=100000, append=False, crs='EPSG:4326'):
+    '''
+    Writes the rows of a dataframe as points to a GeoPackage layer, replacing
+    the layer or appending to it. The GeoPackage is opened once with GDAL and
+    batch_size rows are written in each transaction without a spatial index,
+    which is then created once with CreateSpatialIndex. Without the GDAL
+    python bindings the rows are written with geopandas in one go, and GDAL
+    keeps the index up to date while writing. Columns not in an existing
+    layer are skipped. Returns the number of written rows.
+    '''
+    ogr, osr = import_ogr()
+    
+    # columns of an existing layer
+    append = append and layer in gpkg_layers(path)
+    if append:
+        geom, fields = gpkg_fields(path, layer)
+        skipped = [col for col in data.columns if col not in fields]
+        if skipped:
+            print('[INFO] - Columns not in layer ' + layer + ' skipped: ' + ', '.join(skipped))
+        data = data.drop(columns=skipped)
+    
+    # write with geopandas without the gdal python bindings
+    if ogr is None:
+        import geopandas as gpd
+        print('[INFO] - GDAL python bindings not found, writing all rows at once with geopandas')
+        gdf = gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(data[x], data[y]), crs=crs)
+        if append:
+            gdf.to_file(path, layer=layer, driver='GPKG', mode='a')
+        else:
+            gdf.to_file(path, layer=layer, driver='GPKG', SPATIAL_INDEX='YES')
+        return len(data)
+    
+    # open the geopackage once for all batches
+    dataset = ogr.Open(path, 1) if os.path.exists(path) else ogr.GetDriverByName('GPKG').CreateDataSource(path)
+    if dataset is None:
+        raise IOError('Could not open ' + path + ' for writing with GDAL')
+    
+    # drop the spatial index of an existing layer while writing
+    if append:
+        lyr = dataset.GetLayerByName(layer)
+        gpkg_sql(dataset, "SELECT DisableSpatialIndex('" + layer + "', '" + geom + "')")
+    
+    # otherwise replace the layer with one without a spatial index
+    else:
+        for i in range(dataset.GetLayerCount()):
+            if dataset.GetLayerByIndex(i).GetName() == layer:
+                dataset.DeleteLayer(i)
+                break
+        srs = osr.SpatialReference()
+        srs.SetFromUserInput(crs)
+        if hasattr(srs, 'SetAxisMappingStrategy'):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        lyr = dataset.CreateLayer(layer, srs, ogr.wkbPoint, ['SPATIAL_INDEX=NO'])
+        for col in data.columns:
+            lyr.CreateField(ogr_field(ogr, col, data[col]))
+        geom = lyr.GetGeometryColumn()
+    
+    # get field indices and types of the columns
+    defn = lyr.GetLayerDefn()
+    columns = []
+    for col in data.columns:
+        idx = defn.GetFieldIndex(col)
+        field = defn.GetFieldDefn(idx)
+        columns.append((col, idx, field.GetType(), field.GetSubType() == ogr.OFSTBoolean))
+    
+    # write batches in transactions
+    for i in range(0, len(data), batch_size):
+        batch = data.iloc[i:i + batch_size]
+        values = [batch[col].tolist() for col, _, _, _ in columns]
+        dataset.StartTransaction()
+        for r, (px, py) in enumerate(zip(batch[x].tolist(), batch[y].tolist())):
+            feature = ogr.Feature(defn)
+            for (col, idx, kind, boolean), column in zip(columns, values):
+                value = column[r]
+                if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+                    feature.SetFieldNull(idx)
+                elif kind == ogr.OFTDateTime:
+                    value = pd.Timestamp(value)
+                    if value.tzinfo is not None:
+                        value = value.tz_convert('UTC')
+                    feature.SetField(idx, value.year, value.month, value.day, value.hour, value.minute,
+                                     value.second + value.microsecond / 1e6, 100 if value.tzinfo is not None else 0)
+                elif boolean:
+                    feature.SetField(idx, int(bool(value)))
+                elif kind in (ogr.OFTInteger, ogr.OFTInteger64):
+                    feature.SetField(idx, int(value))
+                elif kind == ogr.OFTReal:
+                    feature.SetField(idx, float(value))
+                else:
+                    feature.SetField(idx, str(value))
+            point = ogr.Geometry(ogr.wkbPoint)
+            point.AddPoint_2D(float(px), float(py))
+            feature.SetGeometryDirectly(point)
+            lyr.CreateFeature(feature)
+        dataset.CommitTransaction()
+    
+    # create the spatial index once and close the geopackage
+    gpkg_sql(dataset, "SELECT CreateSpatialIndex('" + layer + "', '" + geom + "')")
+    dataset = None
+    
+    return len(data)
+
+# function to delete rows of a geopackage layer by column values
+def delete_gpkg_rows(path, layer, column, values, returning='id'):
+    '''
+    Deletes the rows of a GeoPackage layer which have one of the values in
+    the column in one transaction, and returns the values of the returning
+    column of the deleted rows. Triggers of GDAL keep the spatial index and
+    feature count up to date.
+    '''
+    values = list(values)
+    if len(values) == 0:
+        return []
+    
+    where = ' FROM "' + layer + '" WHERE "' + column + '" IN (' + ', '.join(['?'] * len(values)) + ')'
+    with closing(sqlite3.connect(path)) as con:
+        with con:
+            deleted = [row[0] for row in con.execute('SELECT "' + returning + '"' + where, values)]
+            con.execute('DELETE' + where, values)
+    
+    return deleted
 
 # function to calculate bbox centroid
 def bbox_centroid(coords):
@@ -145,6 +3191,8 @@ def bbox_centroid(coords):
     Assumes coordinates are in a list in following order:
         [east, south, west, north]
     '''
+    from shapely.geometry import Point, Polygon
+    
     # get cardinalities
     se = Point(coords[0], coords[1])
     ne = Point(coords[0], coords[3])
@@ -163,10 +3211,18 @@ def bbox_centroid(coords):
     return cpair
 
 # function to parse and combine v2 responses
-def v2parser(tweets, maxcalls):
+def v2parser(tweets, maxcalls, fields=None):
+    
+    # tweets are only read, flatten_records never modifies them
+    tweetlist = tweets
     
-    # get unmutable copy of tweets
-    tweetlist = copy.deepcopy(tweets)
+    # declare only requested fields, everything if fields of a profile are not given
+    if fields is None:
+        fields = field_profile({})
+    tweet_fields = project_fields(TWEET_FIELDS, fields['tweet_fields'], 'tweet_fields')
+    user_fields = project_fields(USER_FIELDS, fields['user_fields'], 'user_fields')
+    place_fields = project_fields(PLACE_FIELDS, fields['place_fields'], 'place_fields')
+    requested = set(fields['tweet_fields'].split(','))
         
     # placeholder list for dataframes
     twtlist = []
@@ -175,47 +3231,35 @@ def v2parser(tweets, maxcalls):
     userlist = []
     medialist = []
     
-    # get locations of all ends of calls 
-    end_idx = [i for i, d in enumerate(tweetlist) if "result_count" in d.keys()]
+    # group messages to the tweets and includes of each call
+    pages = message_pages(tweetlist)
     
     # get indicator numbers for print messages
-    rounds = len(end_idx)
+    rounds = len(pages)
     cur_round = 1
     
-    # loop over end indices
-    for i, pos in enumerate(end_idx):
+    # loop over calls
+    for twts, includes in pages:
         
         # print indicator numbers
         print('[INFO] - Processing round ' + str(cur_round) + ' from ' + str(rounds))
         
-        # get accurate slicing off points
-        actual_pos = pos + 1
-        
-        # check if first call
-        if i == 0:
-            
-            # get first slice
-            tweetslice = tweetlist[:actual_pos]
-            
-        else:
-            
-            # get position where previous call ended
-            prev_pos = end_idx[i - 1] + 1
-            
-            # slice current tweets
-            tweetslice = tweetlist[prev_pos:actual_pos]
-
-        # get tweets
-        twts = tweetslice[:-2] # get all tweets per request max
+        # skip calls without tweets
+        if len(twts) == 0:
+            print('[INFO] - No tweets found in round: ' + str(cur_round))
+            cur_round += 1
+            continue
         
         # dataframefy
-        twts = pd.json_normalize(twts)
+        twts = flatten_records(twts, tweet_fields)
         
-        # parse point coordinates
-        twts = coord_parse(twts)
+        # parse point coordinates if requested
+        if 'geo' in requested:
+            twts = coord_parse(twts)
         
-        # parse refs from original tweets
-        twts = ref_parse(twts)
+        # parse refs from original tweets if requested
+        if 'referenced_tweets' in requested:
+            twts = ref_parse(twts)
         
         # append to tweetlist
         twtlist.append(twts)
@@ -223,10 +3267,10 @@ def v2parser(tweets, maxcalls):
         # try getting referenced tweets expansion
         try:
             # get referenced tweets expansion
-            rftwts = tweetslice[-2]['tweets']
+            rftwts = includes['tweets']
             
             # dataframefy
-            rftwts = pd.json_normalize(rftwts)
+            rftwts = flatten_records(rftwts, REFERENCED_FIELDS, generic=False)
             
             # drop unnecessary columns (ask Olle) from referenced tweets
             rftwts = rftwts[['id','author_id']].rename(columns={'author_id':'referenced_tweets.author_id',
@@ -240,10 +3284,10 @@ def v2parser(tweets, maxcalls):
         # try getting places expansion
         try:
             # get places expansion
-            places = tweetslice[-2]['places']
+            places = includes['places']
             
             # dataframefy
-            places = pd.json_normalize(places)
+            places = flatten_records(places, place_fields)
             
             # rename places columns
             places = places.rename(columns={'country_code':'geo.country_code',
@@ -253,12 +3297,13 @@ def v2parser(tweets, maxcalls):
                                             'country':'geo.country',
                                             'name':'geo.name'})
             
-            # calculate bbox centroid
-            places['geo.centroid'] = places['geo.bbox'].apply(bbox_centroid)
-            
-            # get centroid x and y coordinates
-            places['geo.centroid.x'] = places['geo.centroid'].apply(lambda x: x[0])
-            places['geo.centroid.y'] = places['geo.centroid'].apply(lambda x: x[1])
+            # calculate bbox centroid if place geometries were requested
+            if 'geo.bbox' in places.columns:
+                places['geo.centroid'] = places['geo.bbox'].apply(bbox_centroid)
+                
+                # get centroid x and y coordinates
+                places['geo.centroid.x'] = places['geo.centroid'].apply(lambda x: x[0])
+                places['geo.centroid.y'] = places['geo.centroid'].apply(lambda x: x[1])
             
             # append to placelist
             placelist.append(places)
@@ -269,10 +3314,10 @@ def v2parser(tweets, maxcalls):
         # try getting user expansion
         try:
             # get user expansion
-            users = tweetslice[-2]['users']
+            users = includes['users']
             
             # dataframefy
-            users = pd.json_normalize(users)
+            users = flatten_records(users, user_fields)
             
             # make user data joinable
             users = users.add_prefix('user.')
@@ -286,10 +3331,10 @@ def v2parser(tweets, maxcalls):
         # try geting media expansion
         try:
             # get media expansion
-            media = tweetslice[-2]['media']
+            media = includes['media']
             
             # dataframefy
-            media = pd.json_normalize(media)
+            media = flatten_records(media, MEDIA_FIELDS)
             
             # append to medialist
             medialist.append(media)
@@ -300,6 +3345,11 @@ def v2parser(tweets, maxcalls):
         # update current round indicator
         cur_round += 1
         
+    # return empty dataframe if no call had tweets
+    if len(twtlist) == 0:
+        print('[INFO] - No tweets at all in response.')
+        return pd.DataFrame()
+    
     # combine dataframes collected in rounds
     print('[INFO] - Combining tweet and expansion dataframes..')
     twtdf = pd.concat(twtlist, ignore_index=True)
@@ -311,9 +3361,12 @@ def v2parser(tweets, maxcalls):
     except:
         print('[INFO] - No referenced tweets at all in response.')
     
-    # concatenate user expansion data
-    userdf = pd.concat(userlist, ignore_index=True)
-    userdf = userdf.drop_duplicates(subset=['user.id'])
+    # try concatenating user expansion data
+    try:
+        userdf = pd.concat(userlist, ignore_index=True)
+        userdf = userdf.drop_duplicates(subset=['user.id'])
+    except:
+        print('[INFO] - No user expansions at all in response.')
     
     # try concatenating place expansion
     try:
@@ -331,27 +3384,29 @@ def v2parser(tweets, maxcalls):
     except:
         print('[INFO] - No media expansions at all in response.')
     
-    # combine together
+    # combine together, keeping tweets without matching expansions
     print('[INFO] - Combining tweets and expansions to one dataframe...')
-    outdf = pd.merge(twtdf, userdf, left_on='author_id', right_on='user.id')
+    outdf = twtdf
+    
+    # connect users to tweets if users are present
+    if userlist:
+        outdf = index_join(outdf, userdf, 'author_id', 'user.id')
     
     # connect places to tweets if places are present
-    try:
-        outdf = pd.merge(outdf, placedf, left_on='geo.place_id', right_on='geo.id', how='left')
-    except:
-        pass
+    if placelist and 'geo.place_id' in outdf.columns:
+        outdf = index_join(outdf, placedf, 'geo.place_id', 'geo.id')
     
-    # connected referenced tweets to original tweets if referenced tweets are present
-    try:
-        outdf = pd.merge(outdf, refdf, left_on='referenced_tweets.id', right_on='referenced_tweets.tweet_id',
-                         how='left')
-    except:
-        pass
+    # connect referenced tweets to original tweets if referenced tweets are present
+    if reflist and 'referenced_tweets.id' in outdf.columns:
+        outdf = ref_join(outdf, refdf)
     
     
     # convert NaNs to Nones
     outdf = outdf.where(pd.notnull(outdf), None)
     
+    # parse timestamps to utc datetimes in bulk
+    outdf = utc_columns(outdf)
+    
     # drop irrelevant columns from last round
     try:
         outdf = outdf.drop(columns=['attachments.poll_ids'])
@@ -50,8 +50,6 @@ above the last collected day would be 2019-06-14.
 @author: Tuomas Väisänen & Seija Sirkiä
 """
 
-from util_functions import v2parser, daterange
-from searchtweets import ResultStream, gen_request_parameters, load_credentials, read_config
 from datetime import datetime, timedelta
 import time
 import argparse
@@ -60,35 +58,66 @@ import argparse
 ap = argparse.ArgumentParser()
 
 # Get starting date
-ap.add_argument("-sd", "--startdate", required=True,
+ap.add_argument("-sd", "--startdate", required=False,
                 type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
                 help="Start date of the collection in the following form: "
-                " YEAR-MO-DA for example 2018-01-28")
+                " YEAR-MO-DA for example 2018-01-28. Required unless style is "
+                "incremental")
 
 # Get end date
-ap.add_argument("-ed", "--enddate", required=True,
+ap.add_argument("-ed", "--enddate", required=False,
                 type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
                 help="End date of the collection in the following form: "
-                " YEAR-MO-DA for example 2018-02-18")
+                " YEAR-MO-DA for example 2018-02-18. Required unless style is "
+                "incremental")
 
 # get save format
 ap.add_argument("-o", "--output", required=True, default='pkl',
-                help="Output file format, valid options are either pkl or csv. "
-                "Default: pkl")
+                help="Output file format, valid options are pkl, feather, csv or jsonl, "
+                "csv and jsonl optionally compressed as csv.gz, csv.zst, jsonl.gz or "
+                "jsonl.zst. Feather files need pyarrow, zstd files zstandard or pyarrow. Default: pkl")
 
 # get retrieval style
 ap.add_argument("-s", "--style", required=True, default='iterative',
-                help="Set retrieve style. Options: bulk or iterative. Bulk collects "
-                "tweets to one big file. Iterative collects each day separately")
+                help="Set retrieve style. Options: bulk, iterative or incremental. "
+                "Bulk collects tweets to one big file. Iterative collects each day "
+                "separately. Incremental collects only tweets newer than the newest "
+                "tweet collected on the previous run with the same query tag")
 
 # get wait time
 ap.add_argument("-w", "--wait", required=False, default=15,
-                help="Set wait time between requests to avoid Twitter rate limits. "
-                "Default: 15")
+                help="Set wait time after connection errors. Requests are spaced "
+                "by the rate limiter. Default: 15")
+
+# get state file for incremental collection
+ap.add_argument("-st", "--state", required=False, default='since_ids.json',
+                help="Path to the json file storing the newest collected tweet id "
+                "per query tag for incremental style. Default: since_ids.json")
+
+# get entity table output
+ap.add_argument("-et", "--entities", required=False, action='store_true',
+                help="Also save hashtags, cashtags, mentions, urls and annotations "
+                "as long format tables next to each output file, one row per entity")
+
+# get rollup directory
+ap.add_argument("-ru", "--rollups", required=False, default=None,
+                help="Directory of daily rollup tables to update after each saved "
+                "file, see rollup_tweets.py. Default: no rollups")
 
 # Parse arguments
 args = vars(ap.parse_args())
 
+# output formats, the text formats are TEXT_FORMATS of util_functions.py
+OUTPUTS = ['pkl', 'feather', 'csv', 'csv.gz', 'csv.zst', 'jsonl', 'jsonl.gz', 'jsonl.zst']
+
+# check arguments before importing heavy libraries, so errors return at once
+if args['style'] not in ['bulk', 'iterative', 'incremental']:
+    ap.error('invalid style, valid options are bulk, iterative or incremental')
+if args['style'] != 'incremental' and (args['startdate'] is None or args['enddate'] is None):
+    ap.error('the following arguments are required for bulk and iterative style: -sd/--startdate, -ed/--enddate')
+if args['output'] not in OUTPUTS:
+    ap.error('invalid output file, valid options are ' + ', '.join(OUTPUTS))
+
 # get waittime
 waittime = int(args['wait'])
 
@@ -99,39 +128,39 @@ rstyle = args['style']
 if args['output'] == 'pkl':
     # save to pickle
     print('[INFO] - Output file set to pickle')
-elif args['output'] == 'csv':
-    # save to csv
-    print('[INFO] - Output file set to csv')
+elif args['output'] == 'feather':
+    # save to feather
+    print('[INFO] - Output file set to feather')
 else:
-    print('[INFO] - Invalid output file! Valid options are pickle or csv. Exiting...')
-    exit
+    # save to csv or json lines
+    print('[INFO] - Output file set to ' + args['output'])
 
-# load twitter keys
+# load twitter keys and configuration for search query
+from searchtweets import gen_request_parameters, load_credentials, read_config
 search_creds = load_credentials('.twitter_keys.yaml',
                                yaml_key = 'search_tweets_v2',
                                env_overwrite = False)
-
-# load configuration for search query
 config = read_config('search_config.yaml')
 
-# fields for v2 api
-tweetfields = ",".join(["attachments", "author_id", "conversation_id", "created_at",
-                        "entities", "geo", "id", "in_reply_to_user_id", "lang",
-                        "public_metrics", "possibly_sensitive", "referenced_tweets",
-                        "reply_settings", "text", "withheld",])
-userfields = ",".join(["created_at", "description", "entities", "location",
-                       "name", "profile_image_url", "protected", "public_metrics",
-                       "url", "username", "verified", "withheld"])
-mediafields= ",".join(["media_key", "type", "url"])
-placefields = ",".join(["contained_within", "country", "country_code", "full_name",
-                        "geo", "id", "name",  "place_type"])
-expansions = ",".join(["attachments.media_keys", "author_id", "entities.mentions.username",
-                       "geo.place_id", "in_reply_to_user_id", "referenced_tweets.id",
-                       "referenced_tweets.id.author_id"])
-
-# set interval to loop through
-start_date = args['startdate'].date()
-end_date = args['enddate'].date()
+# import heavy libraries after checking arguments and config
+from util_functions import v2parser, field_profile, TEXT_FORMATS, save_text, save_feather, entity_tables, save_entities, update_rollups, daterange, order_columns, read_since_id, write_since_id, make_pooled_session, stream_tweets, session_stats, RateLimiter
+
+# open one pooled session and rate limiter for the whole run
+session = make_pooled_session(search_creds['bearer_token'])
+limiter = RateLimiter()
+
+# get request fields and expansions of the field profile
+fields = field_profile(config)
+
+# set interval to loop through, incremental style defaults to yesterday
+if args['startdate'] is not None:
+    start_date = args['startdate'].date()
+else:
+    start_date = datetime.utcnow().date() - timedelta(days=1)
+if args['enddate'] is not None:
+    end_date = args['enddate'].date()
+else:
+    end_date = datetime.utcnow().date()
 
 # check which retrieval style
 if rstyle == 'iterative':
@@ -150,20 +179,9 @@ if rstyle == 'iterative':
                                 results_per_call = config['results_per_call'],
                                 start_time = start_ts.isoformat(),
                                 end_time = end_ts.isoformat(),
-                                tweet_fields = tweetfields,
-                                user_fields = userfields,
-                                media_fields = mediafields,
-                                place_fields = placefields,
-                                expansions = expansions,
+                                **fields,
                                 stringify = False)
     
-        # result stream from twitter v2 api
-        rs = ResultStream(request_parameters = rule,
-                          max_results=100000,
-                          max_pages=1,
-                          max_tweets = config['max_tweets'],
-                          **search_creds)
-        
         # number of reconnection tries
         tries = 10
         
@@ -176,7 +194,7 @@ if rstyle == 'iterative':
                 print('[INFO] - Retrieving tweets from ' + str(start_ts))
             
                 # get json response to list
-                tweets = list(rs.stream())
+                tweets = list(stream_tweets(session, search_creds['endpoint'], rule, config['max_tweets'], limiter))
                 
                 # break free from while loop
                 break
@@ -189,48 +207,35 @@ if rstyle == 'iterative':
         
         # parse results to dataframe
         print('[INFO] - Parsing tweets from ' + str(start_ts))
-        tweetdf = v2parser(tweets, config['results_per_call'])
+        tweetdf = v2parser(tweets, config['results_per_call'], fields)
         
         # try to order columns semantically
-        try:
-            tweetdf = tweetdf[['id', 'author_id', 'created_at', 'reply_settings', 'conversation_id',
-                               'in_reply_to_user_id', 'text', 'possibly_sensitive',
-                               'lang', 'referenced_tweets', 'referenced_tweets.id',
-                               'referenced_tweets.author_id', 'referenced_tweets.type',
-                               'public_metrics.retweet_count', 'public_metrics.reply_count',
-                               'public_metrics.like_count', 'public_metrics.quote_count',
-                               'entities.mentions', 'entities.urls', 'entities.hashtags',
-                               'entities.annotations', 'attachments.media_keys',
-                               'attachments.media_types', 'user.description', 'user.verified', 'user.id', 'user.protected',
-                               'user.url', 'user.profile_image_url', 'user.location', 'user.name',
-                               'user.created_at', 'user.username', 'user.public_metrics.followers_count',
-                               'user.public_metrics.following_count', 'user.public_metrics.tweet_count',
-                               'user.public_metrics.listed_count', 'user.entities.description.hashtags',
-                               'user.entities.url.urls', 'user.entities.description.mentions',
-                               'user.entities.description.urls', 'geo.place_id', 'geo.coordinates.type',
-                               'geo.coordinates.coordinates', 'geo.coordinates.x', 'geo.coordinates.y',
-                               'geo.full_name', 'geo.name', 'geo.place_type', 'geo.country',
-                               'geo.country_code', 'geo.type', 'geo.bbox', 'geo.centroid',
-                               'geo.centroid.x', 'geo.centroid.y']]
-        except:
-            pass
+        tweetdf = order_columns(tweetdf)
         
         # set up file prefix from config
         file_prefix_w_date = config['filename_prefix'] + start_ts.isoformat()
         outpickle = file_prefix_w_date + '.pkl'
-        outcsv = file_prefix_w_date + '.csv'
+        outtext = file_prefix_w_date + '.' + args['output']
+        outfeather = file_prefix_w_date + '.feather'
         
         # save to file
         if args['output'] == 'pkl':
             # save to pickle
             tweetdf.to_pickle(outpickle)
-        elif args['output'] == 'csv':
-            # save to csv
-            tweetdf.to_csv(outcsv, sep=';', encoding='utf-8')
+        elif args['output'] in TEXT_FORMATS:
+            # save to csv or json lines, compressed by extension
+            save_text(tweetdf, outtext)
+        elif args['output'] == 'feather':
+            # save to memory-mappable feather
+            save_feather(tweetdf, outfeather)
+        
+        # save long format entity tables
+        if args['entities']:
+            save_entities(entity_tables(tweetdf), file_prefix_w_date, args['output'])
         
-        # sleeps to not hit request limit so soon
-        print('[INFO] - Waiting for ' + str(waittime) + ' seconds before collecting next date..')
-        time.sleep(waittime)
+        # update daily rollups with the saved file
+        if args['rollups'] is not None:
+            update_rollups(args['rollups'], [file_prefix_w_date + '.' + args['output']], [tweetdf])
 
 # check if retrieval style if bulk
 elif rstyle == 'bulk':
@@ -246,20 +251,9 @@ elif rstyle == 'bulk':
                                   results_per_call = config['results_per_call'],
                                   start_time = start_ts.isoformat(),
                                   end_time = end_ts.isoformat(),
-                                  tweet_fields = tweetfields,
-                                  user_fields = userfields,
-                                  media_fields = mediafields,
-                                  place_fields = placefields,
-                                  expansions = expansions,
+                                  **fields,
                                   stringify = False)
     
-    # result stream from twitter v2 api
-    rs = ResultStream(request_parameters = rule,
-                      max_results=100000,
-                      max_pages=1,
-                      max_tweets = config['max_tweets'],
-                      **search_creds)
-    
     # number of reconnection tries
     tries = 10
     
@@ -273,7 +267,7 @@ elif rstyle == 'bulk':
             print('[INFO] - Retrieving tweets between ' + str(start_ts) + ' and ' + str(end_ts))
         
             # get json response to list
-            tweets = list(rs.stream())
+            tweets = list(stream_tweets(session, search_creds['endpoint'], rule, config['max_tweets'], limiter))
             
             # break free from while loop
             break
@@ -286,43 +280,139 @@ elif rstyle == 'bulk':
     
     # parse results to dataframe
     print('[INFO] - Parsing collected tweets from ' + str(start_ts) + ' to ' + str(end_ts))
-    tweetdf = v2parser(tweets, config['results_per_call'])
+    tweetdf = v2parser(tweets, config['results_per_call'], fields)
     
     # try to order columns semantically
-    try:
-        tweetdf = tweetdf[['id', 'author_id', 'created_at', 'reply_settings', 'conversation_id',
-                           'in_reply_to_user_id', 'text', 'possibly_sensitive',
-                           'lang', 'referenced_tweets', 'referenced_tweets.id', 
-                           'referenced_tweets.author_id', 'referenced_tweets.type',
-                           'public_metrics.retweet_count', 'public_metrics.reply_count',
-                           'public_metrics.like_count', 'public_metrics.quote_count',
-                           'entities.mentions', 'entities.urls', 'entities.hashtags',
-                           'entities.annotations', 'attachments.media_keys',
-                           'attachments.media_types', 'user.description', 'user.verified', 'user.id', 'user.protected',
-                           'user.url', 'user.profile_image_url', 'user.location', 'user.name',
-                           'user.created_at', 'user.username', 'user.public_metrics.followers_count',
-                           'user.public_metrics.following_count', 'user.public_metrics.tweet_count',
-                           'user.public_metrics.listed_count', 'user.entities.description.hashtags',
-                           'user.entities.url.urls', 'user.entities.description.mentions',
-                           'user.entities.description.urls', 'geo.place_id', 'geo.coordinates.type',
-                           'geo.coordinates.coordinates', 'geo.coordinates.x', 'geo.coordinates.y',
-                           'geo.full_name', 'geo.name', 'geo.place_type', 'geo.country',
-                           'geo.country_code', 'geo.type', 'geo.bbox', 'geo.centroid',
-                           'geo.centroid.x', 'geo.centroid.y']]
-    except:
-        pass
+    tweetdf = order_columns(tweetdf)
     
     # set up file prefix from config
     file_prefix_w_date = config['filename_prefix'] + start_ts.isoformat()
     outpickle = file_prefix_w_date + '.pkl'
-    outcsv = file_prefix_w_date + '.csv'
+    outtext = file_prefix_w_date + '.' + args['output']
+    outfeather = file_prefix_w_date + '.feather'
     
     # save to file
     if args['output'] == 'pkl':
         # save to pickle
         tweetdf.to_pickle(outpickle)
-    elif args['output'] == 'csv':
-        # save to csv
-        tweetdf.to_csv(outcsv, sep=';', encoding='utf-8')
+    elif args['output'] in TEXT_FORMATS:
+        # save to csv or json lines, compressed by extension
+        save_text(tweetdf, outtext)
+    elif args['output'] == 'feather':
+        # save to memory-mappable feather
+        save_feather(tweetdf, outfeather)
+    
+    # save long format entity tables
+    if args['entities']:
+        save_entities(entity_tables(tweetdf), file_prefix_w_date, args['output'])
+    
+    # update daily rollups with the saved file
+    if args['rollups'] is not None:
+        update_rollups(args['rollups'], [file_prefix_w_date + '.' + args['output']], [tweetdf])
+
+# check if retrieval style is incremental
+elif rstyle == 'incremental':
+    
+    # get query tag, fall back to filename prefix
+    tag = config.get('tag', config['filename_prefix'])
+    
+    # get newest tweet id from previous run
+    since_id = read_since_id(args['state'], tag)
+    
+    # set end timestamp, tweets after it are left for the next run
+    end_ts = end_date
+    
+    # payload rules for v2 api, starting after newest collected tweet if known
+    if since_id is not None:
+        print('[INFO] - Retrieving tweets newer than ' + str(since_id) + ' for tag ' + tag)
+        rule = gen_request_parameters(query = config['query'],
+                                      results_per_call = config['results_per_call'],
+                                      since_id = since_id,
+                                      end_time = end_ts.isoformat(),
+                                      **fields,
+                                      stringify = False)
+    else:
+        print('[INFO] - No previous run found for tag ' + tag + ', retrieving tweets from ' + str(start_date))
+        rule = gen_request_parameters(query = config['query'],
+                                      results_per_call = config['results_per_call'],
+                                      start_time = start_date.isoformat(),
+                                      end_time = end_ts.isoformat(),
+                                      **fields,
+                                      stringify = False)
+    
+    # number of reconnection tries
+    tries = 10
+    
+    # while loop to protect against 104 error
+    while True:
+        tries -= 1
+        
+        # attempt retrieving tweets
+        try:
+            # get all pages, max_tweets would leave a gap before the newest id stored
+            tweets = list(stream_tweets(session, search_creds['endpoint'], rule, None, limiter))
+            
+            # break free from while loop
+            break
+        except Exception as err:
+            if tries == 0:
+                raise err
+            else:
+                print('[INFO] - Got connection error, waiting ' + str(waittime) + ' seconds and trying again. ' + str(tries) + ' tries left.')
+                time.sleep(waittime)
+    
+    # count new tweets from response metadata
+    metas = [d for d in tweets if 'result_count' in d.keys()]
+    new_count = sum([d['result_count'] for d in metas])
+    
+    # check if there are new tweets
+    if new_count != 0:
+        
+        # parse results to dataframe
+        print('[INFO] - Parsing ' + str(new_count) + ' new tweets')
+        tweetdf = v2parser(tweets, config['results_per_call'], fields)
+        
+        # try to order columns semantically
+        tweetdf = order_columns(tweetdf)
+        
+        # get newest tweet id of this run from response metadata
+        newest_id = max([int(d['newest_id']) for d in metas if 'newest_id' in d.keys()])
+        
+        # set up file name from end date and previous newest id so files are never overwritten
+        file_prefix_w_date = config['filename_prefix'] + end_ts.isoformat() + '_since_' + str(since_id if since_id is not None else 0)
+        outpickle = file_prefix_w_date + '.pkl'
+        outtext = file_prefix_w_date + '.' + args['output']
+        outfeather = file_prefix_w_date + '.feather'
+        
+        # save to file
+        if args['output'] == 'pkl':
+            # save to pickle
+            tweetdf.to_pickle(outpickle)
+        elif args['output'] in TEXT_FORMATS:
+            # save to csv or json lines, compressed by extension
+            save_text(tweetdf, outtext)
+        elif args['output'] == 'feather':
+            # save to memory-mappable feather
+            save_feather(tweetdf, outfeather)
+        
+        # save long format entity tables
+        if args['entities']:
+            save_entities(entity_tables(tweetdf), file_prefix_w_date, args['output'])
+        
+        # update daily rollups with the saved file
+        if args['rollups'] is not None:
+            update_rollups(args['rollups'], [file_prefix_w_date + '.' + args['output']], [tweetdf])
+        
+        # store newest id only after output is saved
+        write_since_id(args['state'], tag, newest_id)
+        print('[INFO] - Newest tweet id for tag ' + tag + ' is now ' + str(newest_id))
+        
+    else:
+        print('[INFO] - No new tweets for tag ' + tag + '. Moving on...')
+
+# report connection reuse and close session
+n_requests, n_connections = session_stats(session)
+print('[INFO] - Sent ' + str(n_requests) + ' requests over ' + str(n_connections) + ' connections.')
+session.close()
 
 print('[INFO] - ... done!')
\ No newline at end of file